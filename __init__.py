@@ -1,8 +1 @@
 # Đảm bảo mỗi thư mục là một Python package
-touch config/__init__.py
-touch database/__init__.py
-touch core/__init__.py
-touch services/__init__.py
-touch api/__init__.py
-touch utils/__init__.py
-touch models/__init__.py
\ No newline at end of file
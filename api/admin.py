@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, HTTPException, Header
+from typing import Dict, Any, Optional
+
+from config.settings import ADMIN_API_TOKEN
+from config.logging_config import logger
+from core.data_reloader import data_reloader
+
+router = APIRouter()
+
+def _check_admin_token(token: Optional[str]) -> None:
+    if ADMIN_API_TOKEN and token != ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token không hợp lệ.")
+
+@router.post("/admin/reload")
+async def reload_data(x_admin_token: Optional[str] = Header(None)):
+    """Tải lại toàn bộ file dữ liệu và index session mà không cần khởi động lại server."""
+    _check_admin_token(x_admin_token)
+    try:
+        result = await data_reloader.reload(force=True)
+    except Exception as e:
+        logger.error(f"Lỗi khi tải lại dữ liệu: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Không thể tải lại dữ liệu.")
+    return {"status": "success", **result, "metrics": data_reloader.metrics}
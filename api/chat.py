@@ -1,36 +1,64 @@
 from __future__ import annotations
 
+import os
+import re
 import json
-import asyncio
-import datetime
-from typing import Dict, Any, List, Optional
+import time
+import weakref
+from html import unescape
+from typing import Dict, Any, List, Optional, Tuple, Callable
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 
-from openai import OpenAI
-from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat import ChatCompletionMessage
 
-from config.settings import openai_model, OPENWEATHERMAP_API_KEY, VIETNAMESE_NEWS_DOMAINS
+from config.settings import (
+    openai_model, OPENWEATHERMAP_API_KEY, VIETNAMESE_NEWS_DOMAINS, CHAT_INLINE_AUDIO, STREAM_AUDIO_WAIT_SECONDS,
+    TOOL_EARLY_DISPATCH,
+)
 from config.logging_config import logger
 from models.schemas import ChatRequest, ChatResponse, Message, MessageContent
 from core.session_manager import session_manager
+from core.datetime_handler import DateTimeHandler
+from core.context_window import context_window
+from core.stream_metrics import StreamTimer, stream_metrics
+from core.answer_cache import answer_cache
+from core.post_response import post_response_queue, speech_jobs
+from core.prompt_builder import system_prompt_builder
+from core.token_budget import token_counter, budget_manager
+from database.blob_store import blob_store
+from services.llm.client_pool import llm_clients
 from services.tools.tools_definitions import available_tools
-from services.tools.tool_executor import execute_tool_call
-from services.multimedia.audio_service import process_audio, text_to_speech_google
-from services.search.search_service import search_and_summarize, detect_search_intent
+from services.tools.tool_scheduler import tool_scheduler
+from services.tools.tool_call_stream import ToolCallAssembler
+from services.multimedia.audio_service import process_audio
+from services.search.search_service import search_and_summarize
+from services.intent.intent_router import intent_router
 from services.weather.weather_parser import WeatherQueryParser
 from services.weather.weather_advisor import WeatherAdvisor
 from services.weather.weather_service import WeatherService, format_weather_for_prompt
-from utils.helpers import generate_chat_summary, save_chat_history
+from utils.helpers import generate_chat_summary, save_chat_history, persist_chat_history, SUMMARY_ERROR
 
 router = APIRouter()
 
+# Định nghĩa tools cũng được tính vào prompt của lượt đầu
+TOOLS_PROMPT_TOKENS = token_counter.count(json.dumps(available_tools, ensure_ascii=False))
+
+
 @router.post("/chat")
 async def chat_endpoint(chat_request: ChatRequest):
     """
     Endpoint chính cho trò chuyện (sử dụng Tool Calling).
     Includes event_data in the response.
     """
+    # Request sửa trực tiếp dict session qua nhiều lần await: giữ nó trong cache
+    # để LRU/sweeper không bỏ nó giữa chừng (thay đổi sẽ rơi vào bản mồ côi)
+    with session_manager.pinned(chat_request.session_id):
+        return await _chat_turn(chat_request)
+
+
+async def _chat_turn(chat_request: ChatRequest) -> ChatResponse:
+    """Xử lý một lượt /chat; session đã được chat_endpoint giữ trong cache."""
     openai_api_key = chat_request.openai_api_key or os.getenv("OPENAI_API_KEY", "")
     tavily_api_key = chat_request.tavily_api_key or os.getenv("TAVILY_API_KEY", "")
     if not openai_api_key or "sk-" not in openai_api_key:
@@ -44,6 +72,7 @@ async def chat_endpoint(chat_request: ChatRequest):
     if chat_request.messages is not None and not session.get("messages"):
          logger.info(f"Loading message history from client for session {chat_request.session_id}")
          session["messages"] = [msg.dict(exclude_none=True) for msg in chat_request.messages]
+         blob_store.externalize_messages(session["messages"])
 
     message_content_model = chat_request.message
     message_dict = message_content_model.dict(exclude_none=True)
@@ -51,7 +80,7 @@ async def chat_endpoint(chat_request: ChatRequest):
     processed_content_list = []
 
     if chat_request.content_type == "audio" and message_dict.get("type") == "audio" and message_dict.get("audio_data"):
-        processed_audio = process_audio(message_dict, openai_api_key)
+        processed_audio = await process_audio(message_dict, openai_api_key)
         if processed_audio and processed_audio.get("text"):
              processed_content_list.append({"type": "text", "text": processed_audio["text"]})
              logger.info(f"Đã xử lý audio thành text: {processed_audio['text'][:50]}...")
@@ -62,7 +91,10 @@ async def chat_endpoint(chat_request: ChatRequest):
     elif chat_request.content_type == "image" and message_dict.get("type") == "image_url":
         logger.info(f"Đã nhận hình ảnh: {message_dict.get('image_url', {}).get('url', '')[:60]}...")
         if message_dict.get("image_url"):
-            processed_content_list.append({"type": "image_url", "image_url": message_dict["image_url"]})
+            # Lưu ảnh vào blob store, session chỉ giữ tham chiếu ngắn
+            image_url = dict(message_dict["image_url"])
+            image_url["url"] = blob_store.put_data_url(image_url.get("url", ""))
+            processed_content_list.append({"type": "image_url", "image_url": image_url})
         else:
             logger.error("Content type là image nhưng thiếu image_url.")
             processed_content_list.append({"type": "text", "text": "[Lỗi xử lý ảnh: thiếu URL]"})
@@ -106,107 +138,122 @@ async def chat_endpoint(chat_request: ChatRequest):
     final_event_data_to_return: Optional[Dict[str, Any]] = None
 
     try:
-        client = OpenAI(api_key=openai_api_key)
+        client = llm_clients.get(openai_api_key)
         system_prompt_content = build_system_prompt(current_member_id)
 
-        openai_messages = [{"role": "system", "content": system_prompt_content}]
-        for msg in session["messages"]:
-             message_for_api = {
-                 "role": msg["role"],
-                 **({ "tool_calls": msg["tool_calls"] } if msg.get("tool_calls") else {}),
-                 **({ "tool_call_id": msg.get("tool_call_id") } if msg.get("tool_call_id") else {}),
-             }
-             msg_content = msg.get("content")
-             if isinstance(msg_content, list):
-                  message_for_api["content"] = msg_content
-             elif isinstance(msg_content, str):
-                  message_for_api["content"] = msg_content
-             elif msg.get("role") == "tool":
-                  message_for_api["content"] = str(msg_content) if msg_content is not None else ""
-             else:
-                  logger.warning(f"Định dạng content không mong đợi cho role {msg['role']}: {type(msg_content)}. Sử dụng chuỗi rỗng.")
-                  message_for_api["content"] = ""
-             openai_messages.append(message_for_api)
+        openai_messages, context_stats = await context_window.build_messages(
+            session, system_prompt_content, openai_api_key
+        )
 
 
-        # --- Check Search Need ---
-        search_result_for_prompt = await check_search_need(
-            openai_messages, 
-            openai_api_key, 
-            tavily_api_key,
-            lat=chat_request.latitude,
-            lon=chat_request.longitude
-        )
-        if search_result_for_prompt:
-             # Replace or append to system prompt
-             openai_messages[0] = {"role": "system", "content": system_prompt_content + search_result_for_prompt}
+        # --- Answer Cache (câu hỏi tra cứu lặp lại trong TTL) ---
+        last_user_text, intent = "", None
+        try:
+             last_user_text, intent = await classify_turn(openai_messages, openai_api_key, tavily_api_key)
+        except Exception as intent_err:
+             logger.error(f"Error during intent classification: {intent_err}", exc_info=True)
+        cache_key = answer_cache_key(openai_messages, last_user_text, intent, tavily_api_key,
+                                     chat_request.latitude, chat_request.longitude)
+        cached_answer = answer_cache.get(session, cache_key)
+
+        if cached_answer is not None:
+            logger.info("--- Answer cache hit: bỏ qua tìm kiếm/thời tiết và các lần gọi OpenAI ---")
+            final_response_content = cached_answer
+            session["messages"].append({"role": "assistant", "content": cached_answer})
+        else:
+            # --- Check Search Need ---
+            search_result_for_prompt = await check_search_need(
+                openai_messages, 
+                openai_api_key, 
+                tavily_api_key,
+                lat=chat_request.latitude,
+                lon=chat_request.longitude,
+                last_user_text=last_user_text,
+                intent=intent
+            )
+            if search_result_for_prompt:
+                 # Ngữ cảnh truy xuất chỉ dùng phần ngân sách còn lại sau system prompt và lịch sử
+                 search_result_for_prompt = budget_manager.fit_retrieved(
+                     search_result_for_prompt, token_counter.count_messages(openai_messages))
+                 # Replace or append to system prompt
+                 openai_messages[0] = {"role": "system", "content": system_prompt_content + search_result_for_prompt}
 
 
-        logger.info("--- Calling OpenAI API (Potential First Pass) ---")
-        logger.debug(f"Messages sent (last 3): {json.dumps(openai_messages[-3:], indent=2, ensure_ascii=False)}")
+            logger.info("--- Calling OpenAI API (Potential First Pass) ---")
+            logger.debug(f"Messages sent (last 3): {json.dumps(openai_messages[-3:], indent=2, ensure_ascii=False)}")
 
-        first_response = client.chat.completions.create(
-            model=openai_model,
-            messages=openai_messages,
-            tools=available_tools,
-            tool_choice="auto",
-            temperature=0.7,
-            max_tokens=2048
-        )
+            estimated_prompt = token_counter.count_messages(openai_messages) + TOOLS_PROMPT_TOKENS
+            max_tokens = budget_manager.max_tokens("chat", estimated_prompt)
+            first_response = await client.chat.completions.create(
+                model=openai_model,
+                messages=openai_messages,
+                tools=available_tools,
+                tool_choice="auto",
+                temperature=0.7,
+                max_tokens=max_tokens
+            )
+            budget_manager.record("chat", estimated_prompt, first_response.usage, max_tokens)
 
-        response_message: ChatCompletionMessage = first_response.choices[0].message
-        session["messages"].append(response_message.dict(exclude_none=True))
+            response_message: ChatCompletionMessage = first_response.choices[0].message
+            session["messages"].append(response_message.dict(exclude_none=True))
 
-        # --- Handle Tool Calls ---
-        tool_calls = response_message.tool_calls
-        if tool_calls:
-            logger.info(f"--- Tool Calls Detected: {len(tool_calls)} ---")
-            messages_for_second_call = openai_messages + [response_message.dict(exclude_none=True)]
+            # --- Handle Tool Calls ---
+            tool_calls = response_message.tool_calls
+            if tool_calls:
+                logger.info(f"--- Tool Calls Detected: {len(tool_calls)} ---")
+                messages_for_second_call = openai_messages + [response_message.dict(exclude_none=True)]
 
-            for tool_call in tool_calls:
-                event_data_from_tool, tool_result_content = execute_tool_call(tool_call, current_member_id)
+                for tool_run in await tool_scheduler.run(tool_calls, current_member_id):
+                    event_data_from_tool = tool_run.event_data
 
-                if event_data_from_tool and final_event_data_to_return is None:
-                    if event_data_from_tool.get("action") in ["add", "update", "delete"]:
-                        final_event_data_to_return = event_data_from_tool
-                        logger.info(f"Captured event_data for response: {final_event_data_to_return}")
+                    if event_data_from_tool and final_event_data_to_return is None:
+                        if event_data_from_tool.get("action") in ["add", "update", "delete"]:
+                            final_event_data_to_return = event_data_from_tool
+                            logger.info(f"Captured event_data for response: {final_event_data_to_return}")
 
-                tool_result_message = {
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "name": tool_call.function.name,
-                    "content": tool_result_content,
-                }
-                messages_for_second_call.append(tool_result_message)
-                session["messages"].append(tool_result_message)
+                    tool_result_message = tool_run.tool_message()
+                    messages_for_second_call.append(tool_result_message)
+                    session["messages"].append(tool_result_message)
 
-            logger.info("--- Calling OpenAI API (Second Pass - Summarizing Tool Results) ---")
-            logger.debug(f"Messages for second call (last 4): {json.dumps(messages_for_second_call[-4:], indent=2, ensure_ascii=False)}")
+                logger.info("--- Calling OpenAI API (Second Pass - Summarizing Tool Results) ---")
+                logger.debug(f"Messages for second call (last 4): {json.dumps(messages_for_second_call[-4:], indent=2, ensure_ascii=False)}")
 
-            second_response = client.chat.completions.create(
-                model=openai_model,
-                messages=messages_for_second_call,
-                temperature=0.7,
-                max_tokens=1024
-            )
-            final_assistant_message = second_response.choices[0].message
-            final_response_content = final_assistant_message.content
+                estimated_prompt = token_counter.count_messages(messages_for_second_call)
+                max_tokens = budget_manager.max_tokens("chat_tool_summary", estimated_prompt)
+                second_response = await client.chat.completions.create(
+                    model=openai_model,
+                    messages=messages_for_second_call,
+                    temperature=0.7,
+                    max_tokens=max_tokens
+                )
+                budget_manager.record("chat_tool_summary", estimated_prompt, second_response.usage, max_tokens)
+                final_assistant_message = second_response.choices[0].message
+                final_response_content = final_assistant_message.content
 
-            session["messages"].append(final_assistant_message.dict(exclude_none=True))
-            logger.info("Tool execution and summary completed.")
+                session["messages"].append(final_assistant_message.dict(exclude_none=True))
+                logger.info("Tool execution and summary completed.")
 
-        else:
-            logger.info("--- No Tool Calls Detected ---")
-            final_response_content = response_message.content
+            else:
+                logger.info("--- No Tool Calls Detected ---")
+                final_response_content = response_message.content
+
+            if not tool_calls and _is_grounded(search_result_for_prompt):
+                answer_cache.put(session, cache_key, final_response_content)
 
         # --- Final Processing & Response ---
         final_html_content = final_response_content if final_response_content else "Tôi đã thực hiện xong yêu cầu của bạn."
 
-        audio_response_b64 = text_to_speech_google(final_html_content)
+        # --- Post-Response: TTS, tóm tắt và lịch sử chạy nền ---
+        audio_id = speech_jobs.start(final_html_content)
+        audio_response_b64 = None
+        if CHAT_INLINE_AUDIO:
+             _, audio_response_b64 = await speech_jobs.wait(audio_id)
 
         if current_member_id:
-             summary = await generate_chat_summary(session["messages"], openai_api_key)
-             save_chat_history(current_member_id, session["messages"], summary, chat_request.session_id)
+             await post_response_queue.submit(
+                 "chat_history", _history_job(current_member_id, session["messages"], openai_api_key, chat_request.session_id),
+                 key=chat_request.session_id
+             )
 
         session_manager.update_session(chat_request.session_id, {"messages": session["messages"]})
 
@@ -244,9 +291,12 @@ async def chat_endpoint(chat_request: ChatRequest):
             session_id=chat_request.session_id,
             messages=[last_assistant_msg_obj],
             audio_response=audio_response_b64,
+            audio_id=audio_id,
             response_format="html",
             content_type=chat_request.content_type,
-            event_data=final_event_data_to_return
+            event_data=final_event_data_to_return,
+            context_stats=context_stats,
+            answer_cached=cached_answer is not None
         )
 
     except Exception as e:
@@ -260,7 +310,22 @@ async def chat_stream_endpoint(chat_request: ChatRequest):
     """
     Endpoint streaming cho trò chuyện (sử dụng Tool Calling).
     Includes event_data in the final completion message.
+    Chunk được chuyển tiếp ngay khi nhận từ upstream; generator chỉ đọc chunk kế tiếp
+    khi client đã nhận chunk trước (backpressure). TTFB và khoảng cách giữa các chunk
+    được đo cho từng request (trường stream_metrics trong frame cuối).
     """
+    # Giữ session trong cache tới khi generator kết thúc (xem chat_endpoint)
+    release_session = session_manager.pin(chat_request.session_id)
+    try:
+        return await _chat_stream_turn(chat_request, release_session)
+    except BaseException:
+        release_session()
+        raise
+
+
+async def _chat_stream_turn(chat_request: ChatRequest, release_session: Callable[[], None]) -> StreamingResponse:
+    """Chuẩn bị lượt stream; release_session được gọi khi generator kết thúc hoặc bị thu hồi."""
+    request_started = time.perf_counter()
     openai_api_key = chat_request.openai_api_key or os.getenv("OPENAI_API_KEY", "")
     tavily_api_key = chat_request.tavily_api_key or os.getenv("TAVILY_API_KEY", "")
     if not openai_api_key or "sk-" not in openai_api_key:
@@ -274,6 +339,7 @@ async def chat_stream_endpoint(chat_request: ChatRequest):
     if chat_request.messages is not None and not session.get("messages"):
          logger.info(f"Stream: Loading message history from client for session {chat_request.session_id}")
          session["messages"] = [msg.dict(exclude_none=True) for msg in chat_request.messages]
+         blob_store.externalize_messages(session["messages"])
 
     message_content_model = chat_request.message
     message_dict = message_content_model.dict(exclude_none=True)
@@ -282,7 +348,7 @@ async def chat_stream_endpoint(chat_request: ChatRequest):
 
     # --- Process incoming message based on content_type ---
     if chat_request.content_type == "audio" and message_dict.get("type") == "audio" and message_dict.get("audio_data"):
-        processed_audio = process_audio(message_dict, openai_api_key)
+        processed_audio = await process_audio(message_dict, openai_api_key)
         if processed_audio and processed_audio.get("text"):
              processed_content_list.append({"type": "text", "text": processed_audio["text"]})
              logger.info(f"Stream: Đã xử lý audio thành text: {processed_audio['text'][:50]}...")
@@ -293,7 +359,10 @@ async def chat_stream_endpoint(chat_request: ChatRequest):
     elif chat_request.content_type == "image" and message_dict.get("type") == "image_url":
         logger.info(f"Stream: Đã nhận hình ảnh: {message_dict.get('image_url', {}).get('url', '')[:60]}...")
         if message_dict.get("image_url"):
-            processed_content_list.append({"type": "image_url", "image_url": message_dict["image_url"]})
+            # Lưu ảnh vào blob store, session chỉ giữ tham chiếu ngắn
+            image_url = dict(message_dict["image_url"])
+            image_url["url"] = blob_store.put_data_url(image_url.get("url", ""))
+            processed_content_list.append({"type": "image_url", "image_url": image_url})
         else:
             logger.error("Stream: Content type là image nhưng thiếu image_url.")
             processed_content_list.append({"type": "text", "text": "[Lỗi xử lý ảnh: thiếu URL]"})
@@ -334,185 +403,228 @@ async def chat_stream_endpoint(chat_request: ChatRequest):
     # --- Streaming Generator ---
     async def response_stream_generator():
         final_event_data_to_return: Optional[Dict[str, Any]] = None
-        client = OpenAI(api_key=openai_api_key)
+        timer = StreamTimer(request_started)
+        stream = summary_stream = None
+        tool_turn = None
+        stream_failed = False
+        metrics_recorded = False
+        client = llm_clients.get(openai_api_key)
         system_prompt_content = build_system_prompt(current_member_id)
 
-        openai_messages = [{"role": "system", "content": system_prompt_content}]
-        for msg in session["messages"]:
-             message_for_api = {
-                 "role": msg["role"],
-                 **({ "tool_calls": msg["tool_calls"] } if msg.get("tool_calls") else {}),
-                 **({ "tool_call_id": msg.get("tool_call_id") } if msg.get("tool_call_id") else {}),
-             }
-             msg_content = msg.get("content")
-             if isinstance(msg_content, list): message_for_api["content"] = msg_content
-             elif isinstance(msg_content, str): message_for_api["content"] = msg_content
-             elif msg.get("role") == "tool": message_for_api["content"] = str(msg_content) if msg_content is not None else ""
-             else: message_for_api["content"] = ""
-             openai_messages.append(message_for_api)
+        openai_messages, context_stats = await context_window.build_messages(
+            session, system_prompt_content, openai_api_key
+        )
 
-        # --- Check Search Need ---
+        # --- Answer Cache (câu hỏi tra cứu lặp lại trong TTL) ---
+        last_user_text, intent = "", None
         try:
-             search_result_for_prompt = await check_search_need(
-                 openai_messages, 
-                 openai_api_key, 
-                 tavily_api_key,
-                 lat=chat_request.latitude,
-                 lon=chat_request.longitude
-             )
-             if search_result_for_prompt:
-                  openai_messages[0] = {"role": "system", "content": system_prompt_content + search_result_for_prompt}
-        except Exception as search_err:
-             logger.error(f"Error during search need check: {search_err}", exc_info=True)
+             last_user_text, intent = await classify_turn(openai_messages, openai_api_key, tavily_api_key)
+        except Exception as intent_err:
+             logger.error(f"Error during intent classification: {intent_err}", exc_info=True)
+        cache_key = answer_cache_key(openai_messages, last_user_text, intent, tavily_api_key,
+                                     chat_request.latitude, chat_request.longitude)
+        cached_answer = answer_cache.get(session, cache_key)
+
+        # --- Check Search Need ---
+        search_result_for_prompt = ""
+        if cached_answer is None:
+            try:
+                 search_result_for_prompt = await check_search_need(
+                     openai_messages, 
+                     openai_api_key, 
+                     tavily_api_key,
+                     lat=chat_request.latitude,
+                     lon=chat_request.longitude,
+                     last_user_text=last_user_text,
+                     intent=intent
+                 )
+                 if search_result_for_prompt:
+                      search_result_for_prompt = budget_manager.fit_retrieved(
+                          search_result_for_prompt, token_counter.count_messages(openai_messages))
+                      openai_messages[0] = {"role": "system", "content": system_prompt_content + search_result_for_prompt}
+            except Exception as search_err:
+                 logger.error(f"Error during search need check: {search_err}", exc_info=True)
 
         accumulated_tool_calls = []
         accumulated_assistant_content = ""
         assistant_message_dict_for_session = {"role": "assistant", "content": None, "tool_calls": None}
-        tool_call_chunks = {}
+        tool_call_assembler = ToolCallAssembler()
 
         # --- Main Streaming Logic ---
         try:
-            logger.info("--- Calling OpenAI API (Streaming - Potential First Pass) ---")
-            stream = client.chat.completions.create(
-                model=openai_model,
-                messages=openai_messages,
-                tools=available_tools,
-                tool_choice="auto",
-                temperature=0.7,
-                max_tokens=2048,
-                stream=True
-            )
-
-            async for chunk in stream:
-                delta = chunk.choices[0].delta if chunk.choices else None
-                if not delta: continue
-
-                finish_reason = chunk.choices[0].finish_reason
-
-                if delta.content:
-                    accumulated_assistant_content += delta.content
-                    yield json.dumps({"chunk": delta.content, "type": "html", "content_type": chat_request.content_type}) + "\n"
-                    await asyncio.sleep(0)
-
-                if delta.tool_calls:
-                    for tc_chunk in delta.tool_calls:
-                        index = tc_chunk.index
-                        if index not in tool_call_chunks:
-                            tool_call_chunks[index] = {"function": {"arguments": ""}}
-                        if tc_chunk.id: tool_call_chunks[index]["id"] = tc_chunk.id
-                        if tc_chunk.type: tool_call_chunks[index]["type"] = tc_chunk.type
-                        if tc_chunk.function:
-                             if tc_chunk.function.name: tool_call_chunks[index]["function"]["name"] = tc_chunk.function.name
-                             if tc_chunk.function.arguments: tool_call_chunks[index]["function"]["arguments"] += tc_chunk.function.arguments
-
-                if finish_reason:
-                    if finish_reason == "tool_calls":
-                        logger.info("--- Stream detected tool_calls ---")
-                        for index in sorted(tool_call_chunks.keys()):
-                             chunk_data = tool_call_chunks[index]
-                             if chunk_data.get("id") and chunk_data.get("function", {}).get("name"):
-                                  try:
-                                       reconstructed_tc = ChatCompletionMessageToolCall(
-                                           id=chunk_data["id"],
-                                           type='function',
-                                           function=chunk_data["function"]
-                                       )
-                                       accumulated_tool_calls.append(reconstructed_tc)
-                                  except Exception as recon_err:
-                                       logger.error(f"Error reconstructing tool call at index {index}: {recon_err} - Data: {chunk_data}")
-                             else:
-                                  logger.error(f"Incomplete data for tool call reconstruction at index {index}: {chunk_data}")
-
-                        if accumulated_tool_calls:
-                             assistant_message_dict_for_session["tool_calls"] = [tc.dict() for tc in accumulated_tool_calls]
-                             assistant_message_dict_for_session["content"] = accumulated_assistant_content or None
-                             logger.info(f"Reconstructed {len(accumulated_tool_calls)} tool calls.")
+            if cached_answer is not None:
+                logger.info("--- Answer cache hit: bỏ qua tìm kiếm/thời tiết và các lần gọi OpenAI ---")
+                timer.token()
+                yield json.dumps({"chunk": cached_answer, "type": "html", "content_type": chat_request.content_type}) + "\n"
+                session["messages"].append({"role": "assistant", "content": cached_answer})
+                final_response_for_tts = cached_answer
+            else:
+                logger.info("--- Calling OpenAI API (Streaming - Potential First Pass) ---")
+                estimated_prompt = token_counter.count_messages(openai_messages) + TOOLS_PROMPT_TOKENS
+                max_tokens = budget_manager.max_tokens("chat", estimated_prompt)
+                stream = await client.chat.completions.create(
+                    model=openai_model,
+                    messages=openai_messages,
+                    tools=available_tools,
+                    tool_choice="auto",
+                    temperature=0.7,
+                    max_tokens=max_tokens,
+                    stream=True
+                )
+                # Vòng lặp dừng ở finish_reason, trước chunk usage: chỉ ghi số ước lượng
+                budget_manager.record("chat", estimated_prompt, None, max_tokens)
+
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta if chunk.choices else None
+                    if not delta: continue
+
+                    finish_reason = chunk.choices[0].finish_reason
+
+                    if delta.content:
+                        accumulated_assistant_content += delta.content
+                        timer.token()
+                        yield json.dumps({"chunk": delta.content, "type": "html", "content_type": chat_request.content_type}) + "\n"
+
+                    if delta.tool_calls:
+                        for tc_chunk in delta.tool_calls:
+                            tool_call_assembler.feed(tc_chunk)
+                        # Chạy ngay các tool đã đủ arguments trong lúc model còn stream các call sau
+                        if TOOL_EARLY_DISPATCH:
+                            for ready_tc in tool_call_assembler.ready():
+                                tool_turn = tool_turn or tool_scheduler.begin(current_member_id)
+                                tool_turn.submit(ready_tc, early=True)
+                                accumulated_tool_calls.append(ready_tc)
+
+                    if tool_turn is not None:
+                        for tool_event, tool_run in tool_turn.ready_events():
+                            timer.frame()
+                            yield _tool_frame(tool_event, tool_run)
+
+                    if finish_reason:
+                        if finish_reason == "tool_calls":
+                            logger.info("--- Stream detected tool_calls ---")
+                            for remaining_tc in tool_call_assembler.remaining():
+                                tool_turn = tool_turn or tool_scheduler.begin(current_member_id)
+                                tool_turn.submit(remaining_tc)
+                                accumulated_tool_calls.append(remaining_tc)
+
+                            if accumulated_tool_calls:
+                                 logger.info(f"Reconstructed {len(accumulated_tool_calls)} tool calls.")
+                            else:
+                                 logger.error("Tool calls detected by finish_reason, but failed reconstruction.")
+                                 assistant_message_dict_for_session["content"] = accumulated_assistant_content
+
+                        elif finish_reason == "stop":
+                            logger.info("--- Stream finished without tool_calls ---")
+                            assistant_message_dict_for_session["content"] = accumulated_assistant_content
                         else:
-                             logger.error("Tool calls detected by finish_reason, but failed reconstruction.")
+                             logger.warning(f"Stream finished with reason: {finish_reason}")
                              assistant_message_dict_for_session["content"] = accumulated_assistant_content
+                        break
+
+                if accumulated_tool_calls:
+                    # Gồm cả các call đã chạy sớm, kể cả khi stream không kết thúc bằng finish_reason "tool_calls"
+                    assistant_message_dict_for_session["tool_calls"] = [tc.dict() for tc in accumulated_tool_calls]
+                    assistant_message_dict_for_session["content"] = accumulated_assistant_content or None
+
+                # --- Execute Tools and Second Stream (if needed) ---
+                if accumulated_tool_calls:
+                    logger.info(f"--- Waiting for {len(accumulated_tool_calls)} Tool Calls (started while streaming) ---")
+                    # Add the first assistant message (which contained tool calls) to history
+                    # Check if it was already added, avoid duplicates
+                    if not session["messages"] or session["messages"][-1].get("tool_calls") != assistant_message_dict_for_session.get("tool_calls"):
+                         session["messages"].append(assistant_message_dict_for_session)
+
+                    messages_for_second_call = openai_messages + [assistant_message_dict_for_session]
+
+                    # Frame start/end đến theo thứ tự thực tế (call trùng thực thể phải chờ), kèm tool_call_id và thời gian
+                    async for tool_event, tool_run in tool_turn.finish():
+                        if tool_event != "commit":
+                            timer.frame()
+                            yield _tool_frame(tool_event, tool_run)
+                            continue
+
+                        event_data_from_tool = tool_run.event_data
+                        if event_data_from_tool and final_event_data_to_return is None:
+                             if event_data_from_tool.get("action") in ["add", "update", "delete"]:
+                                  final_event_data_to_return = event_data_from_tool
+                                  logger.info(f"Captured event_data for stream response: {final_event_data_to_return}")
+
+                        tool_result_message = tool_run.tool_message()
+                        messages_for_second_call.append(tool_result_message)
+                        session["messages"].append(tool_result_message)
+
+                    logger.info("--- Calling OpenAI API (Streaming - Second Pass - Summary) ---")
+                    logger.debug(f"Messages for second stream call (last 4): {json.dumps(messages_for_second_call[-4:], indent=2, ensure_ascii=False)}")
+                    estimated_prompt = token_counter.count_messages(messages_for_second_call)
+                    max_tokens = budget_manager.max_tokens("chat_tool_summary", estimated_prompt)
+                    summary_stream = await client.chat.completions.create(
+                        model=openai_model, messages=messages_for_second_call,
+                        temperature=0.7, max_tokens=max_tokens, stream=True,
+                        stream_options={"include_usage": True}
+                    )
 
-                    elif finish_reason == "stop":
-                        logger.info("--- Stream finished without tool_calls ---")
-                        assistant_message_dict_for_session["content"] = accumulated_assistant_content
-                    else:
-                         logger.warning(f"Stream finished with reason: {finish_reason}")
-                         assistant_message_dict_for_session["content"] = accumulated_assistant_content
-                    break
-
-            # --- Execute Tools and Second Stream (if needed) ---
-            if accumulated_tool_calls:
-                logger.info(f"--- Executing {len(accumulated_tool_calls)} Tool Calls (Non-Streamed) ---")
-                # Add the first assistant message (which contained tool calls) to history
-                # Check if it was already added, avoid duplicates
-                if not session["messages"] or session["messages"][-1].get("tool_calls") != assistant_message_dict_for_session.get("tool_calls"):
-                     session["messages"].append(assistant_message_dict_for_session)
-
-                messages_for_second_call = openai_messages + [assistant_message_dict_for_session]
-
-                for tool_call in accumulated_tool_calls:
-                    yield json.dumps({"tool_start": tool_call.function.name}) + "\n"; await asyncio.sleep(0.05)
-                    event_data_from_tool, tool_result_content = execute_tool_call(tool_call, current_member_id)
-
-                    if event_data_from_tool and final_event_data_to_return is None:
-                         if event_data_from_tool.get("action") in ["add", "update", "delete"]:
-                              final_event_data_to_return = event_data_from_tool
-                              logger.info(f"Captured event_data for stream response: {final_event_data_to_return}")
+                    final_summary_content = ""
+                    summary_usage = None
+                    async for summary_chunk in summary_stream:
+                         # Chunk cuối (không có choices) mang usage của cả lượt
+                         if summary_chunk.usage:
+                              summary_usage = summary_chunk.usage
+                         delta_summary = summary_chunk.choices[0].delta.content if summary_chunk.choices else None
+                         if delta_summary:
+                              final_summary_content += delta_summary
+                              timer.token()
+                              yield json.dumps({"chunk": delta_summary, "type": "html", "content_type": chat_request.content_type}) + "\n"
 
-                    yield json.dumps({"tool_end": tool_call.function.name, "result_preview": tool_result_content[:50]+"..."}) + "\n"; await asyncio.sleep(0.05)
+                    budget_manager.record("chat_tool_summary", estimated_prompt, summary_usage, max_tokens)
 
-                    tool_result_message = {
-                        "tool_call_id": tool_call.id, "role": "tool",
-                        "name": tool_call.function.name, "content": tool_result_content,
-                    }
-                    messages_for_second_call.append(tool_result_message)
-                    session["messages"].append(tool_result_message)
-
-                logger.info("--- Calling OpenAI API (Streaming - Second Pass - Summary) ---")
-                logger.debug(f"Messages for second stream call (last 4): {json.dumps(messages_for_second_call[-4:], indent=2, ensure_ascii=False)}")
-                summary_stream = client.chat.completions.create(
-                    model=openai_model, messages=messages_for_second_call,
-                    temperature=0.7, max_tokens=1024, stream=True
-                )
+                    # Add final summary message to history
+                    session["messages"].append({"role": "assistant", "content": final_summary_content})
+                    final_response_for_tts = final_summary_content if final_summary_content else "Đã xử lý xong."
 
-                final_summary_content = ""
-                async for summary_chunk in summary_stream:
-                     delta_summary = summary_chunk.choices[0].delta.content if summary_chunk.choices else None
-                     if delta_summary:
-                          final_summary_content += delta_summary
-                          yield json.dumps({"chunk": delta_summary, "type": "html", "content_type": chat_request.content_type}) + "\n"
-                          await asyncio.sleep(0)
-
-                # Add final summary message to history
-                session["messages"].append({"role": "assistant", "content": final_summary_content})
-                final_response_for_tts = final_summary_content if final_summary_content else "Đã xử lý xong."
+                else:
+                    # If no tool calls, the first assistant message is the final one
+                    # Check if it was already added, avoid duplicates
+                    if not session["messages"] or session["messages"][-1].get("content") != assistant_message_dict_for_session.get("content"):
+                         session["messages"].append(assistant_message_dict_for_session)
+                    final_response_for_tts = accumulated_assistant_content if accumulated_assistant_content else "Vâng."
 
-            else:
-                # If no tool calls, the first assistant message is the final one
-                # Check if it was already added, avoid duplicates
-                if not session["messages"] or session["messages"][-1].get("content") != assistant_message_dict_for_session.get("content"):
-                     session["messages"].append(assistant_message_dict_for_session)
-                final_response_for_tts = accumulated_assistant_content if accumulated_assistant_content else "Vâng."
+                if not accumulated_tool_calls and _is_grounded(search_result_for_prompt):
+                    answer_cache.put(session, cache_key, accumulated_assistant_content)
 
-            # --- Post-Streaming Processing ---
-            logger.info("Generating final audio response...")
-            audio_response_b64 = text_to_speech_google(final_response_for_tts)
+            # --- Post-Streaming Processing (TTS, tóm tắt và lịch sử chạy nền) ---
+            audio_id = speech_jobs.start(final_response_for_tts)
 
             if current_member_id:
-                 summary = await generate_chat_summary(session["messages"], openai_api_key)
-                 save_chat_history(current_member_id, session["messages"], summary, chat_request.session_id)
+                 await post_response_queue.submit(
+                     "chat_history", _history_job(current_member_id, session["messages"], openai_api_key, chat_request.session_id),
+                     key=chat_request.session_id
+                 )
 
             session_manager.update_session(chat_request.session_id, {"messages": session["messages"]})
 
             complete_response = {
                 "complete": True,
-                "audio_response": audio_response_b64,
+                "audio_response": None,
+                "audio_id": audio_id,
                 "content_type": chat_request.content_type,
-                "event_data": final_event_data_to_return
+                "event_data": final_event_data_to_return,
+                "context_stats": context_stats,
+                "answer_cached": cached_answer is not None,
+                "stream_metrics": timer.summary()
             }
             yield json.dumps(complete_response) + "\n"
+            stream_metrics.record(timer.summary())
+            metrics_recorded = True
+
+            # Frame audio cuối: client đã có toàn bộ text, audio đến sau khi TTS xong
+            audio_status, audio_response_b64 = await speech_jobs.wait(audio_id, STREAM_AUDIO_WAIT_SECONDS)
+            yield json.dumps({"audio": True, "audio_id": audio_id, "status": audio_status,
+                              "audio_response": audio_response_b64, "content_type": chat_request.content_type}) + "\n"
             logger.info("--- Streaming finished successfully ---")
 
         except Exception as e:
+            stream_failed = True
             logger.error(f"Lỗi nghiêm trọng trong quá trình stream: {str(e)}", exc_info=True)
             error_msg = f"Xin lỗi, đã có lỗi xảy ra trong quá trình xử lý: {str(e)}"
             try:
@@ -520,48 +632,205 @@ async def chat_stream_endpoint(chat_request: ChatRequest):
             except Exception as yield_err:
                  logger.error(f"Lỗi khi gửi thông báo lỗi stream cuối cùng: {yield_err}")
         finally:
+            # Tool đã chạy sớm nhưng stream lỗi/bị ngắt trước khi chờ kết quả: vẫn ghi dữ liệu của chúng
+            if tool_turn is not None:
+                await tool_turn.close()
+            # Đóng stream upstream (kể cả khi client ngắt kết nối giữa chừng) để trả kết nối về pool
+            for upstream in (stream, summary_stream):
+                if upstream is not None:
+                    try:
+                        await upstream.close()
+                    except Exception as close_err:
+                        logger.debug(f"Lỗi khi đóng stream upstream: {close_err}")
+            if not metrics_recorded:
+                stream_metrics.record(timer.summary(), failed=stream_failed)
             logger.info("Đảm bảo lưu session sau khi stream kết thúc hoặc gặp lỗi.")
             session_manager.update_session(chat_request.session_id, {"messages": session.get("messages", [])})
+            release_session()
+
+    generator = response_stream_generator()
+    # Client ngắt trước khi generator chạy thì finally không chạy: nhả session khi generator bị thu hồi
+    weakref.finalize(generator, release_session)
 
     # Return the StreamingResponse object
     return StreamingResponse(
-        response_stream_generator(),
+        generator,
         media_type="application/x-ndjson"
     )
 
-async def check_search_need(messages: List[Dict], openai_api_key: str, tavily_api_key: str, lat: Optional[float] = None, lon: Optional[float] = None) -> str:
-    """Kiểm tra nhu cầu tìm kiếm từ tin nhắn cuối của người dùng."""
-    if not tavily_api_key and not OPENWEATHERMAP_API_KEY: 
-        return ""  # Need Tavily for web search or OpenWeatherMap for weather
 
+@router.get("/chat/context_metrics")
+async def get_context_metrics():
+    """Tổng số token của prompt đầy đủ, thực gửi và tiết kiệm được nhờ context window."""
+    return context_window.metrics
+
+
+@router.get("/chat/stream_metrics")
+async def get_stream_metrics():
+    """Phân vị TTFB, thời gian tới token đầu tiên và khoảng cách giữa các chunk của /chat/stream."""
+    return stream_metrics.get_metrics()
+
+
+@router.get("/chat/llm_metrics")
+async def get_llm_metrics():
+    """Số LLM client (theo API key) đang giữ trong pool và số lần tạo mới/dùng lại/đóng."""
+    return llm_clients.get_metrics()
+
+
+@router.get("/chat/answer_cache_metrics")
+async def get_answer_cache_metrics():
+    """Số lần dùng lại câu trả lời đã cache (trong session / chung cả gia đình) và TTL theo nguồn."""
+    return answer_cache.get_metrics()
+
+
+@router.get("/chat/intent_metrics")
+async def get_intent_metrics():
+    """Số lần phân loại ý định, số lần gọi LLM và độ trễ trước completion chính của intent router."""
+    return intent_router.get_metrics()
+
+def _last_user_message(messages: List[Dict]) -> Tuple[str, bool]:
+    """(text, text_only) của tin nhắn user cuối cùng; text_only=False nếu tin nhắn có ảnh/nội dung khác text."""
     last_user_message_content = None
     for message in reversed(messages):
         if message["role"] == "user":
             last_user_message_content = message["content"]
             break
 
-    if not last_user_message_content: 
-        return ""
+    if not last_user_message_content:
+        return "", False
 
     last_user_text = ""
+    text_only = True
     if isinstance(last_user_message_content, str):
         last_user_text = last_user_message_content
     elif isinstance(last_user_message_content, list):
         for item in last_user_message_content:
              if isinstance(item, dict) and item.get("type") == "text":
-                  last_user_text = item.get("text", "")
-                  break
+                  if not last_user_text:
+                       last_user_text = item.get("text", "")
+             else:
+                  text_only = False
+    return last_user_text, text_only
+
+
+async def classify_turn(messages: List[Dict], openai_api_key: str, tavily_api_key: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Phân loại ý định (tư vấn thời tiết / thời tiết / tìm kiếm) của tin nhắn user cuối cùng."""
+    if not tavily_api_key and not OPENWEATHERMAP_API_KEY:
+        return "", None  # Need Tavily for web search or OpenWeatherMap for weather
+
+    last_user_text, _ = _last_user_message(messages)
+    if not last_user_text:
+        return "", None
+
+    intent = await intent_router.classify(
+        last_user_text, openai_api_key,
+        weather_enabled=bool(OPENWEATHERMAP_API_KEY), search_enabled=bool(tavily_api_key)
+    )
+    return last_user_text, intent
+
+
+def answer_cache_key(messages: List[Dict], last_user_text: str, intent: Optional[Dict[str, Any]],
+                     tavily_api_key: str, lat: Optional[float] = None, lon: Optional[float] = None) -> Optional[str]:
+    """Khóa cache câu trả lời cho lượt hiện tại; None nếu không phải câu hỏi tra cứu chỉ có text."""
+    if not intent or not _last_user_message(messages)[1]:
+        return None
+    return answer_cache.make_key(intent, last_user_text, bool(OPENWEATHERMAP_API_KEY), bool(tavily_api_key), lat, lon)
+
+
+def _history_job(member_id: str, messages: List[Dict[str, Any]], openai_api_key: str, session_id: str):
+    """
+    Job nền: tóm tắt lượt chat rồi lưu lịch sử. Mỗi lần retry chỉ làm lại bước chưa xong;
+    lần thử cuối chấp nhận tóm tắt lỗi để lịch sử vẫn được lưu.
+    """
+    messages = list(messages) # Session tiếp tục thay đổi khi job còn trong hàng đợi
+    state = {"summary": None, "added": False}
+
+    async def run(final_attempt: bool) -> None:
+        if state["summary"] is None:
+            summary = await generate_chat_summary(messages, openai_api_key)
+            if summary == SUMMARY_ERROR and not final_attempt:
+                raise RuntimeError("Tạo tóm tắt chat thất bại")
+            state["summary"] = summary
+        if not state["added"]:
+            state["added"] = True
+            saved = save_chat_history(member_id, messages, state["summary"], session_id)
+        else:
+            saved = persist_chat_history(member_id)
+        if not saved:
+            raise RuntimeError(f"Ghi lịch sử chat của member {member_id} thất bại")
+
+    return run
 
-    if not last_user_text: 
+
+@router.get("/chat/audio/{audio_id}")
+async def get_chat_audio(audio_id: str, wait: bool = True, timeout: float = 30.0):
+    """
+    Audio TTS của một câu trả lời (audio_id trong response của /chat hoặc /chat/stream).
+    wait=true: chờ tối đa `timeout` giây nếu TTS chưa xong.
+    """
+    status, audio_response = await speech_jobs.wait(audio_id, max(0.0, min(timeout, 120.0)) if wait else 0)
+    if status == "unknown":
+        raise HTTPException(status_code=404, detail="Không tìm thấy audio (có thể đã hết hạn)")
+    return {"audio_id": audio_id, "status": status, "audio_response": audio_response}
+
+
+@router.get("/chat/post_response_metrics")
+async def get_post_response_metrics():
+    """Hàng đợi job nền sau khi trả lời (tóm tắt, lịch sử) và TTS nền."""
+    return {"queue": post_response_queue.get_metrics(), "tts": speech_jobs.get_metrics()}
+
+
+@router.get("/chat/prompt_metrics")
+async def get_prompt_metrics():
+    """Cache các phần của system prompt và mã băm của phần đầu tĩnh (phải không đổi giữa các request)."""
+    return system_prompt_builder.get_metrics()
+
+
+@router.get("/chat/tool_metrics")
+async def get_tool_metrics():
+    """Số tool call, số call phải chờ call trùng thực thể, thời gian mỗi lượt và phần chạy trùng lúc model còn stream."""
+    return tool_scheduler.get_metrics()
+
+
+@router.get("/chat/token_metrics")
+async def get_token_metrics():
+    """Số token prompt ước lượng tại chỗ so với số token API báo về, theo từng loại lời gọi LLM."""
+    return budget_manager.get_metrics()
+
+
+def _tool_frame(tool_event: str, tool_run: Any) -> str:
+    """Frame tool_start/tool_end của /chat/stream, kèm tool_call_id và thời gian chờ/chạy."""
+    if tool_event == "start":
+        return json.dumps({"tool_start": tool_run.name, "tool_call_id": tool_run.tool_call.id,
+                           "wait_ms": round(tool_run.wait_ms, 1)}) + "\n"
+    return json.dumps({"tool_end": tool_run.name, "tool_call_id": tool_run.tool_call.id,
+                       "latency_ms": round(tool_run.latency_ms, 1),
+                       "result_preview": tool_run.result[:50]+"..."}) + "\n"
+
+
+def _is_grounded(search_result_for_prompt: str) -> bool:
+    """Câu trả lời dựa trên dữ liệu thời tiết/tìm kiếm lấy thành công (không phải thông báo lỗi)."""
+    return bool(search_result_for_prompt) and "--- LỖI" not in search_result_for_prompt
+
+
+async def check_search_need(messages: List[Dict], openai_api_key: str, tavily_api_key: str, lat: Optional[float] = None,
+                            lon: Optional[float] = None, last_user_text: Optional[str] = None,
+                            intent: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Kiểm tra nhu cầu tìm kiếm từ tin nhắn cuối của người dùng.
+    `last_user_text`/`intent` đã phân loại trước (classify_turn) thì không phân loại lại.
+    """
+    if intent is None:
+        last_user_text, intent = await classify_turn(messages, openai_api_key, tavily_api_key)
+    if not last_user_text or intent is None:
         return ""
 
     logger.info(f"Checking search need for: '{last_user_text[:100]}...'")
 
     # Check for Weather Advice Query (new)
     if OPENWEATHERMAP_API_KEY:
-        is_advice_query, advice_type, location, date_description = await WeatherAdvisor.detect_weather_advice_need(
-            last_user_text, openai_api_key
-        )
+        is_advice_query, advice_type = intent["is_advice_query"], intent["advice_type"]
+        location, date_description = intent["location"], intent["date_description"]
         
         if is_advice_query:
             # Đảm bảo luôn có location (mặc định là Hà Nội)
@@ -639,7 +908,7 @@ async def check_search_need(messages: List[Dict], openai_api_key: str, tavily_ap
                     return advice_prompt_addition
     
     # Check for Weather Query
-    is_weather_query, location, date_description = await WeatherQueryParser.parse_weather_query(last_user_text, openai_api_key)
+    is_weather_query, location, date_description = intent["is_weather_query"], intent["location"], intent["date_description"]
     
     if is_weather_query and OPENWEATHERMAP_API_KEY:
         # Đảm bảo luôn có location (mặc định là Hà Nội)
@@ -697,7 +966,8 @@ async def check_search_need(messages: List[Dict], openai_api_key: str, tavily_ap
 
     # Check for General Search Intent - Phần còn lại giữ nguyên
     if tavily_api_key:
-         need_search, search_query, is_news_query, is_feng_shui_query = await detect_search_intent(last_user_text, openai_api_key)
+         need_search, search_query = intent["need_search"], intent["search_query"]
+         is_news_query, is_feng_shui_query = intent["is_news_query"], intent["is_feng_shui_query"]
          if need_search:
              logger.info(f"Phát hiện nhu cầu tìm kiếm: query='{search_query}', is_news={is_news_query}, is_feng_shui={is_feng_shui_query}")
              domains_to_include = VIETNAMESE_NEWS_DOMAINS if is_news_query else None
@@ -725,75 +995,5 @@ async def check_search_need(messages: List[Dict], openai_api_key: str, tavily_ap
     return ""
 
 def build_system_prompt(current_member_id=None):
-    """Xây dựng system prompt cho trợ lý gia đình (sử dụng Tool Calling)."""
-    from database.data_manager import family_data, events_data, notes_data
-    
-    # Start with the base persona and instructions
-    system_prompt_parts = [
-        "Bạn là trợ lý gia đình thông minh, đa năng và thân thiện tên là HGDS. Nhiệm vụ của bạn là giúp quản lý thông tin gia đình, sự kiện, ghi chú, trả lời câu hỏi, tìm kiếm thông tin, phân tích hình ảnh, và cung cấp thông tin thời tiết.",
-        "Giao tiếp tự nhiên, lịch sự và theo phong cách trò chuyện bằng tiếng Việt.",
-        "Sử dụng định dạng HTML đơn giản cho phản hồi văn bản (thẻ p, b, i, ul, li, h3, h4, br).",
-        "Bạn có thể cung cấp thông tin thời tiết và đưa ra lời khuyên dựa trên thời tiết khi được hỏi.",
-        f"Hôm nay là {datetime.datetime.now().strftime('%A, %d/%m/%Y')}.",
-        "\n**Các Công Cụ Có Sẵn:**",
-        "Bạn có thể sử dụng các công cụ sau khi cần thiết để thực hiện yêu cầu của người dùng:",
-        "- `add_family_member`: Để thêm thành viên mới.",
-        "- `update_preference`: Để cập nhật sở thích cho thành viên đã biết.",
-        "- `add_event`: Để thêm sự kiện mới. Hãy cung cấp mô tả ngày theo lời người dùng (ví dụ: 'ngày mai', 'thứ 6 tuần sau') vào `date_description`, hệ thống sẽ tính ngày chính xác. Bao gồm mô tả lặp lại (ví dụ 'hàng tuần') trong `description` nếu có.",
-        "**QUAN TRỌNG VỀ LẶP LẠI:** Chỉ bao gồm mô tả sự lặp lại (ví dụ 'hàng tuần', 'mỗi tháng') trong trường `description` **KHI VÀ CHỈ KHI** người dùng **nêu rõ ràng** ý muốn lặp lại. Nếu người dùng chỉ nói một ngày cụ thể (ví dụ 'thứ 3 tới'), thì **KHÔNG được tự ý thêm** 'hàng tuần' hay bất kỳ từ lặp lại nào vào `description`; sự kiện đó là MỘT LẦN (ONCE)."
-        "- `update_event`: Để sửa sự kiện. Cung cấp `event_id` và các trường cần thay đổi. Tương tự `add_event` về cách xử lý ngày (`date_description`) và lặp lại (`description`).",
-        "**QUAN TRỌNG VỀ LẶP LẠI:** Nếu cập nhật `description`, chỉ đưa thông tin lặp lại vào đó nếu người dùng **nêu rõ ràng**. Nếu người dùng chỉ thay đổi sang một ngày cụ thể, **KHÔNG tự ý** thêm thông tin lặp lại."
-        "- `delete_event`: Để xóa sự kiện.",
-        "- `add_note`: Để tạo ghi chú mới.",
-        "\n**QUY TẮC QUAN TRỌNG:**",
-        "1.  **Chủ động sử dụng công cụ:** Khi người dùng yêu cầu rõ ràng (thêm, sửa, xóa, tạo...), hãy sử dụng công cụ tương ứng.",
-        "2.  **Xử lý ngày/giờ:** KHÔNG tự tính toán ngày YYYY-MM-DD. Hãy gửi mô tả ngày của người dùng (ví dụ 'ngày mai', '20/7', 'thứ 3 tới') trong trường `date_description` của công cụ `add_event` hoặc `update_event`. Nếu sự kiện lặp lại, hãy nêu rõ trong trường `description` (ví dụ 'học tiếng Anh thứ 6 hàng tuần').",
-        "3.  **Tìm kiếm và thời tiết:** Sử dụng thông tin tìm kiếm và thời tiết được cung cấp trong context (đánh dấu bằng --- THÔNG TIN ---) để trả lời các câu hỏi liên quan. Đừng gọi công cụ nếu thông tin đã có sẵn.",
-        "4.  **Phân tích hình ảnh:** Khi nhận được hình ảnh, hãy mô tả nó và liên kết với thông tin gia đình nếu phù hợp.",
-        "5.  **Xác nhận:** Sau khi sử dụng công cụ thành công (nhận được kết quả từ 'tool role'), hãy thông báo ngắn gọn cho người dùng biết hành động đã được thực hiện dựa trên kết quả đó. Nếu tool thất bại, hãy thông báo lỗi một cách lịch sự.",
-        "6. **Độ dài phản hồi:** Giữ phản hồi cuối cùng cho người dùng tương đối ngắn gọn và tập trung vào yêu cầu chính, trừ khi được yêu cầu chi tiết.",
-        "7. **Thời tiết:** Khi được hỏi về thời tiết hoặc lời khuyên liên quan đến thời tiết, sử dụng thông tin thời tiết được cung cấp để trả lời một cách chính xác và hữu ích."
-    ]
-
-    # Add current user context
-    member_context = ""
-    if current_member_id and current_member_id in family_data:
-        current_member = family_data[current_member_id]
-        member_context = f"""
-        \n**Thông Tin Người Dùng Hiện Tại:**
-        - ID: {current_member_id}
-        - Tên: {current_member.get('name')}
-        - Tuổi: {current_member.get('age', 'Chưa biết')}
-        - Sở thích: {json.dumps(current_member.get('preferences', {}), ensure_ascii=False)}
-        (Hãy cá nhân hóa tương tác và ghi nhận hành động dưới tên người dùng này. Sử dụng ID '{current_member_id}' khi cần `member_id`.)
-        """
-        system_prompt_parts.append(member_context)
-    else:
-         system_prompt_parts.append("\n(Hiện tại đang tương tác với khách.)")
-
-
-    # Add data context
-    recent_events_summary = {}
-    try:
-         sorted_event_ids = sorted(
-             events_data.keys(),
-             key=lambda eid: events_data[eid].get("created_on", ""),
-             reverse=True
-         )
-         for eid in sorted_event_ids[:3]:
-              event = events_data[eid]
-              recent_events_summary[eid] = f"{event.get('title')} ({event.get('date')})"
-    except Exception as sort_err:
-         logger.error(f"Error summarizing recent events: {sort_err}")
-         recent_events_summary = {"error": "Không thể tóm tắt"}
-
-    data_context = f"""
-    \n**Dữ Liệu Hiện Tại (Tóm tắt):**
-    *   Thành viên (IDs): {json.dumps(list(family_data.keys()), ensure_ascii=False)}
-    *   Sự kiện gần đây (IDs & Titles): {json.dumps(recent_events_summary, ensure_ascii=False)} (Tổng cộng: {len(events_data)})
-    *   Ghi chú (Tổng cộng): {len(notes_data)}
-    (Sử dụng ID sự kiện từ tóm tắt này khi cần `event_id` cho việc cập nhật hoặc xóa.)
-    """
-    system_prompt_parts.append(data_context)
-
-    return "\n".join(system_prompt_parts)
\ No newline at end of file
+    """Xây dựng system prompt cho trợ lý gia đình (sử dụng Tool Calling); các phần theo dữ liệu được cache."""
+    return system_prompt_builder.build(current_member_id)
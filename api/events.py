@@ -6,17 +6,29 @@ from typing import Dict, Any, List, Optional
 from config.logging_config import logger
 from models.schemas import EventModel
 from database.data_manager import events_data
+from database.event_index import event_index
 from core.datetime_handler import determine_repeat_type
-from services.tools.event_tools import add_event
+from services.tools.event_tools import create_event
 from utils.helpers import filter_events_by_member
 
 router = APIRouter()
 
 @router.get("/events")
-async def get_events(member_id: Optional[str] = None):
-    if member_id:
-        return filter_events_by_member(member_id)
-    return events_data
+async def get_events(member_id: Optional[str] = None, category: Optional[str] = None,
+                     start_date: Optional[str] = None, end_date: Optional[str] = None):
+    """Lấy sự kiện, lọc tùy chọn theo thành viên, category và khoảng ngày (YYYY-MM-DD)."""
+    if not (category or start_date or end_date):
+        return filter_events_by_member(member_id) if member_id else events_data
+
+    events = filter_events_by_member(member_id) if member_id else events_data
+    if start_date or end_date:
+        event_ids = event_index.ids_in_date_range(start_date, end_date)
+    else:
+        event_ids = event_index.order_by_created(event_index.ids_by_category(category))
+    if category and (start_date or end_date):
+        category_ids = event_index.ids_by_category(category)
+        event_ids = [eid for eid in event_ids if eid in category_ids]
+    return {eid: events[eid] for eid in event_ids if eid in events}
 
 @router.post("/events")
 async def add_event_endpoint(event: EventModel, member_id: Optional[str] = None):
@@ -25,18 +37,9 @@ async def add_event_endpoint(event: EventModel, member_id: Optional[str] = None)
     details["created_by"] = member_id
     details["repeat_type"] = determine_repeat_type(details.get("description"), details.get("title"))
 
-    if add_event(details):
-         new_event_id = None
-         for eid, edata in events_data.items():
-              if (edata.get("title") == event.title and
-                  edata.get("date") == event.date and
-                  edata.get("created_by") == member_id):
-                   new_event_id = eid
-                   break
-         if new_event_id:
-              return {"id": new_event_id, "event": events_data[new_event_id]}
-         else:
-              raise HTTPException(status_code=500, detail="Thêm sự kiện thành công nhưng không tìm thấy ID.")
-
+    created = create_event(details)
+    if created:
+         new_event_id, event_record = created
+         return {"id": new_event_id, "event": event_record}
     else:
-        raise HTTPException(status_code=500, detail="Không thể thêm sự kiện.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Không thể thêm sự kiện.")
@@ -6,7 +6,7 @@ from typing import Dict, Any, List, Optional
 from config.logging_config import logger
 from models.schemas import MemberModel
 from database.data_manager import family_data
-from services.tools.family_tools import add_family_member
+from services.tools.family_tools import create_family_member
 
 router = APIRouter()
 
@@ -18,15 +18,9 @@ async def get_family_members():
 async def add_family_member_endpoint(member: MemberModel):
     """Thêm thành viên (qua endpoint trực tiếp)."""
     details = member.dict()
-    if add_family_member(details):
-         new_member_id = None
-         for mid, mdata in family_data.items():
-              if mdata.get("name") == member.name and mdata.get("age") == member.age:
-                   new_member_id = mid
-                   break
-         if new_member_id:
-             return {"id": new_member_id, "member": family_data[new_member_id]}
-         else:
-             raise HTTPException(status_code=500, detail="Thêm thành công nhưng không tìm thấy ID.")
+    created = create_family_member(details)
+    if created:
+         new_member_id, member_record = created
+         return {"id": new_member_id, "member": member_record}
     else:
-        raise HTTPException(status_code=500, detail="Không thể thêm thành viên.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Không thể thêm thành viên.")
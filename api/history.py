@@ -1,31 +1,55 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException
-from typing import Dict, Any, List, Optional
+import json
+import base64
+from fastapi import APIRouter, HTTPException, Query, Response
+from typing import Dict, Any, List, Optional, Tuple
 
 from config.logging_config import logger
 from database.data_manager import chat_history, family_data
+from database.history_index import history_index
+from utils.helpers import reconstruct_history_entry
 
 router = APIRouter()
 
 @router.get("/chat_history/{member_id}")
 async def get_member_chat_history(member_id: str):
-    """Lấy lịch sử chat của một thành viên."""
+    """Lấy lịch sử chat của một thành viên (transcript được dựng lại từ các entry delta)."""
     if member_id in chat_history:
-        return chat_history[member_id][:10]
+        return [reconstruct_history_entry(member_id, entry) for entry in chat_history[member_id][:10]]
     return []
 
+def _encode_cursor(member_id: str, entry: Dict[str, Any]) -> str:
+    raw = json.dumps([str(entry.get("timestamp", "")), member_id], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        timestamp, member_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        return (str(timestamp), str(member_id))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ.")
+
 @router.get("/chat_history/session/{session_id}")
-async def get_session_chat_history(session_id: str):
-    """Lấy lịch sử chat theo session_id (có thể chậm)."""
+async def get_session_chat_history(session_id: str, response: Response,
+                                   limit: Optional[int] = Query(None, ge=1, le=200),
+                                   cursor: Optional[str] = None):
+    """
+    Lấy lịch sử chat theo session_id (mới nhất trước), dùng history_index.
+    Khi truyền `limit`, header X-Next-Cursor chứa cursor cho trang tiếp theo.
+    """
+    after = _decode_cursor(cursor) if cursor else None
+    # Lấy dư một phần tử để biết còn trang sau hay không
+    items = history_index.session_entries(session_id, after=after, limit=limit + 1 if limit else None)
+    if limit and len(items) > limit:
+        items = items[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(*items[-1])
+
     session_chats = []
-    for member_id, histories in chat_history.items():
-        for history in histories:
-            if history.get("session_id") == session_id:
-                history_with_member = history.copy()
-                history_with_member["member_id"] = member_id
-                if member_id in family_data:
-                    history_with_member["member_name"] = family_data[member_id].get("name", "")
-                session_chats.append(history_with_member)
-    session_chats.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-    return session_chats
\ No newline at end of file
+    for member_id, history in items:
+        history_with_member = reconstruct_history_entry(member_id, history)
+        history_with_member["member_id"] = member_id
+        if member_id in family_data:
+            history_with_member["member_name"] = family_data[member_id].get("name", "")
+        session_chats.append(history_with_member)
+    return session_chats
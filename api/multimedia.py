@@ -1,11 +1,16 @@
 from __future__ import annotations
 
 import os
+import uuid
 from fastapi import APIRouter, File, UploadFile, Form, HTTPException
+from fastapi.responses import FileResponse
 from typing import Dict, Any, List, Optional
 
 from config.logging_config import logger
 from config.settings import TEMP_DIR
+from core.token_budget import token_counter, budget_manager
+from database.blob_store import blob_store
+from services.llm.client_pool import llm_clients
 from services.multimedia.audio_service import text_to_speech_google, process_audio
 from services.multimedia.image_service import get_image_base64
 
@@ -26,10 +31,8 @@ async def analyze_image_endpoint(
          raise HTTPException(status_code=400, detail="OpenAI API key không hợp lệ.")
 
     try:
-        from openai import OpenAI
         from PIL import Image
         from io import BytesIO
-        import asyncio
         
         image_content = await file.read()
         img = Image.open(BytesIO(image_content))
@@ -38,19 +41,22 @@ async def analyze_image_endpoint(
         if not img_base64_url:
              raise HTTPException(status_code=500, detail="Không thể xử lý ảnh thành base64.")
 
-        client = OpenAI(api_key=openai_api_key)
-        response = await asyncio.to_thread(
-             client.chat.completions.create,
+        client = llm_clients.get(openai_api_key)
+        image_messages = [
+            {"role": "system", "content": "Bạn là chuyên gia phân tích hình ảnh. Mô tả chi tiết, nếu là món ăn, nêu tên và gợi ý công thức/nguyên liệu. Nếu là hoạt động, mô tả hoạt động đó."},
+            {"role": "user", "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": img_base64_url}}
+            ]}
+        ]
+        estimated_prompt = token_counter.count_messages(image_messages)
+        max_tokens = budget_manager.max_tokens("image_analysis", estimated_prompt)
+        response = await client.chat.completions.create(
              model="gpt-4o-mini",
-             messages=[
-                 {"role": "system", "content": "Bạn là chuyên gia phân tích hình ảnh. Mô tả chi tiết, nếu là món ăn, nêu tên và gợi ý công thức/nguyên liệu. Nếu là hoạt động, mô tả hoạt động đó."},
-                 {"role": "user", "content": [
-                     {"type": "text", "text": prompt},
-                     {"type": "image_url", "image_url": {"url": img_base64_url}}
-                 ]}
-             ],
-             max_tokens=1000
+             messages=image_messages,
+             max_tokens=max_tokens
         )
+        budget_manager.record("image_analysis", estimated_prompt, response.usage, max_tokens)
 
         analysis_text = response.choices[0].message.content
         audio_response = text_to_speech_google(analysis_text)
@@ -79,18 +85,13 @@ async def transcribe_audio_endpoint(
 
     temp_audio_path = os.path.join(TEMP_DIR, f"{uuid.uuid4()}_{file.filename}")
     try:
-        from openai import OpenAI
-        import asyncio
-        import uuid
-        
         audio_content = await file.read()
         with open(temp_audio_path, "wb") as f:
             f.write(audio_content)
 
-        client = OpenAI(api_key=openai_api_key)
+        client = llm_clients.get(openai_api_key)
         with open(temp_audio_path, "rb") as audio_file_obj:
-            transcript = await asyncio.to_thread(
-                client.audio.transcriptions.create,
+            transcript = await client.audio.transcriptions.create(
                 model="whisper-1",
                 file=audio_file_obj
             )
@@ -129,4 +130,14 @@ async def text_to_speech_endpoint(
             raise HTTPException(status_code=500, detail="Không thể tạo file âm thanh.")
     except Exception as e:
         logger.error(f"Lỗi trong text_to_speech_endpoint: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Lỗi xử lý TTS: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Lỗi xử lý TTS: {str(e)}")
+
+
+@router.get("/blobs/{name}")
+async def get_blob(name: str):
+    """Trả về nội dung ảnh/audio theo tham chiếu blob (blob://<name>) lưu trong message."""
+    path = blob_store.path_for(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Không tìm thấy blob.")
+    # Nội dung định địa chỉ theo hash nên không bao giờ thay đổi
+    return FileResponse(path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
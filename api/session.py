@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import os
 import uuid
 import datetime
 from fastapi import APIRouter, HTTPException
@@ -26,23 +27,23 @@ async def delete_session(session_id: str):
 
 @router.get("/sessions")
 async def list_sessions():
-    sessions_info = {}
-    for session_id, session_data in session_manager.sessions.items():
-        sessions_info[session_id] = {
-            "created_at": session_data.get("created_at"),
-            "last_updated": session_data.get("last_updated"),
-            "member_id": session_data.get("current_member"),
-            "message_count": len(session_data.get("messages", [])),
-        }
+    sessions_info = session_manager.list_sessions()
     sorted_sessions = sorted(sessions_info.items(), key=lambda item: item[1].get('last_updated', ''), reverse=True)
     return dict(sorted_sessions)
 
 
-@router.delete("/cleanup_sessions")
+@router.get("/session_metrics")
+async def get_session_metrics():
+    """Số liệu session: flush (độ trễ, bytes đã ghi, session chờ ghi) và cache (hit/miss/eviction)."""
+    return session_manager.get_metrics()
+
+@router.delete("/cleanup_sessions", deprecated=True)
 async def cleanup_old_sessions_endpoint(days: int = 30):
+    """Dọn dẹp thủ công; sweeper nền đã tự xóa session quá SESSION_RETENTION_DAYS ngày."""
     try:
-         session_manager.cleanup_old_sessions(days_threshold=days)
-         return {"status": "success", "message": f"Đã bắt đầu dọn dẹp sessions không hoạt động trên {days} ngày"}
+         removed = session_manager.cleanup_old_sessions(days_threshold=days)
+         return {"status": "success", "removed": removed,
+                 "message": f"Đã dọn dẹp {removed} session không hoạt động trên {days} ngày"}
     except Exception as e:
          logger.error(f"Lỗi khi dọn dẹp session: {e}", exc_info=True)
          raise HTTPException(status_code=500, detail=f"Lỗi dọn dẹp session: {str(e)}")
@@ -7,11 +7,11 @@ import json
 import datetime
 
 # Import config
-from config.settings import DATA_DIR
+from config.settings import DATA_DIR, MULTIPROCESS_STORAGE_ENABLED
 from config.logging_config import logger, setup_logging
 
 # Import database functions
-from database.data_manager import load_all_data, verify_data_structure
+from database.data_manager import load_all_data, verify_data_structure, refresh_if_changed
 
 # Import routers
 from api.chat import router as chat_router
@@ -23,6 +23,7 @@ from api.weather import router as weather_router
 from api.session import router as session_router
 from api.multimedia import router as multimedia_router
 from api.history import router as history_router
+from api.admin import router as admin_router
 
 # Setup app
 app = FastAPI(title="Trợ lý Gia đình API (Tool Calling)",
@@ -38,6 +39,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if MULTIPROCESS_STORAGE_ENABLED:
+    @app.middleware("http")
+    async def refresh_shared_data(request: Request, call_next):
+        """Nhiều worker: làm mới dữ liệu/index nếu worker khác vừa ghi (chỉ tốn vài lệnh stat)."""
+        refresh_if_changed()
+        return await call_next(request)
+
 # Include routers
 app.include_router(chat_router, tags=["Chat"])
 app.include_router(family_router, prefix="/family_members", tags=["Family"])
@@ -48,6 +56,7 @@ app.include_router(weather_router, prefix="/weather", tags=["Weather"])
 app.include_router(session_router, tags=["Session"])
 app.include_router(multimedia_router, tags=["Multimedia"])
 app.include_router(history_router, tags=["History"])
+app.include_router(admin_router, tags=["Admin"])
 
 @app.get("/")
 async def root():
@@ -69,21 +78,40 @@ async def startup_event():
     logger.info("Khởi động Family Assistant API server (Tool Calling)")
     # Load data
     load_all_data()
+    from core.session_manager import session_manager
+    # Đọc index session (và chuyển đổi file session cũ) khi khởi động thay vì lúc import
+    session_manager.load_index()
+    await session_manager.start_flusher()
+    await session_manager.start_sweeper()
+    from core.post_response import post_response_queue
+    await post_response_queue.start()
+    from core.data_reloader import data_reloader
+    await data_reloader.start_watcher()
     logger.info("Đã tải dữ liệu và sẵn sàng hoạt động.")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Các tác vụ cần thực hiện khi đóng server."""
-    from database.data_manager import save_data, family_data, events_data, notes_data, chat_history
+    from database.data_manager import flush_store, family_data, events_data, notes_data, chat_history
     from config.settings import FAMILY_DATA_FILE, EVENTS_DATA_FILE, NOTES_DATA_FILE, CHAT_HISTORY_FILE
     from core.session_manager import session_manager
+    from core.data_reloader import data_reloader
+    from services.llm.client_pool import llm_clients
+    from core.post_response import post_response_queue
+    from services.tools.tool_scheduler import tool_scheduler
     
     logger.info("Đóng Family Assistant API server...")
-    save_data(FAMILY_DATA_FILE, family_data)
-    save_data(EVENTS_DATA_FILE, events_data)
-    save_data(NOTES_DATA_FILE, notes_data)
-    save_data(CHAT_HISTORY_FILE, chat_history)
-    session_manager._save_sessions()
+    await data_reloader.stop_watcher()
+    # Ghi nốt lịch sử chat còn trong hàng đợi nền trước khi flush dữ liệu
+    await post_response_queue.stop()
+    tool_scheduler.shutdown()
+    flush_store(FAMILY_DATA_FILE, family_data)
+    flush_store(EVENTS_DATA_FILE, events_data)
+    flush_store(NOTES_DATA_FILE, notes_data)
+    flush_store(CHAT_HISTORY_FILE, chat_history)
+    await session_manager.stop_sweeper()
+    await session_manager.stop_flusher()
+    await llm_clients.close_all()
     logger.info("Đã lưu dữ liệu. Server tắt.")
 
 if __name__ == "__main__":
@@ -92,16 +120,20 @@ if __name__ == "__main__":
     parser.add_argument("--host", type=str, default="0.0.0.0", help="Host IP")
     parser.add_argument("--port", type=int, default=8000, help="Port")
     parser.add_argument("--reload", action="store_true", help="Auto reload server on code changes")
+    parser.add_argument("--workers", type=int, default=1, help="Số worker process (cần MULTIPROCESS_STORAGE_ENABLED=true khi > 1)")
     args = parser.parse_args()
 
     log_level = "debug" if args.reload else "info"
 
     logger.info(f"Khởi động Trợ lý Gia đình API (Tool Calling) trên http://{args.host}:{args.port}")
+    if args.workers > 1 and not MULTIPROCESS_STORAGE_ENABLED:
+        logger.warning("Chạy nhiều worker mà chưa bật MULTIPROCESS_STORAGE_ENABLED: các worker sẽ ghi đè dữ liệu của nhau.")
 
     uvicorn.run(
         "app:app",
         host=args.host,
         port=args.port,
         reload=args.reload,
+        workers=args.workers,
         log_level=log_level.lower()
     )
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+Đo thời gian encode/decode và kích thước file của các codec lưu trữ
+trên một tập dữ liệu giả lập 10k session (tin nhắn tiếng Việt, tool call...).
+
+Sử dụng:
+    python -m benchmarks.bench_codec --sessions 10000
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+import tempfile
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="bench_codec_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import codec
+
+USER_TEXTS = [
+    "Xin chào", "Đặt lịch xem phim vào tối nay", "Thời tiết Hà Nội ngày mai thế nào?",
+    "Thêm sự kiện họp phụ huynh thứ 6 tuần sau lúc 8 giờ", "Hôm nay nên mặc gì?",
+    "Ghi chú: mua sữa, trứng và bánh mì", "Tin tức thể thao mới nhất hôm nay",
+]
+ASSISTANT_TEXTS = [
+    "<p>Xin chào! Tôi là HGDS, trợ lý gia đình của bạn. Tôi có thể giúp gì cho bạn hôm nay?</p>",
+    "<p>Tôi đã thêm sự kiện <b>Họp phụ huynh</b> vào lịch của bạn.</p>",
+    "<p>Ngày mai Hà Nội có mưa rào, nhiệt độ từ 24°C đến 29°C. Bạn nên mang theo ô nhé!</p>",
+    "<ul><li>Áo khoác mỏng</li><li>Giày chống trượt</li><li>Ô hoặc áo mưa</li></ul>",
+]
+
+
+def make_session(i: int) -> dict:
+    now = datetime.datetime(2025, 4, 10, 17, 0, 0) + datetime.timedelta(minutes=i)
+    messages = []
+    for turn in range(random.randint(3, 10)):
+        messages.append({"role": "user", "content": [{"type": "text", "text": random.choice(USER_TEXTS)}]})
+        if random.random() < 0.25:
+            call_id = f"call_{i}_{turn}"
+            messages.append({"role": "assistant", "content": None, "tool_calls": [{
+                "id": call_id, "type": "function",
+                "function": {"name": "add_event", "arguments": "{\"title\": \"Họp phụ huynh\", \"date_description\": \"thứ 6 tuần sau\"}"}}]})
+            messages.append({"tool_call_id": call_id, "role": "tool", "name": "add_event",
+                             "content": "Đã thực thi thành công add_event."})
+        messages.append({"role": "assistant", "content": random.choice(ASSISTANT_TEXTS), "annotations": []})
+    return {
+        "messages": messages,
+        "current_member": f"member-{i % 50}",
+        "suggested_question": None,
+        "process_suggested": False,
+        "question_cache": {},
+        "created_at": now.isoformat(),
+        "last_updated": (now + datetime.timedelta(minutes=30)).isoformat(),
+    }
+
+
+def measure(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(7)
+    corpus = {f"session-{i}": make_session(i) for i in range(args.sessions)}
+    codecs = [codec.CODEC_JSON, codec.CODEC_JSON_COMPACT]
+    if codec.msgpack is not None:
+        codecs.append(codec.CODEC_MSGPACK)
+    else:
+        print("(msgpack chưa được cài - bỏ qua codec msgpack)")
+
+    print(f"Corpus: {args.sessions} session\n")
+    print(f"{'codec':<14}{'size (KB)':>12}{'encode (ms)':>14}{'decode (ms)':>14}")
+    baseline_size = None
+    for name in codecs:
+        payload = codec.encode(corpus, name)
+        encode_ms = measure(lambda: codec.encode(corpus, name), args.repeat)
+        decode_ms = measure(lambda: codec.decode(payload), args.repeat)
+        assert codec.decode(payload) == corpus
+        baseline_size = baseline_size or len(payload)
+        ratio = len(payload) / baseline_size
+        print(f"{name:<14}{len(payload) / 1024:>12.1f}{encode_ms:>14.1f}{decode_ms:>14.1f}   ({ratio:.0%} kích thước json)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark độ trễ phân loại ý định trước lần gọi completion chính: so sánh
+ba bộ phân loại tuần tự (hành vi cũ) với một lần gọi hợp nhất và chế độ song song.
+Chạy một server giả lập OpenAI (độ trễ cấu hình được) để kết quả không phụ thuộc mạng.
+
+Sử dụng:
+    python -m benchmarks.bench_intent_router --latency-ms 300 --rounds 3
+    python -m benchmarks.bench_intent_router --modes sequential unified
+    python -m benchmarks.bench_intent_router --local
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+
+from fastapi import FastAPI, Request
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_QUERIES = [
+    "hôm nay nên mặc gì",
+    "thời tiết Đà Nẵng ngày mai thế nào",
+    "tin tức bóng đá mới nhất",
+    "những ngày nào thuận lợi trong tuần này",
+    "thủ đô nước Pháp là gì?",
+    "nhắc mình đi chợ lúc 5 giờ chiều",
+]
+
+stub_app = FastAPI()
+
+
+def _stub_intent(text: str) -> dict:
+    text = text.lower()
+    is_advice = "mặc gì" in text or "mang gì" in text
+    is_weather = is_advice or "thời tiết" in text
+    need_search = not is_weather and any(word in text for word in ("tin tức", "thuận lợi", "giá"))
+    return {
+        "is_advice_query": is_advice,
+        "advice_type": "clothing" if is_advice else None,
+        "is_weather_query": is_weather,
+        "location": None,
+        "date_description": "ngày mai" if "ngày mai" in text else None,
+        "need_search": need_search,
+        "search_query": text,
+        "is_news_query": "tin tức" in text,
+        "is_feng_shui_query": "thuận lợi" in text,
+    }
+
+
+@stub_app.post("/v1/chat/completions")
+async def stub_completions(request: Request):
+    """Server giả lập: trả về JSON phân loại sau STUB_LATENCY_MS mili giây."""
+    body = await request.json()
+    await asyncio.sleep(float(os.getenv("STUB_LATENCY_MS", "300")) / 1000)
+    user_text = next((m.get("content") for m in reversed(body.get("messages", [])) if m.get("role") == "user"), "")
+    return {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": json.dumps(_stub_intent(str(user_text)), ensure_ascii=False)},
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+@stub_app.get("/")
+async def stub_root():
+    return {"ok": True}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=2).read()
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server {base_url} không khởi động được trong {timeout}s")
+
+
+async def measure(modes, rounds: int, local: bool = False) -> dict:
+    from services.intent.intent_router import intent_router
+
+    intent_router.local_enabled = local
+    results = {}
+    for mode in modes:
+        timings, llm_calls_before = [], intent_router.metrics["llm_calls"]
+        for _ in range(rounds):
+            for query in SAMPLE_QUERIES:
+                started = time.perf_counter()
+                await intent_router.classify(query, "sk-bench", weather_enabled=True, search_enabled=True, mode=mode)
+                timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[mode] = {
+            "avg_ms": sum(timings) / len(timings),
+            "p50_ms": timings[len(timings) // 2],
+            "max_ms": timings[-1],
+            "llm_calls_per_query": (intent_router.metrics["llm_calls"] - llm_calls_before) / len(timings),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modes", nargs="+", default=["sequential", "concurrent", "unified"])
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--local", action="store_true", help="bật bộ phân loại cục bộ trước LLM")
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.bench_intent_router:stub_app", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT_DIR, env={**os.environ, "STUB_LATENCY_MS": str(args.latency_ms)},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(base_url)
+        # AsyncOpenAI đọc OPENAI_BASE_URL khi client được tạo
+        os.environ["OPENAI_BASE_URL"] = base_url + "/v1"
+        results = asyncio.run(measure(args.modes, args.rounds, args.local))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    print(f"Độ trễ LLM giả lập: {args.latency_ms:.0f} ms, {len(SAMPLE_QUERIES)} câu hỏi x {args.rounds} vòng\n")
+    print(f"{'mode':>12}{'avg ms':>10}{'p50 ms':>10}{'max ms':>10}{'LLM calls/q':>14}")
+    for mode, r in results.items():
+        print(f"{mode:>12}{r['avg_ms']:>10.1f}{r['p50_ms']:>10.1f}{r['max_ms']:>10.1f}{r['llm_calls_per_query']:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+So sánh bộ nhớ giữa record dạng dict và record __slots__ (EventRecord)
+cho một events store lớn.
+
+Sử dụng:
+    python -m benchmarks.bench_records --records 100000
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="bench_records_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.records import EventRecord
+
+MEMBERS = [f"member-{i}" for i in range(20)]
+CATEGORIES = ["Health", "Study", "Meeting", "Travel", "Event", "Reminder", "General"]
+
+
+def make_event_dicts(n: int) -> list:
+    random.seed(42)
+    events = []
+    for i in range(n):
+        events.append({
+            "id": str(uuid.UUID(int=i)),
+            "title": f"Sự kiện {i}",
+            "date": f"2025-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+            "time": "19:00",
+            "description": "",
+            "participants": [],
+            "repeat_type": "ONCE",
+            "category": random.choice(CATEGORIES),
+            "created_by": random.choice(MEMBERS),
+            "created_on": "2025-04-10T17:21:58.070743",
+        })
+    return events
+
+
+def measure(label: str, build) -> int:
+    tracemalloc.start()
+    start = time.perf_counter()
+    store = build()
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<24} {current / (1024 * 1024):>10.1f} MiB   ({elapsed * 1000:.0f} ms, {len(store)} records)")
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=100000)
+    args = parser.parse_args()
+
+    # Các giá trị (chuỗi) được tạo trước để chỉ đo phần chứa record
+    source = make_event_dicts(args.records)
+    print(f"Events: {args.records}\n")
+    dict_bytes = measure("dict", lambda: {e["id"]: dict(e) for e in source})
+    record_bytes = measure("EventRecord (__slots__)", lambda: {e["id"]: EventRecord(e) for e in source})
+    print(f"\nEventRecord dùng {record_bytes / dict_bytes:.0%} bộ nhớ so với dict")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+So sánh JSON-file engine (ghi lại toàn bộ file / journal) và SQLite engine
+về throughput ghi và đọc có lọc (theo created_by).
+
+Sử dụng:
+    python -m benchmarks.bench_storage --records 20000 --writes 500 --reads 200
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="bench_storage_")
+os.environ["DATA_DIR"] = _TMP_DIR
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+logging.getLogger("family_assistant_api").setLevel(logging.WARNING)
+
+from database.data_manager import save_data, select_records, open_sqlite_store, SQLITE_TABLE_SPECS
+from database.journal import JournalWriter
+
+MEMBERS = [f"member-{i}" for i in range(20)]
+CATEGORIES = ["Health", "Study", "Meeting", "Travel", "Event", "Reminder", "General"]
+
+
+def make_event() -> dict:
+    event_id = str(uuid.uuid4())
+    return {
+        "id": event_id,
+        "title": f"Sự kiện {random.randint(1, 10**6)}",
+        "date": f"2025-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+        "time": "19:00",
+        "description": "Mô tả sự kiện " * 3,
+        "participants": random.sample(["An", "Bình", "Chi", "Dũng", "Hà"], 2),
+        "repeat_type": "ONCE",
+        "category": random.choice(CATEGORIES),
+        "created_by": random.choice(MEMBERS),
+        "created_on": "2025-04-10T17:21:58.070743",
+    }
+
+
+def seed(n: int) -> dict:
+    events = {}
+    for _ in range(n):
+        event = make_event()
+        events[event["id"]] = event
+    return events
+
+
+def bench(label: str, fn, count: int) -> None:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {count / elapsed:>12.1f} ops/s   ({elapsed * 1000:.1f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(42)
+    base = seed(args.records)
+    new_events = [make_event() for _ in range(args.writes)]
+    print(f"Dataset: {args.records} events, {args.writes} writes, {args.reads} filtered reads (dir {_TMP_DIR})\n")
+
+    # JSON engine, ghi lại toàn bộ file mỗi thay đổi
+    json_path = os.path.join(_TMP_DIR, "events_full.json")
+    json_data = dict(base)
+    save_data(json_path, json_data)
+
+    def json_writes():
+        for event in new_events:
+            json_data[event["id"]] = event
+            save_data(json_path, json_data)
+    bench("json (full rewrite) write", json_writes, args.writes)
+
+    # JSON engine + journal
+    journal_path = os.path.join(_TMP_DIR, "events_journal.json")
+    journal_data = dict(base)
+    save_data(journal_path, journal_data)
+    writer = JournalWriter(journal_path, compact_threshold_bytes=0)
+    writer.attach(journal_data)
+
+    def journal_writes():
+        for event in new_events:
+            journal_data[event["id"]] = event
+            writer.append("set", event["id"], event)
+    bench("json + journal write", journal_writes, args.writes)
+
+    # SQLite engine
+    tables = open_sqlite_store(os.path.join(_TMP_DIR, "bench.db"))
+    events_table = next(t for path, t in tables.items() if SQLITE_TABLE_SPECS[path]["name"] == "events")
+    events_table.bulk_load(base)
+
+    def sqlite_writes():
+        for event in new_events:
+            events_table[event["id"]] = event
+    bench("sqlite (WAL) write", sqlite_writes, args.writes)
+
+    # Đọc có lọc
+    lookups = [random.choice(MEMBERS) for _ in range(args.reads)]
+
+    def json_reads():
+        for member in lookups:
+            select_records(json_data, created_by=member)
+    bench("json filtered read (created_by)", json_reads, args.reads)
+
+    def sqlite_reads():
+        for member in lookups:
+            events_table.select(created_by=member)
+    bench("sqlite filtered read (created_by)", sqlite_reads, args.reads)
+
+    def sqlite_range_reads():
+        for _ in range(args.reads):
+            month = random.randint(1, 12)
+            events_table.select_range("date", f"2025-{month:02d}-01", f"2025-{month:02d}-07")
+    bench("sqlite date range read", sqlite_range_reads, args.reads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Benchmark độ trễ đầu-cuối của /chat/stream cho lượt có nhiều tool call: so sánh chờ model
+stream xong mới chạy tool (TOOL_EARLY_DISPATCH=false) với chạy từng tool ngay khi arguments
+của nó đã là JSON hợp lệ. Server giả lập OpenAI stream arguments theo từng mảnh với độ trễ
+cấu hình được; --tool-ms mô phỏng tool chậm (vd. SQLite trên đĩa chậm, dịch vụ ngoài).
+
+Sử dụng:
+    python -m benchmarks.bench_tool_dispatch --tools 3 --chunk-ms 40 --tool-ms 150
+    python -m benchmarks.bench_tool_dispatch --rounds 5
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from benchmarks.bench_intent_router import free_port, wait_ready, ROOT_DIR
+
+EVENT_TITLES = ["Họp phụ huynh", "Đi siêu thị", "Sinh nhật bà", "Khám răng", "Học bơi", "Dọn nhà"]
+
+stub_app = FastAPI()
+
+
+def _chunk(delta: dict, finish_reason=None) -> str:
+    payload = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()),
+               "model": "stub", "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _tool_call_stream(tool_count: int, chunk_delay: float, fragment_size: int = 12):
+    async def generate():
+        for index in range(tool_count):
+            arguments = json.dumps({"title": EVENT_TITLES[index % len(EVENT_TITLES)],
+                                    "date_description": "ngày mai", "time": f"{8 + index}:00"}, ensure_ascii=False)
+            yield _chunk({"role": "assistant", "tool_calls": [{"index": index, "id": f"call_{index}", "type": "function",
+                                                                "function": {"name": "add_event", "arguments": ""}}]})
+            for start in range(0, len(arguments), fragment_size):
+                await asyncio.sleep(chunk_delay)
+                yield _chunk({"tool_calls": [{"index": index, "function": {"arguments": arguments[start:start + fragment_size]}}]})
+        yield _chunk({}, "tool_calls")
+        yield "data: [DONE]\n\n"
+    return generate()
+
+
+def _text_stream(text: str, chunk_delay: float):
+    async def generate():
+        for word in text.split(" "):
+            await asyncio.sleep(chunk_delay)
+            yield _chunk({"content": word + " "})
+        yield _chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+    return generate()
+
+
+@stub_app.post("/v1/chat/completions")
+async def stub_completions(request: Request):
+    """Lượt đầu (có tools): stream STUB_TOOLS lệnh add_event; lượt sau: stream câu tóm tắt ngắn."""
+    body = await request.json()
+    chunk_delay = float(os.getenv("STUB_CHUNK_MS", "40")) / 1000
+    if not body.get("stream"):
+        content = json.dumps({"need_search": False, "is_weather_query": False, "is_advice_query": False})
+        return {"id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": "stub",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}}
+    if body.get("tools"):
+        generator = _tool_call_stream(int(os.getenv("STUB_TOOLS", "3")), chunk_delay)
+    else:
+        generator = _text_stream("Đã thêm các sự kiện vào lịch.", chunk_delay)
+    return StreamingResponse(generator, media_type="text/event-stream")
+
+
+@stub_app.get("/")
+async def stub_root():
+    return {"ok": True}
+
+
+def measure(rounds: int, tool_ms: float, workers=None) -> dict:
+    from fastapi.testclient import TestClient
+    import api.chat as chat_api
+    import services.tools.tool_scheduler as scheduler_module
+    from app import app
+
+    execute = scheduler_module.execute_tool_call
+
+    def slow_execute(tool_call, member_id):
+        time.sleep(tool_ms / 1000)
+        return execute(tool_call, member_id)
+
+    scheduler_module.execute_tool_call = slow_execute
+    scheduler = scheduler_module.tool_scheduler
+    if workers is not None:
+        scheduler.workers = workers
+    results = {}
+    with TestClient(app) as client:
+        for early in (False, True):
+            chat_api.TOOL_EARLY_DISPATCH = early
+            totals = []
+            overlapped_before = scheduler.metrics["overlapped_ms"]
+            for round_index in range(rounds):
+                body = {"session_id": f"bench-tools-{early}-{round_index}", "content_type": "text",
+                        "message": {"type": "text", "text": "thêm sự kiện cho cả nhà tuần này"},
+                        "openai_api_key": "sk-bench"}
+                started = time.perf_counter()
+                with client.stream("POST", "/chat/stream", json=body) as response:
+                    for line in response.iter_lines():
+                        if line and json.loads(line).get("complete"):
+                            totals.append((time.perf_counter() - started) * 1000)
+                            break
+            results["early" if early else "after_stream"] = {
+                "avg_ms": sum(totals) / max(1, len(totals)),
+                # Thời gian chạy tool trùng với lúc model còn đang stream, trung bình mỗi lượt
+                "overlapped_ms": (scheduler.metrics["overlapped_ms"] - overlapped_before) / rounds,
+            }
+    scheduler_module.execute_tool_call = execute
+    return {"workers": scheduler.workers, "modes": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tools", type=int, default=3, help="số tool call trong lượt đầu")
+    parser.add_argument("--chunk-ms", type=float, default=40, help="độ trễ giữa các mảnh stream")
+    parser.add_argument("--tool-ms", type=float, default=150, help="thời gian mô phỏng của mỗi tool")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="số luồng ghi file (mặc định TOOL_EXECUTOR_WORKERS; 0: trên event loop)")
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.bench_tool_dispatch:stub_app", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT_DIR, env={**os.environ, "STUB_TOOLS": str(args.tools), "STUB_CHUNK_MS": str(args.chunk_ms)},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(base_url)
+        os.environ["OPENAI_BASE_URL"] = base_url + "/v1"
+        # Dữ liệu của benchmark ghi vào thư mục tạm, không đụng vào data/ thật
+        os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="bench_tools_"))
+        results = measure(args.rounds, args.tool_ms, args.workers)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    print(f"{args.tools} tool call/lượt, {args.chunk_ms:.0f} ms/mảnh stream, {args.tool_ms:.0f} ms/tool, "
+          f"{results['workers']} luồng, {args.rounds} vòng\n")
+    print(f"{'mode':>14}{'end-to-end ms':>16}{'overlapped ms':>16}")
+    for mode, r in results["modes"].items():
+        print(f"{mode:>14}{r['avg_ms']:>16.1f}{r['overlapped_ms']:>16.1f}")
+    baseline, early = results["modes"]["after_stream"]["avg_ms"], results["modes"]["early"]["avg_ms"]
+    print(f"\nGiảm độ trễ đầu-cuối: {baseline - early:.1f} ms ({(baseline - early) / baseline:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Đánh giá bộ phân loại ý định cục bộ trên tập có nhãn benchmarks/intent_eval_set.json
+(lấy từ các ví dụ trong prompt của services/search, services/weather và các câu thường gặp).
+Báo cáo độ chính xác trên các câu được quyết định tại chỗ, số lần gọi LLM tiết kiệm được,
+độ tin cậy so với độ chính xác thực tế theo từng quy tắc và thời gian phân loại.
+
+Sử dụng:
+    python -m benchmarks.eval_intent_classifier
+    python -m benchmarks.eval_intent_classifier --threshold 0.9 --show-errors
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import argparse
+from collections import defaultdict
+
+from config.settings import INTENT_LOCAL_CONFIDENCE
+from services.intent.local_classifier import local_intent_classifier
+
+EVAL_SET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_eval_set.json")
+
+
+def evaluate(examples, threshold: float) -> dict:
+    decided = correct = 0
+    errors = []
+    per_rule = defaultdict(lambda: {"count": 0, "correct": 0, "confidence": 0.0})
+    for example in examples:
+        decision = local_intent_classifier.classify(example["query"])
+        ok = decision.label == example["label"]
+        rule = per_rule[decision.rule]
+        rule["count"] += 1
+        rule["correct"] += ok
+        rule["confidence"] = decision.confidence
+        if decision.confidence >= threshold:
+            decided += 1
+            correct += ok
+            if not ok:
+                errors.append((example["query"], example["label"], decision.label, decision.rule))
+    return {"decided": decided, "correct": correct, "errors": errors, "per_rule": dict(per_rule)}
+
+
+def time_per_query_us(examples, repeat: int = 200) -> float:
+    queries = [example["query"] for example in examples]
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            local_intent_classifier.classify(query)
+    return (time.perf_counter() - started) / (repeat * len(queries)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threshold", type=float, default=INTENT_LOCAL_CONFIDENCE)
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+
+    with open(EVAL_SET_PATH, "r", encoding="utf-8") as f:
+        examples = json.load(f)
+    total = len(examples)
+    result = evaluate(examples, args.threshold)
+    escalated = total - result["decided"]
+
+    print(f"Tập đánh giá: {total} câu, ngưỡng tin cậy {args.threshold}")
+    print(f"Quyết định tại chỗ: {result['decided']}/{total} ({result['decided'] / total:.0%}), "
+          f"đúng {result['correct']}/{result['decided']} "
+          f"({result['correct'] / max(1, result['decided']):.1%})")
+    print(f"Chuyển lên LLM: {escalated}")
+    # Router hợp nhất: 1 lần gọi/câu; ba bộ phân loại tuần tự: tối đa 3 lần gọi/câu
+    print(f"Số lần gọi LLM phân loại: {escalated} thay vì {total} (router hợp nhất), "
+          f"tối đa {3 * total} (ba bộ phân loại tuần tự)")
+    print(f"Thời gian phân loại cục bộ: {time_per_query_us(examples):.1f} µs/câu\n")
+
+    print(f"{'rule':>24}{'conf':>7}{'n':>5}{'accuracy':>10}")
+    for rule, stats in sorted(result["per_rule"].items(), key=lambda item: -item[1]["confidence"]):
+        print(f"{rule:>24}{stats['confidence']:>7.2f}{stats['count']:>5}{stats['correct'] / stats['count']:>10.0%}")
+
+    if args.show_errors and result["errors"]:
+        print("\nSai (trong các câu quyết định tại chỗ):")
+        for query, expected, got, rule in result["errors"]:
+            print(f"  {query!r}: nhãn {expected}, dự đoán {got} ({rule})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Load test chế độ nhiều worker: chạy `uvicorn app:app --workers N` với
+MULTIPROCESS_STORAGE_ENABLED=true trên một DATA_DIR tạm, bắn song song các
+request ghi (POST /notes và POST /session) rồi kiểm tra không mất bản ghi nào.
+
+Sử dụng:
+    python -m benchmarks.load_multiworker --workers 1 2 4 --requests 400 --concurrency 16
+    python -m benchmarks.load_multiworker --engine sqlite
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(method: str, url: str, payload=None):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        return resp.status, json.loads(resp.read().decode("utf-8"))
+
+
+def wait_ready(base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            request("GET", base_url + "/")
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server {base_url} không khởi động được trong {timeout}s")
+
+
+def run(workers: int, total: int, concurrency: int, engine: str) -> dict:
+    data_dir = tempfile.mkdtemp(prefix=f"load_{workers}w_")
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, "DATA_DIR": data_dir, "STORAGE_ENGINE": engine,
+           "MULTIPROCESS_STORAGE_ENABLED": "true", "DATA_JOURNAL_ENABLED": "false"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(base_url)
+
+        def one(i: int) -> bool:
+            try:
+                if i % 4 == 3:
+                    status, _ = request("POST", base_url + "/session")
+                else:
+                    status, _ = request("POST", base_url + "/notes/notes?member_id=load",
+                                        {"title": f"Ghi chú {i}", "content": f"Nội dung {i}", "tags": ["load"]})
+                return status == 200
+            except Exception:
+                return False
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(total)))
+        elapsed = time.perf_counter() - started
+
+        expected_notes = sum(1 for i, ok in enumerate(results) if ok and i % 4 != 3)
+        expected_sessions = sum(1 for i, ok in enumerate(results) if ok and i % 4 == 3)
+        # Mỗi worker phải thấy được toàn bộ dữ liệu do các worker khác ghi
+        seen_notes = max(len(request("GET", base_url + "/notes/notes?member_id=load")[1]) for _ in range(workers * 2))
+        seen_sessions = max(len(request("GET", base_url + "/sessions")[1]) for _ in range(workers * 2))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    return {
+        "workers": workers,
+        "ok": sum(results),
+        "failed": total - sum(results),
+        "req_per_s": total / elapsed,
+        "lost_notes": expected_notes - seen_notes,
+        "lost_sessions": expected_sessions - seen_sessions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--engine", choices=["json", "sqlite"], default="json")
+    args = parser.parse_args()
+
+    print(f"Engine: {args.engine}, {args.requests} request ghi, concurrency {args.concurrency}, CPU: {os.cpu_count()}\n")
+    print(f"{'workers':>8}{'req/s':>10}{'ok':>8}{'failed':>8}{'lost notes':>12}{'lost sessions':>15}")
+    for workers in args.workers:
+        r = run(workers, args.requests, args.concurrency, args.engine)
+        print(f"{r['workers']:>8}{r['req_per_s']:>10.1f}{r['ok']:>8}{r['failed']:>8}{r['lost_notes']:>12}{r['lost_sessions']:>15}")
+
+
+if __name__ == "__main__":
+    main()
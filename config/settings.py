@@ -13,7 +13,66 @@ FAMILY_DATA_FILE = os.path.join(DATA_DIR, "family_data.json")
 EVENTS_DATA_FILE = os.path.join(DATA_DIR, "events_data.json")
 NOTES_DATA_FILE = os.path.join(DATA_DIR, "notes_data.json")
 CHAT_HISTORY_FILE = os.path.join(DATA_DIR, "chat_history.json")
-SESSIONS_DATA_FILE = os.path.join(DATA_DIR, "sessions_data.json")
+SESSIONS_DATA_FILE = os.path.join(DATA_DIR, "sessions_data.json") # Định dạng cũ, chỉ dùng để chuyển đổi
+SESSIONS_DIR = os.path.join(DATA_DIR, "sessions") # Mỗi session một file + index.json
+BLOBS_DIR = os.path.join(DATA_DIR, "blobs") # Ảnh/audio định địa chỉ theo SHA-256, message chỉ giữ tham chiếu
+# Tổng dung lượng (bytes) data URL đã dựng lại từ blob được giữ trong bộ nhớ (LRU, 0 = không cache)
+BLOB_RESOLVE_CACHE_MAX_BYTES = int(os.getenv("BLOB_RESOLVE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# --- Session Persistence Settings ---
+# Session được đánh dấu "dirty" và ghi xuống đĩa theo lô bởi flusher nền
+SESSION_FLUSH_INTERVAL_SECONDS = float(os.getenv("SESSION_FLUSH_INTERVAL_SECONDS", "2.0"))
+SESSION_FLUSH_MAX_DIRTY = int(os.getenv("SESSION_FLUSH_MAX_DIRTY", "50"))
+
+# Cache session trong bộ nhớ: tối đa SESSION_CACHE_MAX_SESSIONS session (LRU), session không được
+# truy cập quá SESSION_CACHE_IDLE_TTL_SECONDS bị ghi xuống shard và bỏ khỏi bộ nhớ.
+# Sweeper nền chạy mỗi SESSION_SWEEP_INTERVAL_SECONDS, đồng thời xóa session không hoạt động
+# quá SESSION_RETENTION_DAYS ngày (0 = không tự xóa).
+SESSION_CACHE_MAX_SESSIONS = int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "500"))
+SESSION_CACHE_IDLE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_IDLE_TTL_SECONDS", "1800"))
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "300"))
+SESSION_RETENTION_DAYS = int(os.getenv("SESSION_RETENTION_DAYS", "30"))
+
+# --- Persistence Settings ---
+# Codec khi ghi file: "json" (indent=2), "json-compact" hoặc "msgpack" (cần cài msgpack).
+# Khi đọc, định dạng được tự nhận diện nên file cũ vẫn mở được.
+DATA_CODEC = os.getenv("DATA_CODEC", "json").lower()
+
+# Storage engine cho family/events/notes/chat_history: "json" (file JSON) hoặc "sqlite"
+STORAGE_ENGINE = os.getenv("STORAGE_ENGINE", "json").lower()
+SQLITE_DB_FILE = os.getenv("SQLITE_DB_FILE", os.path.join(DATA_DIR, "family_assistant.db"))
+
+# Chế độ journal: mỗi thay đổi được append thành một dòng vào <file>.journal
+# thay vì ghi lại toàn bộ file JSON; snapshot được compact ở luồng nền.
+DATA_JOURNAL_ENABLED = os.getenv("DATA_JOURNAL_ENABLED", "false").lower() in ("1", "true", "yes")
+JOURNAL_COMPACT_THRESHOLD_BYTES = int(os.getenv("JOURNAL_COMPACT_THRESHOLD_BYTES", str(4 * 1024 * 1024)))
+
+# Chạy nhiều worker (uvicorn --workers N) trên cùng DATA_DIR: mỗi lần ghi được thực hiện
+# dưới khóa file liên process (merge theo key với dữ liệu trên đĩa), mỗi request kiểm tra
+# thay đổi từ worker khác để làm mới cache/index. Journal không dùng được ở chế độ này.
+MULTIPROCESS_STORAGE_ENABLED = os.getenv("MULTIPROCESS_STORAGE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Tự tải lại file dữ liệu khi bị sửa từ bên ngoài: chu kỳ kiểm tra (giây), 0 = tắt.
+# Có thể tải lại thủ công qua POST /admin/reload (header X-Admin-Token nếu đặt ADMIN_API_TOKEN).
+DATA_RELOAD_WATCH_INTERVAL_SECONDS = float(os.getenv("DATA_RELOAD_WATCH_INTERVAL_SECONDS", "0"))
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
+
+# --- Context Window Settings ---
+# Giữ nguyên văn N lượt hội thoại gần nhất; các lượt cũ hơn được thay bằng tóm tắt cuốn chiếu.
+# Prompt gửi cho LLM được giới hạn trong CONTEXT_TOKEN_BUDGET token (ước lượng).
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "6"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "300"))
+
+# --- Token Budget ---
+# Token được đếm tại chỗ (tiktoken nếu đã cài, nếu không thì ước lượng theo từ/âm tiết).
+# CONTEXT_TOKEN_BUDGET được chia cho system prompt, ngữ cảnh truy xuất (tìm kiếm/thời tiết, tối thiểu
+# RETRIEVED_CONTEXT_TOKENS) và lịch sử; max_tokens của mỗi lần gọi không vượt phần còn lại của MODEL_CONTEXT_TOKENS.
+MODEL_CONTEXT_TOKENS = int(os.getenv("MODEL_CONTEXT_TOKENS", "128000"))
+RETRIEVED_CONTEXT_TOKENS = int(os.getenv("RETRIEVED_CONTEXT_TOKENS", "1500"))
+# Nội dung trang web đưa vào bước tổng hợp kết quả tìm kiếm (mỗi nguồn / tổng cộng)
+SEARCH_SOURCE_MAX_TOKENS = int(os.getenv("SEARCH_SOURCE_MAX_TOKENS", "1000"))
+SEARCH_CONTEXT_MAX_TOKENS = int(os.getenv("SEARCH_CONTEXT_MAX_TOKENS", "3750"))
 
 # Thư mục lưu trữ tạm thời
 TEMP_DIR = os.path.join(DATA_DIR, "temp_files")
@@ -26,6 +85,62 @@ OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
 
 openai_model = "gpt-4o-mini"  # Or your preferred model supporting Tool Calling
 
+# --- LLM Client Pool ---
+# Một AsyncOpenAI dùng chung cho mỗi API key (giữ kết nối keep-alive), tối đa
+# LLM_CLIENT_POOL_SIZE key; mỗi client giới hạn LLM_MAX_CONNECTIONS kết nối đồng thời.
+LLM_CLIENT_POOL_SIZE = int(os.getenv("LLM_CLIENT_POOL_SIZE", "16"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# --- Intent Router ---
+# "unified": một lần gọi LLM phân loại cùng lúc tư vấn thời tiết/thời tiết/tìm kiếm;
+# "concurrent": chạy song song ba bộ phân loại cũ và hủy các bộ còn lại khi đã có kết quả;
+# "sequential": ba bộ phân loại lần lượt (hành vi cũ).
+INTENT_ROUTER_MODE = os.getenv("INTENT_ROUTER_MODE", "unified").lower()
+# Bộ phân loại cục bộ (quy tắc) quyết định trước; chỉ câu có độ tin cậy thấp hơn ngưỡng mới gọi LLM
+INTENT_LOCAL_ENABLED = os.getenv("INTENT_LOCAL_ENABLED", "true").lower() in ("1", "true", "yes")
+INTENT_LOCAL_CONFIDENCE = float(os.getenv("INTENT_LOCAL_CONFIDENCE", "0.85"))
+# Cache kết quả phân loại bằng LLM (khóa: câu hỏi đã chuẩn hóa + ngày hiện tại), dùng chung mọi session
+INTENT_CACHE_MAX_ENTRIES = int(os.getenv("INTENT_CACHE_MAX_ENTRIES", "2000"))
+INTENT_CACHE_TTL_SECONDS = float(os.getenv("INTENT_CACHE_TTL_SECONDS", "3600"))
+
+# --- Answer Cache ---
+# Câu trả lời cho câu hỏi tra cứu (thời tiết, tìm kiếm, phong thủy) được dùng lại trong TTL của nguồn.
+# ANSWER_CACHE_HOUSEHOLD=true: dùng chung giữa mọi session của gia đình, không chỉ trong một session.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_HOUSEHOLD = os.getenv("ANSWER_CACHE_HOUSEHOLD", "false").lower() in ("1", "true", "yes")
+ANSWER_CACHE_MAX_SESSION_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_SESSION_ENTRIES", "20"))
+ANSWER_CACHE_MAX_HOUSEHOLD_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_HOUSEHOLD_ENTRIES", "500"))
+ANSWER_CACHE_TTL_WEATHER_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_WEATHER_SECONDS", "1800"))
+ANSWER_CACHE_TTL_NEWS_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_NEWS_SECONDS", "600"))
+ANSWER_CACHE_TTL_SEARCH_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SEARCH_SECONDS", "3600"))
+ANSWER_CACHE_TTL_FENG_SHUI_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_FENG_SHUI_SECONDS", "86400"))
+
+# --- Post-Response Stage ---
+# Tóm tắt + lưu lịch sử chạy trên hàng đợi nền có giới hạn (retry với backoff) sau khi đã trả lời;
+# TTS chạy nền, audio lấy qua GET /chat/audio/{audio_id} hoặc frame cuối của /chat/stream.
+POST_RESPONSE_QUEUE_SIZE = int(os.getenv("POST_RESPONSE_QUEUE_SIZE", "200"))
+POST_RESPONSE_WORKERS = int(os.getenv("POST_RESPONSE_WORKERS", "2"))
+POST_RESPONSE_MAX_ATTEMPTS = int(os.getenv("POST_RESPONSE_MAX_ATTEMPTS", "3"))
+POST_RESPONSE_RETRY_DELAY_SECONDS = float(os.getenv("POST_RESPONSE_RETRY_DELAY_SECONDS", "0.5"))
+AUDIO_RESULT_TTL_SECONDS = float(os.getenv("AUDIO_RESULT_TTL_SECONDS", "600"))
+AUDIO_RESULT_MAX_ENTRIES = int(os.getenv("AUDIO_RESULT_MAX_ENTRIES", "200"))
+# Thời gian /chat/stream chờ audio để gửi frame audio cuối
+STREAM_AUDIO_WAIT_SECONDS = float(os.getenv("STREAM_AUDIO_WAIT_SECONDS", "30"))
+# true: /chat chờ TTS và trả audio_response ngay trong response như trước
+CHAT_INLINE_AUDIO = os.getenv("CHAT_INLINE_AUDIO", "false").lower() in ("1", "true", "yes")
+
+# --- Tool Scheduler ---
+# Tool call chạy trên event loop (call cùng event_id/member_id chạy tuần tự). Thay đổi dữ liệu được gom
+# lại và ghi một lần cho mỗi file sau khi cả lượt chạy xong; TOOL_EXECUTOR_WORKERS luồng ghi các file
+# song song ngoài event loop. TOOL_EXECUTOR_WORKERS=0: ghi ngay trên event loop.
+TOOL_EXECUTOR_WORKERS = int(os.getenv("TOOL_EXECUTOR_WORKERS", "4"))
+# /chat/stream: chạy mỗi tool ngay khi arguments của nó trong stream đã là JSON hợp lệ,
+# song song với phần còn lại của câu trả lời (false: chờ model stream xong như trước)
+TOOL_EARLY_DISPATCH = os.getenv("TOOL_EARLY_DISPATCH", "true").lower() in ("1", "true", "yes")
+
 # --- Domains ---
 VIETNAMESE_NEWS_DOMAINS = [
     "vnexpress.net", "tuoitre.vn", "thanhnien.vn", "vietnamnet.vn", "vtv.vn",
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import time
+import datetime
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from config.settings import (
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_HOUSEHOLD, ANSWER_CACHE_MAX_SESSION_ENTRIES,
+    ANSWER_CACHE_MAX_HOUSEHOLD_ENTRIES, ANSWER_CACHE_TTL_WEATHER_SECONDS, ANSWER_CACHE_TTL_NEWS_SECONDS,
+    ANSWER_CACHE_TTL_SEARCH_SECONDS, ANSWER_CACHE_TTL_FENG_SHUI_SECONDS,
+)
+from config.logging_config import logger
+from core.datetime_handler import DateTimeHandler
+from services.intent.intent_cache import cache_key_text
+
+# Slot trong session lưu câu trả lời đã cache: {key: {"answer", "kind", "expires_at"}}
+SESSION_CACHE_KEY = "question_cache"
+
+
+def answer_kind(intent: Optional[Dict[str, Any]], weather_enabled: bool, search_enabled: bool) -> Optional[str]:
+    """Loại nguồn dữ liệu của câu hỏi (quyết định TTL); None nếu không phải câu hỏi tra cứu."""
+    if not intent:
+        return None
+    if weather_enabled and intent.get("is_advice_query"):
+        return f"advice:{intent.get('advice_type') or 'general'}"
+    if weather_enabled and intent.get("is_weather_query"):
+        return "weather"
+    if search_enabled and intent.get("need_search"):
+        if intent.get("is_feng_shui_query"):
+            return "feng_shui"
+        return "news" if intent.get("is_news_query") else "search"
+    return None
+
+
+class AnswerCache:
+    """
+    Cache câu trả lời cho các lượt hỏi tra cứu (thời tiết, tư vấn theo thời tiết, tìm kiếm,
+    phong thủy). Khóa gồm loại ý định, địa điểm, ngày đã quy đổi và câu hỏi đã chuẩn hóa;
+    TTL theo độ "tươi" của nguồn. Lưu trong session["question_cache"] và (tùy chọn) trong
+    một cache chung cho cả gia đình.
+    """
+
+    def __init__(self, enabled: bool = ANSWER_CACHE_ENABLED, household: bool = ANSWER_CACHE_HOUSEHOLD,
+                 max_session_entries: int = ANSWER_CACHE_MAX_SESSION_ENTRIES,
+                 max_household_entries: int = ANSWER_CACHE_MAX_HOUSEHOLD_ENTRIES):
+        self.enabled = enabled
+        self.household = household
+        self.max_session_entries = max(1, max_session_entries)
+        self.max_household_entries = max(1, max_household_entries)
+        self.ttl_by_source = {
+            "weather": ANSWER_CACHE_TTL_WEATHER_SECONDS,
+            "news": ANSWER_CACHE_TTL_NEWS_SECONDS,
+            "search": ANSWER_CACHE_TTL_SEARCH_SECONDS,
+            "feng_shui": ANSWER_CACHE_TTL_FENG_SHUI_SECONDS,
+        }
+        self._household: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.metrics = {
+            "session_hits": 0,
+            "household_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "stores": 0,
+        }
+
+    @staticmethod
+    def source_of(kind: str) -> str:
+        return "weather" if kind.startswith("advice:") else kind
+
+    def ttl_for(self, kind: str) -> float:
+        return self.ttl_by_source.get(self.source_of(kind), ANSWER_CACHE_TTL_SEARCH_SECONDS)
+
+    def make_key(self, intent: Optional[Dict[str, Any]], query: str, weather_enabled: bool, search_enabled: bool,
+                 lat: Optional[float] = None, lon: Optional[float] = None) -> Optional[str]:
+        """Khóa cache cho lượt hỏi; None nếu lượt này không được cache."""
+        if not self.enabled or not query:
+            return None
+        kind = answer_kind(intent, weather_enabled, search_enabled)
+        if kind is None:
+            return None
+        target_date = None
+        if intent.get("date_description"):
+            target_date = DateTimeHandler.parse_date(intent["date_description"])
+        target_date = target_date or datetime.date.today()
+        place = intent.get("location") or ""
+        if self.source_of(kind) == "weather" and lat is not None and lon is not None:
+            # Thời tiết theo tọa độ thiết bị khi câu hỏi không nêu địa điểm cụ thể
+            place = f"{place}@{lat:.2f},{lon:.2f}"
+        return "|".join([kind, place.lower(), target_date.isoformat(), cache_key_text(query)])
+
+    def _lookup(self, store: Dict[str, Any], key: str) -> Optional[str]:
+        entry = store.get(key)
+        if entry is None:
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            store.pop(key, None)
+            self.metrics["expired"] += 1
+            return None
+        return entry.get("answer")
+
+    def get(self, session: Dict[str, Any], key: Optional[str]) -> Optional[str]:
+        """Câu trả lời còn hạn cho `key` (session trước, sau đó cache chung của gia đình)."""
+        if key is None:
+            return None
+        session_store = session.setdefault(SESSION_CACHE_KEY, {})
+        answer = self._lookup(session_store, key)
+        if answer is not None:
+            self.metrics["session_hits"] += 1
+            return answer
+        if self.household:
+            answer = self._lookup(self._household, key)
+            if answer is not None:
+                self._household.move_to_end(key)
+                self.metrics["household_hits"] += 1
+                return answer
+        self.metrics["misses"] += 1
+        return None
+
+    def put(self, session: Dict[str, Any], key: Optional[str], answer: Optional[str]) -> None:
+        if key is None or not answer:
+            return
+        kind = key.split("|", 1)[0]
+        entry = {"answer": answer, "kind": kind, "expires_at": time.time() + self.ttl_for(kind)}
+        session_store = session.setdefault(SESSION_CACHE_KEY, {})
+        now = time.time()
+        for stale in [k for k, v in session_store.items() if v.get("expires_at", 0) < now]:
+            del session_store[stale]
+        session_store.pop(key, None)
+        session_store[key] = entry
+        while len(session_store) > self.max_session_entries:
+            session_store.pop(next(iter(session_store)))
+        if self.household:
+            self._household[key] = entry
+            self._household.move_to_end(key)
+            while len(self._household) > self.max_household_entries:
+                self._household.popitem(last=False)
+        self.metrics["stores"] += 1
+        logger.info(f"Đã cache câu trả lời ({kind}, TTL {self.ttl_for(kind):.0f}s)")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        hits = self.metrics["session_hits"] + self.metrics["household_hits"]
+        lookups = hits + self.metrics["misses"]
+        return {
+            **self.metrics,
+            "enabled": self.enabled,
+            "household": self.household,
+            "household_size": len(self._household),
+            "ttl_seconds": self.ttl_by_source,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Singleton instance
+answer_cache = AnswerCache()
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+from typing import Dict, Any, List, Optional, Tuple
+
+from config.settings import (
+    openai_model, CONTEXT_KEEP_TURNS, CONTEXT_SUMMARY_MAX_TOKENS,
+)
+from config.logging_config import logger
+from core.token_budget import token_counter, budget_manager
+from database.blob_store import blob_store
+from services.llm.client_pool import llm_clients
+
+# Khóa trong session lưu tóm tắt cuốn chiếu: {"text": ..., "covered": số message đầu đã được tóm tắt}
+SUMMARY_SESSION_KEY = "context_summary"
+
+def estimate_tokens(message: Dict[str, Any]) -> int:
+    """Số token của một message OpenAI, đếm tại chỗ (xem core.token_budget)."""
+    return token_counter.count_message(message)
+
+
+def to_api_message(msg: Dict[str, Any]) -> Dict[str, Any]:
+    """Chuyển message trong session sang dạng gửi cho OpenAI API."""
+    message_for_api = {
+        "role": msg["role"],
+        **({"tool_calls": msg["tool_calls"]} if msg.get("tool_calls") else {}),
+        **({"tool_call_id": msg.get("tool_call_id")} if msg.get("tool_call_id") else {}),
+    }
+    msg_content = msg.get("content")
+    if isinstance(msg_content, (list, str)):
+        message_for_api["content"] = msg_content
+    elif msg.get("role") == "tool":
+        message_for_api["content"] = str(msg_content) if msg_content is not None else ""
+    else:
+        message_for_api["content"] = ""
+    return message_for_api
+
+
+def split_turns(messages: List[Dict[str, Any]]) -> List[int]:
+    """
+    Vị trí bắt đầu của từng lượt hội thoại. Một lượt bắt đầu ở mỗi tin nhắn user
+    và gồm mọi assistant/tool phía sau, nên cặp tool_call/tool luôn nằm chung một lượt.
+    """
+    starts = [i for i, msg in enumerate(messages) if msg.get("role") == "user"]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return starts
+
+
+def repair_tool_pairs(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Bỏ message tool không có tool_call tương ứng và bỏ tool_calls chưa có kết quả,
+    để cửa sổ gửi đi luôn hợp lệ với API (vd. lịch sử do client gửi lên bị cắt dở).
+    """
+    answered = {msg.get("tool_call_id") for msg in messages if msg.get("role") == "tool"}
+    repaired: List[Dict[str, Any]] = []
+    open_calls: set = set()
+    for msg in messages:
+        if msg.get("role") == "tool":
+            if msg.get("tool_call_id") in open_calls:
+                repaired.append(msg)
+            continue
+        if msg.get("tool_calls"):
+            call_ids = {tc.get("id") for tc in msg["tool_calls"] if isinstance(tc, dict)}
+            if call_ids and call_ids <= answered:
+                open_calls = call_ids
+                repaired.append(msg)
+                continue
+            # tool_calls không đầy đủ kết quả: chỉ giữ phần nội dung text (nếu có)
+            open_calls = set()
+            if msg.get("content"):
+                repaired.append({k: v for k, v in msg.items() if k != "tool_calls"})
+            continue
+        open_calls = set()
+        repaired.append(msg)
+    return repaired
+
+
+def _transcript(messages: List[Dict[str, Any]], max_chars_per_message: int = 400) -> str:
+    lines = []
+    for msg in messages:
+        role = msg.get("role")
+        content = msg.get("content")
+        text = ""
+        if isinstance(content, str):
+            text = content
+        elif isinstance(content, list):
+            text = " ".join(item.get("text", "") for item in content
+                            if isinstance(item, dict) and item.get("type") == "text")
+        if role == "tool":
+            text = f"[Kết quả tool {msg.get('name')}: {str(content)[:120]}]"
+        elif msg.get("tool_calls"):
+            names = ", ".join(tc.get("function", {}).get("name", "?") for tc in msg["tool_calls"] if isinstance(tc, dict))
+            text = (text + f" [Gọi tool: {names}]").strip()
+        if role and text:
+            lines.append(f"{role.capitalize()}: {text.strip()[:max_chars_per_message]}")
+    return "\n".join(lines)
+
+
+class ContextWindowManager:
+    """
+    Giữ nguyên văn N lượt hội thoại gần nhất và thay các lượt cũ hơn bằng một bản
+    tóm tắt cuốn chiếu (lưu trong session, chỉ tóm tắt thêm phần mới bị đẩy ra),
+    sao cho prompt không vượt quá ngân sách token của budget_manager.
+    """
+
+    def __init__(self, keep_turns: int = CONTEXT_KEEP_TURNS, summary_max_tokens: int = CONTEXT_SUMMARY_MAX_TOKENS):
+        self.keep_turns = max(1, keep_turns)
+        self.summary_max_tokens = summary_max_tokens
+        self.metrics = {
+            "requests": 0,
+            "tokens_full_total": 0,
+            "tokens_sent_total": 0,
+            "tokens_saved_total": 0,
+            "summaries_generated": 0,
+            "summary_failures": 0,
+        }
+
+    def _summary_message(self, summary_text: str) -> Dict[str, Any]:
+        return {"role": "system", "content": f"Tóm tắt phần hội thoại trước đó: {summary_text}"}
+
+    async def _extend_summary(self, previous: str, evicted: List[Dict[str, Any]], api_key: str) -> str:
+        """Gộp tóm tắt cũ với các message vừa bị đẩy khỏi cửa sổ."""
+        transcript = _transcript(evicted)
+        if not transcript:
+            return previous
+        transcript = budget_manager.fit_input("context_summary", transcript, keep_end=True)
+        try:
+            client = llm_clients.get(api_key)
+            summary_messages = [
+                {"role": "system", "content": (
+                    "Cập nhật bản tóm tắt cuộc trò chuyện bằng tiếng Việt. Giữ lại các sự kiện, "
+                    "thông tin thành viên, quyết định và yêu cầu còn dang dở; bỏ chi tiết thừa. "
+                    "Chỉ trả về bản tóm tắt mới.")},
+                {"role": "user", "content": f"Tóm tắt hiện tại:\n{previous or '(chưa có)'}\n\nPhần hội thoại mới:\n{transcript}"},
+            ]
+            estimated_prompt = token_counter.count_messages(summary_messages)
+            max_tokens = budget_manager.max_tokens("context_summary", estimated_prompt, cap=self.summary_max_tokens)
+            response = await client.chat.completions.create(
+                model=openai_model,
+                messages=summary_messages,
+                temperature=0.2,
+                max_tokens=max_tokens,
+            )
+            budget_manager.record("context_summary", estimated_prompt, response.usage, max_tokens)
+            self.metrics["summaries_generated"] += 1
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            # Không gọi được LLM: ghép bản trích ngắn để không mất ngữ cảnh
+            self.metrics["summary_failures"] += 1
+            logger.error(f"Lỗi khi tạo tóm tắt cuốn chiếu: {e}", exc_info=True)
+            fallback = (previous + "\n" + _transcript(evicted, max_chars_per_message=120)).strip()
+            return token_counter.truncate(fallback, self.summary_max_tokens, keep_end=True)
+
+    async def build_messages(self, session: Dict[str, Any], system_prompt: str,
+                             api_key: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Tạo danh sách message gửi cho OpenAI từ session["messages"].
+        Returns (openai_messages, stats) với stats gồm số token của prompt đầy đủ,
+        của prompt thực gửi và số token tiết kiệm được.
+        """
+        messages = session.get("messages") or []
+        api_messages = [to_api_message(msg) for msg in messages]
+        costs = [estimate_tokens(msg) for msg in api_messages]
+        system_message = {"role": "system", "content": system_prompt}
+        system_cost = estimate_tokens(system_message)
+        full_tokens = system_cost + sum(costs)
+
+        summary_state = session.get(SUMMARY_SESSION_KEY) or {}
+        covered = summary_state.get("covered", 0)
+        summary_text = summary_state.get("text", "")
+        if covered > len(messages):
+            # Lịch sử đã bị thay (vd. client gửi lại lịch sử): tóm tắt cũ không còn đúng
+            covered, summary_text = 0, ""
+
+        turn_starts = split_turns(messages) if messages else [0]
+        first_kept = max(0, len(turn_starts) - self.keep_turns)
+        # Không đưa lại nguyên văn những gì đã nằm trong tóm tắt
+        while first_kept < len(turn_starts) - 1 and turn_starts[first_kept] < covered:
+            first_kept += 1
+
+        summary_cost = estimate_tokens(self._summary_message(summary_text)) + self.summary_max_tokens
+        history_budget = budget_manager.history_budget(system_cost)
+        # Thu hẹp cửa sổ tới khi vừa ngân sách; luôn giữ lượt hiện tại
+        while first_kept < len(turn_starts) - 1 and \
+                summary_cost + sum(costs[turn_starts[first_kept]:]) > history_budget:
+            first_kept += 1
+
+        start = turn_starts[first_kept] if messages else 0
+        if start > covered:
+            summary_text = await self._extend_summary(summary_text, api_messages[covered:start], api_key)
+            covered = start
+            session[SUMMARY_SESSION_KEY] = {"text": summary_text, "covered": covered}
+
+        openai_messages = [system_message]
+        if start > 0 and summary_text:
+            openai_messages.append(self._summary_message(summary_text))
+        # Tham chiếu blob chỉ được đổi thành data URL cho phần thực sự gửi đi
+        openai_messages.extend(blob_store.resolve_message(msg) for msg in repair_tool_pairs(api_messages[start:]))
+
+        sent_tokens = sum(estimate_tokens(msg) for msg in openai_messages)
+        stats = {
+            "full_tokens": full_tokens,
+            "sent_tokens": sent_tokens,
+            "tokens_saved": max(0, full_tokens - sent_tokens),
+            "summarized_messages": start,
+            "kept_messages": len(messages) - start,
+        }
+        self.metrics["requests"] += 1
+        self.metrics["tokens_full_total"] += full_tokens
+        self.metrics["tokens_sent_total"] += sent_tokens
+        self.metrics["tokens_saved_total"] += stats["tokens_saved"]
+        logger.info(f"Context window: {sent_tokens}/{full_tokens} token (tiết kiệm {stats['tokens_saved']}), "
+                    f"tóm tắt {start} message, giữ {stats['kept_messages']} message")
+        return openai_messages, stats
+
+
+# Singleton instance
+context_window = ContextWindowManager()
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import time
+import asyncio
+from typing import Dict, Any, Optional
+
+from config.settings import DATA_RELOAD_WATCH_INTERVAL_SECONDS
+from config.logging_config import logger
+from database.data_manager import read_changed_stores, apply_store_contents
+
+
+class DataReloader:
+    """
+    Tải lại dữ liệu khi file bị sửa từ bên ngoài mà không cần khởi động lại.
+    Việc đọc/giải mã file chạy ở thread riêng; việc thay nội dung container
+    (tại chỗ) và rebuild index chạy trên event loop nên request đang xử lý
+    luôn thấy trạng thái nhất quán.
+    """
+
+    def __init__(self, watch_interval: float = DATA_RELOAD_WATCH_INTERVAL_SECONDS):
+        self.watch_interval = watch_interval
+        self._watch_task: Optional[asyncio.Task] = None
+        self._reload_lock: Optional[asyncio.Lock] = None
+        self.metrics = {
+            "reload_count": 0,
+            "files_reloaded_total": 0,
+            "last_reload_ms": 0.0,
+            "last_reload_at": None,
+        }
+
+    async def reload(self, force: bool = True, include_sessions: bool = True) -> Dict[str, Any]:
+        """
+        Tải lại các file dữ liệu (tất cả nếu force, ngược lại chỉ file đã thay đổi),
+        rebuild index và (tùy chọn) đọc lại index session.
+        """
+        from core.session_manager import session_manager
+
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        async with self._reload_lock:
+            started = time.perf_counter()
+            loaded = await asyncio.to_thread(read_changed_stores, force)
+            changed = apply_store_contents(loaded)
+            sessions_dropped = session_manager.reload() if include_sessions else 0
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            self.metrics["reload_count"] += 1
+            self.metrics["files_reloaded_total"] += len(changed)
+            self.metrics["last_reload_ms"] = round(elapsed_ms, 3)
+            self.metrics["last_reload_at"] = time.time()
+            if changed:
+                logger.info(f"Đã tải lại {len(changed)} file dữ liệu trong {elapsed_ms:.1f} ms: {changed}")
+            return {
+                "changed_files": changed,
+                "sessions_dropped": sessions_dropped,
+                "elapsed_ms": round(elapsed_ms, 3),
+            }
+
+    async def _watch_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            try:
+                await self.reload(force=False, include_sessions=False)
+            except Exception as e:
+                logger.error(f"Lỗi khi kiểm tra/tải lại file dữ liệu: {e}", exc_info=True)
+
+    @property
+    def watcher_running(self) -> bool:
+        return self._watch_task is not None and not self._watch_task.done()
+
+    async def start_watcher(self) -> None:
+        """Khởi động watcher nền nếu DATA_RELOAD_WATCH_INTERVAL_SECONDS > 0."""
+        if self.watch_interval <= 0 or self.watcher_running:
+            return
+        self._reload_lock = asyncio.Lock()
+        self._watch_task = asyncio.create_task(self._watch_loop())
+        logger.info(f"Data watcher đã khởi động (interval={self.watch_interval}s)")
+
+    async def stop_watcher(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+
+# Singleton instance
+data_reloader = DataReloader()
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple, Callable, Awaitable
+
+from config.settings import (
+    POST_RESPONSE_QUEUE_SIZE, POST_RESPONSE_WORKERS, POST_RESPONSE_MAX_ATTEMPTS,
+    POST_RESPONSE_RETRY_DELAY_SECONDS, AUDIO_RESULT_TTL_SECONDS, AUDIO_RESULT_MAX_ENTRIES,
+)
+from config.logging_config import logger
+from services.multimedia.audio_service import text_to_speech_google
+
+# Job nền nhận cờ final_attempt (lần thử cuối: chấp nhận kết quả dự phòng thay vì raise để thử lại)
+PostResponseJob = Callable[[bool], Awaitable[None]]
+
+
+class PostResponseQueue:
+    """
+    Hàng đợi có giới hạn cho việc sau khi đã trả lời (tóm tắt, lưu lịch sử), xử lý bởi
+    một nhóm worker asyncio với retry + backoff. Các job cùng `key` (vd. session_id)
+    chạy tuần tự theo thứ tự gửi để lịch sử dạng delta luôn được ghi đúng thứ tự.
+    Hàng đợi đầy thì job chạy ngay trong request (không bỏ dữ liệu).
+    """
+
+    def __init__(self, maxsize: int = POST_RESPONSE_QUEUE_SIZE, workers: int = POST_RESPONSE_WORKERS,
+                 max_attempts: int = POST_RESPONSE_MAX_ATTEMPTS, retry_delay: float = POST_RESPONSE_RETRY_DELAY_SECONDS):
+        self.maxsize = max(1, maxsize)
+        self.worker_count = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._tails: Dict[str, asyncio.Future] = {}
+        self.metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "retries": 0,
+            "ran_inline": 0,
+        }
+
+    def _ensure_started(self) -> None:
+        if self._workers and all(not worker.done() for worker in self._workers):
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        logger.info(f"Post-response queue đã khởi động ({self.worker_count} worker, tối đa {self.maxsize} job)")
+
+    async def start(self) -> None:
+        self._ensure_started()
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """Chờ xử lý hết job còn trong hàng đợi (tối đa `timeout` giây) rồi dừng worker."""
+        if self._queue is not None and self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Post-response queue còn {self._queue.qsize()} job chưa xử lý khi tắt.")
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+
+    async def submit(self, name: str, job: PostResponseJob, key: Optional[str] = None) -> None:
+        """Đưa job vào hàng đợi; trả về ngay (trừ khi hàng đợi đầy)."""
+        self._ensure_started()
+        previous = self._tails.get(key) if key else None
+        done = asyncio.get_running_loop().create_future()
+        if key:
+            self._tails[key] = done
+        item = (name, job, key, previous, done)
+        self.metrics["submitted"] += 1
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            logger.warning(f"Post-response queue đầy, chạy job '{name}' ngay trong request.")
+            self.metrics["ran_inline"] += 1
+            await self._run(item)
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._run(item)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, item: Tuple) -> None:
+        name, job, key, previous, done = item
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    await job(attempt == self.max_attempts)
+                    self.metrics["completed"] += 1
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if attempt == self.max_attempts:
+                        self.metrics["failed"] += 1
+                        logger.error(f"Job nền '{name}' thất bại sau {attempt} lần: {e}", exc_info=True)
+                        break
+                    self.metrics["retries"] += 1
+                    logger.warning(f"Job nền '{name}' lỗi (lần {attempt}): {e}. Thử lại...")
+                    await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+        finally:
+            if not done.done():
+                done.set_result(None)
+            if key and self._tails.get(key) is done:
+                del self._tails[key]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "max_pending": self.maxsize,
+            "workers": len(self._workers),
+        }
+
+
+class SpeechJobs:
+    """
+    TTS chạy nền sau khi đã trả lời bằng text. Client lấy audio qua GET /chat/audio/{audio_id}
+    (hoặc frame audio cuối của /chat/stream). Kết quả được giữ AUDIO_RESULT_TTL_SECONDS giây.
+    """
+
+    def __init__(self, ttl_seconds: float = AUDIO_RESULT_TTL_SECONDS, max_entries: int = AUDIO_RESULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self._jobs: "OrderedDict[str, Tuple[float, asyncio.Task]]" = OrderedDict()
+        self.metrics = {
+            "started": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "expired": 0,
+        }
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        while self._jobs:
+            audio_id, (created, task) = next(iter(self._jobs.items()))
+            if len(self._jobs) <= self.max_entries and now - created <= self.ttl_seconds:
+                break
+            self._jobs.pop(audio_id)
+            self.metrics["expired"] += 1
+
+    async def _synthesize(self, text: str) -> Optional[str]:
+        audio = await asyncio.to_thread(text_to_speech_google, text)
+        self.metrics["succeeded" if audio else "failed"] += 1
+        return audio
+
+    def start(self, text: str) -> str:
+        """Bắt đầu TTS cho `text` ở nền; trả về audio_id."""
+        self._purge()
+        audio_id = uuid.uuid4().hex
+        self._jobs[audio_id] = (time.monotonic(), asyncio.create_task(self._synthesize(text)))
+        self.metrics["started"] += 1
+        return audio_id
+
+    async def wait(self, audio_id: str, timeout: Optional[float] = None) -> Tuple[str, Optional[str]]:
+        """
+        (status, audio_base64) với status là "ready", "pending" (chưa xong trong `timeout`),
+        "failed" hoặc "unknown" (không có/đã hết hạn).
+        """
+        entry = self._jobs.get(audio_id)
+        if entry is None:
+            return "unknown", None
+        task = entry[1]
+        try:
+            audio = await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            return "pending", None
+        except Exception as e:
+            logger.error(f"Lỗi TTS nền cho {audio_id}: {e}")
+            return "failed", None
+        return ("ready", audio) if audio else ("failed", None)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {**self.metrics, "tracked": len(self._jobs), "ttl_seconds": self.ttl_seconds}
+
+
+# Singleton instance
+post_response_queue = PostResponseQueue()
+speech_jobs = SpeechJobs()
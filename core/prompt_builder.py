@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import json
+import hashlib
+import datetime
+from typing import Dict, Any, Optional, Tuple
+
+from config.settings import FAMILY_DATA_FILE, EVENTS_DATA_FILE, NOTES_DATA_FILE
+from config.logging_config import logger
+from database.data_manager import family_data, events_data, notes_data, store_version
+from database.event_index import event_index
+
+# Persona, công cụ và quy tắc: giống hệt nhau từng byte giữa các request để upstream
+# cache được phần đầu prompt. Không đưa dữ liệu thay đổi (ngày, người dùng...) vào đây.
+STATIC_PREFIX = "\n".join([
+    "Bạn là trợ lý gia đình thông minh, đa năng và thân thiện tên là HGDS. Nhiệm vụ của bạn là giúp quản lý thông tin gia đình, sự kiện, ghi chú, trả lời câu hỏi, tìm kiếm thông tin, phân tích hình ảnh, và cung cấp thông tin thời tiết.",
+    "Giao tiếp tự nhiên, lịch sự và theo phong cách trò chuyện bằng tiếng Việt.",
+    "Sử dụng định dạng HTML đơn giản cho phản hồi văn bản (thẻ p, b, i, ul, li, h3, h4, br).",
+    "Bạn có thể cung cấp thông tin thời tiết và đưa ra lời khuyên dựa trên thời tiết khi được hỏi.",
+    "Ngày hôm nay được ghi ở cuối phần hướng dẫn này.",
+    "\n**Các Công Cụ Có Sẵn:**",
+    "Bạn có thể sử dụng các công cụ sau khi cần thiết để thực hiện yêu cầu của người dùng:",
+    "- `add_family_member`: Để thêm thành viên mới.",
+    "- `update_preference`: Để cập nhật sở thích cho thành viên đã biết.",
+    "- `add_event`: Để thêm sự kiện mới. Hãy cung cấp mô tả ngày theo lời người dùng (ví dụ: 'ngày mai', 'thứ 6 tuần sau') vào `date_description`, hệ thống sẽ tính ngày chính xác. Bao gồm mô tả lặp lại (ví dụ 'hàng tuần') trong `description` nếu có.",
+    "**QUAN TRỌNG VỀ LẶP LẠI:** Chỉ bao gồm mô tả sự lặp lại (ví dụ 'hàng tuần', 'mỗi tháng') trong trường `description` **KHI VÀ CHỈ KHI** người dùng **nêu rõ ràng** ý muốn lặp lại. Nếu người dùng chỉ nói một ngày cụ thể (ví dụ 'thứ 3 tới'), thì **KHÔNG được tự ý thêm** 'hàng tuần' hay bất kỳ từ lặp lại nào vào `description`; sự kiện đó là MỘT LẦN (ONCE)."
+    "- `update_event`: Để sửa sự kiện. Cung cấp `event_id` và các trường cần thay đổi. Tương tự `add_event` về cách xử lý ngày (`date_description`) và lặp lại (`description`).",
+    "**QUAN TRỌNG VỀ LẶP LẠI:** Nếu cập nhật `description`, chỉ đưa thông tin lặp lại vào đó nếu người dùng **nêu rõ ràng**. Nếu người dùng chỉ thay đổi sang một ngày cụ thể, **KHÔNG tự ý** thêm thông tin lặp lại."
+    "- `delete_event`: Để xóa sự kiện.",
+    "- `add_note`: Để tạo ghi chú mới.",
+    "\n**QUY TẮC QUAN TRỌNG:**",
+    "1.  **Chủ động sử dụng công cụ:** Khi người dùng yêu cầu rõ ràng (thêm, sửa, xóa, tạo...), hãy sử dụng công cụ tương ứng.",
+    "2.  **Xử lý ngày/giờ:** KHÔNG tự tính toán ngày YYYY-MM-DD. Hãy gửi mô tả ngày của người dùng (ví dụ 'ngày mai', '20/7', 'thứ 3 tới') trong trường `date_description` của công cụ `add_event` hoặc `update_event`. Nếu sự kiện lặp lại, hãy nêu rõ trong trường `description` (ví dụ 'học tiếng Anh thứ 6 hàng tuần').",
+    "3.  **Tìm kiếm và thời tiết:** Sử dụng thông tin tìm kiếm và thời tiết được cung cấp trong context (đánh dấu bằng --- THÔNG TIN ---) để trả lời các câu hỏi liên quan. Đừng gọi công cụ nếu thông tin đã có sẵn.",
+    "4.  **Phân tích hình ảnh:** Khi nhận được hình ảnh, hãy mô tả nó và liên kết với thông tin gia đình nếu phù hợp.",
+    "5.  **Xác nhận:** Sau khi sử dụng công cụ thành công (nhận được kết quả từ 'tool role'), hãy thông báo ngắn gọn cho người dùng biết hành động đã được thực hiện dựa trên kết quả đó. Nếu tool thất bại, hãy thông báo lỗi một cách lịch sự.",
+    "6. **Độ dài phản hồi:** Giữ phản hồi cuối cùng cho người dùng tương đối ngắn gọn và tập trung vào yêu cầu chính, trừ khi được yêu cầu chi tiết.",
+    "7. **Thời tiết:** Khi được hỏi về thời tiết hoặc lời khuyên liên quan đến thời tiết, sử dụng thông tin thời tiết được cung cấp để trả lời một cách chính xác và hữu ích.",
+])
+
+GUEST_SECTION = "\n(Hiện tại đang tương tác với khách.)"
+
+
+class SystemPromptBuilder:
+    """
+    System prompt = phần tĩnh (STATIC_PREFIX) + thông tin người dùng hiện tại + tóm tắt dữ liệu
+    + ngày hôm nay ở cuối. Hai phần giữa được cache và chỉ tính lại khi version của store
+    family/events/notes thay đổi (xem database.data_manager.store_version).
+    """
+
+    def __init__(self):
+        self._member_version: Optional[int] = None
+        self._member_sections: Dict[str, str] = {}
+        self._data_section: Optional[Tuple[Tuple[int, int, int], str]] = None
+        self.prefix_hash = hashlib.sha256(STATIC_PREFIX.encode("utf-8")).hexdigest()[:16]
+        self.metrics = {
+            "builds": 0,
+            "member_hits": 0,
+            "member_misses": 0,
+            "data_hits": 0,
+            "data_misses": 0,
+        }
+
+    @staticmethod
+    def _render_member(member_id: str) -> str:
+        member = family_data[member_id]
+        return f"""
+        \n**Thông Tin Người Dùng Hiện Tại:**
+        - ID: {member_id}
+        - Tên: {member.get('name')}
+        - Tuổi: {member.get('age', 'Chưa biết')}
+        - Sở thích: {json.dumps(member.get('preferences', {}), ensure_ascii=False)}
+        (Hãy cá nhân hóa tương tác và ghi nhận hành động dưới tên người dùng này. Sử dụng ID '{member_id}' khi cần `member_id`.)
+        """
+
+    def member_section(self, member_id: Optional[str]) -> str:
+        version = store_version(FAMILY_DATA_FILE)  # Đọc version trước khi đọc dữ liệu
+        if version != self._member_version:
+            self._member_sections.clear()
+            self._member_version = version
+        if not member_id or member_id not in family_data:
+            return GUEST_SECTION
+        section = self._member_sections.get(member_id)
+        if section is not None:
+            self.metrics["member_hits"] += 1
+            return section
+        self.metrics["member_misses"] += 1
+        section = self._member_sections[member_id] = self._render_member(member_id)
+        return section
+
+    @staticmethod
+    def _render_data() -> str:
+        recent_events_summary = {}
+        try:
+            for eid in event_index.recent_ids(3):
+                event = events_data.get(eid)
+                if not event: continue
+                recent_events_summary[eid] = f"{event.get('title')} ({event.get('date')})"
+        except Exception as sort_err:
+            logger.error(f"Error summarizing recent events: {sort_err}")
+            recent_events_summary = {"error": "Không thể tóm tắt"}
+        return f"""
+    \n**Dữ Liệu Hiện Tại (Tóm tắt):**
+    *   Thành viên (IDs): {json.dumps(list(family_data.keys()), ensure_ascii=False)}
+    *   Sự kiện gần đây (IDs & Titles): {json.dumps(recent_events_summary, ensure_ascii=False)} (Tổng cộng: {len(events_data)})
+    *   Ghi chú (Tổng cộng): {len(notes_data)}
+    (Sử dụng ID sự kiện từ tóm tắt này khi cần `event_id` cho việc cập nhật hoặc xóa.)
+    """
+
+    def data_section(self) -> str:
+        versions = (store_version(FAMILY_DATA_FILE), store_version(EVENTS_DATA_FILE), store_version(NOTES_DATA_FILE))
+        if self._data_section is not None and self._data_section[0] == versions:
+            self.metrics["data_hits"] += 1
+            return self._data_section[1]
+        self.metrics["data_misses"] += 1
+        self._data_section = (versions, self._render_data())
+        return self._data_section[1]
+
+    def build(self, member_id: Optional[str] = None) -> str:
+        self.metrics["builds"] += 1
+        return "\n".join([
+            STATIC_PREFIX,
+            self.member_section(member_id),
+            self.data_section(),
+            f"\nHôm nay là {datetime.datetime.now().strftime('%A, %d/%m/%Y')}.",
+        ])
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "prefix_chars": len(STATIC_PREFIX),
+            "prefix_sha256": self.prefix_hash,
+            "cached_members": len(self._member_sections),
+        }
+
+
+# Singleton instance
+system_prompt_builder = SystemPromptBuilder()
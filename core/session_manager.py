@@ -1,58 +1,626 @@
 from __future__ import annotations
 
 import os
+import re
 import json
+import time
+import uuid
+import hashlib
+import asyncio
 import datetime
 import logging
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Set, Iterable, Callable
 
-from config.settings import SESSIONS_DATA_FILE
+from config.settings import (
+    SESSIONS_DATA_FILE, SESSIONS_DIR, SESSION_FLUSH_INTERVAL_SECONDS, SESSION_FLUSH_MAX_DIRTY,
+    MULTIPROCESS_STORAGE_ENABLED, SESSION_CACHE_MAX_SESSIONS, SESSION_CACHE_IDLE_TTL_SECONDS,
+    SESSION_SWEEP_INTERVAL_SECONDS, SESSION_RETENTION_DAYS
+)
 from config.logging_config import logger
+from database import codec
+from database.file_lock import file_lock, file_stamp
+from database.blob_store import blob_store
+
+_SAFE_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,100}$")
+SESSION_INDEX_FILENAME = "index.json"
 
 class SessionManager:
-    """Quản lý session và trạng thái cho mỗi client với khả năng lưu trạng thái"""
-    def __init__(self, sessions_file=SESSIONS_DATA_FILE): # Use constant
-        self.sessions = {}
-        self.sessions_file = sessions_file
-        self._load_sessions()
-
-    def _load_sessions(self):
-        """Tải dữ liệu session từ file"""
+    """
+    Quản lý session và trạng thái cho mỗi client với khả năng lưu trạng thái.
+
+    Lưu trữ dạng shard: mỗi session một file trong `sessions_dir` cộng với một
+    index nhỏ chứa metadata (created_at, last_updated, member, message_count).
+    Khi khởi động chỉ đọc index; nội dung session chỉ được tải khi được truy cập.
+
+    Ở chế độ nhiều worker (`shared`), session được ghi ngay (không qua flusher),
+    index được merge dưới khóa file và shard/index được đọc lại khi worker khác
+    đã ghi đè.
+
+    `sessions` là cache LRU có giới hạn: session ít dùng nhất (hoặc không được truy
+    cập quá `idle_ttl` giây) được ghi xuống shard nếu còn thay đổi rồi bỏ khỏi bộ
+    nhớ, và được tải lại từ shard ở lần truy cập sau. Session đang được một request
+    giữ (`pin`) không bao giờ bị bỏ: request sửa trực tiếp dict session qua nhiều
+    lần await, bỏ nó giữa chừng sẽ làm mất các thay đổi đó.
+
+    Index (và chuyển đổi từ file cũ) được tải bởi `load_index()` khi server khởi
+    động, không phải lúc import; các thao tác khác tự tải nếu chưa được gọi.
+    """
+    def __init__(self, sessions_dir=SESSIONS_DIR,
+                 flush_interval=SESSION_FLUSH_INTERVAL_SECONDS,
+                 max_dirty=SESSION_FLUSH_MAX_DIRTY,
+                 legacy_sessions_file=SESSIONS_DATA_FILE, # Use constant
+                 shared=MULTIPROCESS_STORAGE_ENABLED,
+                 max_cached=SESSION_CACHE_MAX_SESSIONS,
+                 idle_ttl=SESSION_CACHE_IDLE_TTL_SECONDS,
+                 sweep_interval=SESSION_SWEEP_INTERVAL_SECONDS,
+                 retention_days=SESSION_RETENTION_DAYS):
+        # Chỉ các session đã được tải vào bộ nhớ, theo thứ tự truy cập (cũ nhất trước)
+        self.sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.index: Dict[str, Dict[str, Any]] = {}
+        self.sessions_dir = sessions_dir
+        self.index_file = os.path.join(sessions_dir, SESSION_INDEX_FILENAME)
+        self.legacy_sessions_file = legacy_sessions_file
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self.shared = shared
+        self.max_cached = max(1, max_cached)
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.retention_days = retention_days
+        self._last_access: Dict[str, float] = {}
+        self._sweep_task: Optional[asyncio.Task] = None
+        # Dấu file của shard/index lúc đọc/ghi lần cuối (phát hiện worker khác ghi)
+        self._shard_stamps: Dict[str, Any] = {}
+        self._index_stamp = None
+        self._index_loaded = False
+        # Số request đang giữ mỗi session (không được bỏ khỏi cache khi > 0)
+        self._pins: Dict[str, int] = {}
+
+        # Dirty tracking: các session đã thay đổi nhưng chưa ghi xuống đĩa
+        self._dirty: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        # Session đang được flush ở thread nền: không được bỏ khỏi bộ nhớ tới khi ghi xong
+        self._in_flight: Set[str] = set()
+        # Session cần bỏ khỏi cache nhưng còn thay đổi chưa ghi: bỏ sau khi flusher ghi xong
+        self._evict_pending: Set[str] = set()
+        self.metrics = {
+            "flush_count": 0,
+            "flush_failures": 0,
+            "bytes_written_total": 0,
+            "last_flush_bytes": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+            "sessions_flushed_total": 0,
+            "updates_coalesced": 0,
+            "shards_loaded": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "cache_evictions": 0,
+            "cache_expired": 0,
+            "cache_spills": 0,
+            "sweeps": 0,
+            "sessions_removed_by_sweeper": 0,
+            "evictions_skipped_pinned": 0,
+        }
+
+    def load_index(self) -> None:
+        """Tải index session (chuyển đổi file cũ nếu cần). Gọi khi server startup."""
+        if self.shared:
+            # Tránh nhiều worker cùng chuyển đổi/xây dựng lại index khi khởi động
+            with file_lock(self.index_file):
+                self._load_index()
+        else:
+            self._load_index()
+        self._index_loaded = True
+
+    def _ensure_index(self) -> None:
+        if not self._index_loaded:
+            self.load_index()
+
+    # --- Shard layout ---
+    def _shard_path(self, session_id: str) -> str:
+        """Tên file shard: dùng trực tiếp session_id nếu an toàn, ngược lại dùng hash."""
+        if _SAFE_SESSION_ID.match(session_id):
+            filename = f"{session_id}.json"
+        else:
+            filename = f"h_{hashlib.sha1(session_id.encode('utf-8')).hexdigest()}.json"
+        return os.path.join(self.sessions_dir, filename)
+
+    @staticmethod
+    def _build_meta(session_data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "created_at": session_data.get("created_at"),
+            "last_updated": session_data.get("last_updated"),
+            "member_id": session_data.get("current_member"),
+            "message_count": len(session_data.get("messages", [])),
+        }
+
+    def _load_index(self):
+        """Tải index metadata; chuyển đổi từ file sessions_data.json cũ nếu cần."""
         try:
-            if os.path.exists(self.sessions_file):
-                with open(self.sessions_file, "r", encoding="utf-8") as f:
-                    loaded_sessions = json.load(f)
-                    if isinstance(loaded_sessions, dict):
-                        self.sessions = loaded_sessions
-                        logger.info(f"Đã tải {len(self.sessions)} session từ {self.sessions_file}")
-                    else:
-                        logger.warning(f"Dữ liệu session trong {self.sessions_file} không hợp lệ (không phải dict), khởi tạo lại.")
-                        self.sessions = {} # Reset if invalid structure
-        except json.JSONDecodeError as e:
-            logger.error(f"Lỗi JSON khi tải session từ {self.sessions_file}: {e}. Khởi tạo lại.")
-            self.sessions = {} # Reset on JSON error
+            if os.path.exists(self.index_file):
+                loaded_index = self._read_index_file()
+                if isinstance(loaded_index, dict):
+                    self.index = loaded_index
+                    logger.info(f"Đã tải index của {len(self.index)} session từ {self.index_file}")
+                    return
+                logger.warning(f"Index session trong {self.index_file} không hợp lệ (không phải dict), xây dựng lại.")
+                self._rebuild_index()
+            elif self.legacy_sessions_file and os.path.exists(self.legacy_sessions_file):
+                self._migrate_legacy_file()
+        except ValueError as e:
+            logger.error(f"Lỗi giải mã index session từ {self.index_file}: {e}. Xây dựng lại từ các shard.")
+            self._rebuild_index()
         except Exception as e:
             logger.error(f"Lỗi không xác định khi tải session: {e}", exc_info=True)
-            self.sessions = {} # Reset on other errors
+            self.index = {} # Reset on other errors
+
+    def _read_index_file(self) -> Any:
+        self._index_stamp = file_stamp(self.index_file)
+        with open(self.index_file, "rb") as f:
+            return codec.decode(f.read())
+
+    def _refresh_index(self) -> None:
+        """(Chế độ nhiều worker) Đọc lại index nếu worker khác đã ghi."""
+        if not self.shared or file_stamp(self.index_file) == self._index_stamp:
+            return
+        try:
+            with file_lock(self.index_file, shared=True):
+                loaded_index = self._read_index_file()
+            if isinstance(loaded_index, dict):
+                self.index = loaded_index
+        except (OSError, ValueError) as e:
+            logger.error(f"Không thể đọc lại index session {self.index_file}: {e}")
+
+    def _rebuild_index(self):
+        """Quét lại toàn bộ shard để dựng index (chỉ dùng khi index bị mất/hỏng)."""
+        self.index = {}
+        if not os.path.isdir(self.sessions_dir):
+            return
+        for filename in os.listdir(self.sessions_dir):
+            if not filename.endswith(".json") or filename == SESSION_INDEX_FILENAME:
+                continue
+            try:
+                with open(os.path.join(self.sessions_dir, filename), "rb") as f:
+                    session_data = codec.decode(f.read())
+                session_id = session_data.get("session_id") or filename[:-len(".json")]
+                self.index[session_id] = self._build_meta(session_data)
+            except Exception as e:
+                logger.error(f"Không thể đọc shard session {filename}: {e}")
+        self._write_index_file(self.index)
+        logger.info(f"Đã xây dựng lại index cho {len(self.index)} session")
+
+    def _migrate_legacy_file(self):
+        """Tách file sessions_data.json (một document) thành các shard."""
+        with open(self.legacy_sessions_file, "rb") as f:
+            legacy_sessions = codec.decode(f.read())
+        if not isinstance(legacy_sessions, dict):
+            logger.warning(f"Dữ liệu session trong {self.legacy_sessions_file} không hợp lệ, bỏ qua chuyển đổi.")
+            return
+        for session_id, session_data in legacy_sessions.items():
+            if not isinstance(session_data, dict):
+                continue
+            self._write_shard(session_id, session_data)
+            self.index[session_id] = self._build_meta(session_data)
+        self._write_index_file(self.index)
+        logger.info(f"Đã chuyển {len(self.index)} session từ {self.legacy_sessions_file} sang dạng shard tại {self.sessions_dir}")
+
+    def _load_shard(self, session_id: str) -> Optional[Dict[str, Any]]:
+        path = self._shard_path(session_id)
+        try:
+            self._shard_stamps[session_id] = file_stamp(path)
+            with open(path, "rb") as f:
+                session_data = codec.decode(f.read())
+            if not isinstance(session_data, dict):
+                logger.warning(f"Shard session {path} không hợp lệ (không phải dict).")
+                return None
+            session_data.pop("session_id", None)
+            # Shard cũ còn data URL ảnh: chuyển sang blob store, file gọn lại ở lần ghi kế tiếp
+            blob_store.externalize_messages(session_data.get("messages"))
+            self.metrics["shards_loaded"] += 1
+            return session_data
+        except FileNotFoundError:
+            logger.warning(f"Index có session {session_id} nhưng không tìm thấy shard {path}.")
+            return None
+        except Exception as e:
+            logger.error(f"Lỗi khi tải shard session {session_id}: {e}", exc_info=True)
+            return None
+
+    # --- Writing ---
+    def _atomic_write(self, path: str, payload: bytes) -> int:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(payload)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                try: os.remove(temp_path)
+                except OSError: pass
+        return len(payload)
+
+    def _write_shard(self, session_id: str, session_data: Dict[str, Any]) -> int:
+        payload = codec.encode({**session_data, "session_id": session_id})
+        path = self._shard_path(session_id)
+        bytes_written = self._atomic_write(path, payload)
+        self._shard_stamps[session_id] = file_stamp(path)
+        return bytes_written
+
+    def _write_index_file(self, index: Dict[str, Any]) -> int:
+        payload = codec.encode(index, codec.CODEC_JSON_COMPACT if codec.ACTIVE_CODEC == codec.CODEC_JSON else None)
+        return self._atomic_write(self.index_file, payload)
 
+    def _snapshot_sessions(self, session_ids: Set[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Sao chép nông các session thay đổi (và danh sách messages) trên event loop
+        để luồng ghi nền có thể serialize mà không đụng vào dict đang được sửa.
+        Giá trị None nghĩa là session đã bị xóa.
+        """
+        snapshot = {}
+        for session_id in session_ids:
+            session_data = self.sessions.get(session_id)
+            if session_data is None:
+                snapshot[session_id] = None
+            else:
+                snapshot[session_id] = {**session_data, "messages": list(session_data.get("messages", []))}
+        return snapshot
+
+    def _write_sessions_file(self, snapshot: Dict[str, Optional[Dict[str, Any]]], index: Dict[str, Any]) -> int:
+        """Ghi các shard thay đổi (hoặc xóa shard), sau đó ghi index. Returns số bytes đã ghi."""
+        bytes_written = 0
+        for session_id, session_data in snapshot.items():
+            if session_data is None:
+                self._shard_stamps.pop(session_id, None)
+                try:
+                    os.remove(self._shard_path(session_id))
+                except FileNotFoundError:
+                    pass
+            else:
+                bytes_written += self._write_shard(session_id, session_data)
+        if self.shared:
+            bytes_written += self._merge_index_file(snapshot, index)
+        else:
+            bytes_written += self._write_index_file(index)
+        return bytes_written
+
+    def _merge_index_file(self, snapshot: Dict[str, Optional[Dict[str, Any]]], index: Dict[str, Any]) -> int:
+        """
+        Ghi index khi nhiều worker dùng chung thư mục: dưới khóa file, đọc index
+        hiện tại trên đĩa và chỉ áp dụng metadata của các session vừa ghi/xóa.
+        """
+        with file_lock(self.index_file):
+            disk_index: Dict[str, Any] = {}
+            if os.path.exists(self.index_file):
+                try:
+                    loaded_index = self._read_index_file()
+                    if isinstance(loaded_index, dict):
+                        disk_index = loaded_index
+                except ValueError as e:
+                    logger.error(f"Index session trên đĩa bị hỏng, ghi lại từ bộ nhớ: {e}")
+                    disk_index = dict(index)
+            for session_id, session_data in snapshot.items():
+                if session_data is None:
+                    disk_index.pop(session_id, None)
+                else:
+                    disk_index[session_id] = index.get(session_id) or self._build_meta(session_data)
+            bytes_written = self._write_index_file(disk_index)
+            self._index_stamp = file_stamp(self.index_file)
+        self.index = disk_index
+        return bytes_written
+
+    def _record_flush(self, started: float, bytes_written: int, session_count: int) -> None:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.metrics["flush_count"] += 1
+        self.metrics["bytes_written_total"] += bytes_written
+        self.metrics["last_flush_bytes"] = bytes_written
+        self.metrics["last_flush_ms"] = round(elapsed_ms, 3)
+        self.metrics["max_flush_ms"] = round(max(self.metrics["max_flush_ms"], elapsed_ms), 3)
+        self.metrics["total_flush_ms"] += elapsed_ms
+        self.metrics["sessions_flushed_total"] += session_count
 
     def _save_sessions(self):
-        """Lưu dữ liệu session vào file"""
+        """Lưu các session thay đổi vào file (đồng bộ)"""
+        started = time.perf_counter()
+        dirty_ids = set(self._dirty)
+        self._dirty.clear()
         try:
-            os.makedirs(os.path.dirname(self.sessions_file) or '.', exist_ok=True)
-            with open(self.sessions_file, "w", encoding="utf-8") as f:
-                json.dump(self.sessions, f, ensure_ascii=False, indent=2)
-            logger.debug(f"Đã lưu {len(self.sessions)} session vào {self.sessions_file}") # Reduced log level
+            bytes_written = self._write_sessions_file(self._snapshot_sessions(dirty_ids), dict(self.index))
+            self._record_flush(started, bytes_written, len(dirty_ids))
+            logger.debug(f"Đã lưu {len(dirty_ids)} session vào {self.sessions_dir}") # Reduced log level
             return True
         except Exception as e:
+            self.metrics["flush_failures"] += 1
+            self._dirty |= dirty_ids
             logger.error(f"Lỗi khi lưu session: {e}", exc_info=True)
             return False
 
+    def _mark_dirty(self, *session_ids: str) -> None:
+        """
+        Đánh dấu session cần ghi và cập nhật metadata trong index. Nếu flusher
+        nền đang chạy thì chỉ gom lại (và đánh thức flusher khi vượt ngưỡng
+        max_dirty); nếu không thì ghi ngay.
+        """
+        self._ensure_index()
+        for session_id in session_ids:
+            if session_id in self._dirty:
+                self.metrics["updates_coalesced"] += 1
+            self._dirty.add(session_id)
+            if session_id in self.sessions:
+                self.index[session_id] = self._build_meta(self.sessions[session_id])
+            else:
+                self.index.pop(session_id, None)
+
+        if not self.flusher_running:
+            self._save_sessions()
+            return
+        if len(self._dirty) >= self.max_dirty and self._flush_wakeup is not None:
+            self._flush_wakeup.set()
+
+    @property
+    def flusher_running(self) -> bool:
+        return self._flush_task is not None and not self._flush_task.done()
+
+    async def flush(self) -> bool:
+        """Ghi các thay đổi đang chờ xuống đĩa ở thread riêng (không chặn event loop)."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._dirty:
+                self._evict_flushed()
+                return True
+            started = time.perf_counter()
+            dirty_ids = set(self._dirty)
+            self._dirty.clear()
+            snapshot = self._snapshot_sessions(dirty_ids)
+            self._in_flight = dirty_ids
+            try:
+                bytes_written = await asyncio.to_thread(self._write_sessions_file, snapshot, dict(self.index))
+                self._record_flush(started, bytes_written, len(dirty_ids))
+                logger.debug(f"Flush {len(dirty_ids)} session thay đổi ({bytes_written} bytes) vào {self.sessions_dir}")
+                return True
+            except Exception as e:
+                self.metrics["flush_failures"] += 1
+                self._dirty |= dirty_ids # Thử lại ở lần flush sau
+                logger.error(f"Lỗi khi flush session: {e}", exc_info=True)
+                return False
+            finally:
+                self._in_flight = set()
+                self._evict_flushed()
+
+    def _evict_flushed(self) -> None:
+        """(Trong _flush_lock) Bỏ các session chờ evict đã được ghi xong."""
+        done = {sid for sid in self._evict_pending if sid not in self._dirty or sid not in self.sessions}
+        self._evict_pending -= done
+        dropped = self._evict(done)
+        self.metrics["cache_spills"] += dropped
+        self.metrics["cache_evictions"] += dropped
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+            await self.flush()
+
+    async def start_flusher(self) -> None:
+        """Khởi động flusher nền (gọi khi server startup)."""
+        if self.flusher_running:
+            return
+        if self.shared:
+            # Worker khác cần thấy thay đổi ngay nên mỗi cập nhật được ghi đồng bộ
+            logger.info("Chế độ nhiều worker: session được ghi ngay, không dùng flusher nền.")
+            return
+        self._flush_wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Session flusher đã khởi động (interval={self.flush_interval}s, max_dirty={self.max_dirty})")
+
+    async def stop_flusher(self) -> None:
+        """Dừng flusher và ép ghi toàn bộ thay đổi còn lại (gọi khi shutdown)."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        logger.info("Session flusher đã dừng, đã ghi toàn bộ session thay đổi.")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Số liệu về flush: độ trễ, số bytes đã ghi, số session đang chờ ghi."""
+        flush_count = self.metrics["flush_count"]
+        return {
+            **self.metrics,
+            "total_flush_ms": round(self.metrics["total_flush_ms"], 3),
+            "avg_flush_ms": round(self.metrics["total_flush_ms"] / flush_count, 3) if flush_count else 0.0,
+            "dirty_sessions": len(self._dirty),
+            "sessions_indexed": len(self.index),
+            "sessions_in_memory": len(self.sessions),
+            "sessions_pinned": len(self._pins),
+            "cache_capacity": self.max_cached,
+            "cache_idle_ttl_seconds": self.idle_ttl,
+            "sweeper_running": self._sweep_task is not None and not self._sweep_task.done(),
+            "flusher_running": self.flusher_running,
+            "flush_interval_seconds": self.flush_interval,
+            "max_dirty": self.max_dirty,
+        }
+
+    def _ensure_loaded(self, session_id) -> bool:
+        """Tải shard của session vào bộ nhớ nếu session có trong index."""
+        self._ensure_index()
+        if self.shared:
+            return self._ensure_loaded_shared(session_id)
+        if session_id in self.sessions:
+            self.metrics["cache_hits"] += 1
+            self._touch(session_id)
+            return True
+        if session_id not in self.index:
+            return False
+        self.metrics["cache_misses"] += 1
+        session_data = self._load_shard(session_id)
+        if session_data is None:
+            return False
+        self._cache_put(session_id, session_data)
+        return True
+
+    def _ensure_loaded_shared(self, session_id) -> bool:
+        """Như _ensure_loaded nhưng đọc lại shard nếu worker khác đã ghi/xóa nó."""
+        path = self._shard_path(session_id)
+        stamp = file_stamp(path)
+        if session_id in self.sessions and (stamp == self._shard_stamps.get(session_id) or self.is_pinned(session_id)):
+            # Session đang được request giữ: giữ nguyên dict trong bộ nhớ (lần ghi của request sẽ ghi đè)
+            self.metrics["cache_hits"] += 1
+            self._touch(session_id)
+            return True
+        if stamp is None:
+            # Shard không tồn tại: session chưa từng được lưu hoặc đã bị worker khác xóa
+            if session_id in self.sessions and session_id not in self._shard_stamps:
+                self.metrics["cache_hits"] += 1
+                self._touch(session_id)
+                return True
+            self.sessions.pop(session_id, None)
+            self._shard_stamps.pop(session_id, None)
+            self.index.pop(session_id, None)
+            return False
+        self.metrics["cache_misses"] += 1
+        session_data = self._load_shard(session_id)
+        if session_data is None:
+            return False
+        self.index[session_id] = self._build_meta(session_data)
+        self._cache_put(session_id, session_data)
+        return True
+
+    # --- Cache ---
+    def _touch(self, session_id: str) -> None:
+        self._evict_pending.discard(session_id)
+        self.sessions.move_to_end(session_id)
+        self._last_access[session_id] = time.monotonic()
+
+    def _cache_put(self, session_id: str, session_data: Dict[str, Any]) -> None:
+        """Đưa session vào cache (vị trí mới nhất) và đẩy session cũ nhất ra nếu vượt giới hạn."""
+        self.sessions[session_id] = session_data
+        self._touch(session_id)
+        overflow = len(self.sessions) - len(self._evict_pending) - self.max_cached
+        if overflow > 0:
+            # Session vừa đưa vào nằm cuối nên không bao giờ bị chọn
+            victims = [sid for sid in self.sessions
+                       if self._evictable(sid) and sid not in self._evict_pending][:overflow]
+            self.metrics["cache_evictions"] += self._evict(victims)
+
+    # --- Pinning ---
+    def is_pinned(self, session_id: str) -> bool:
+        return self._pins.get(session_id, 0) > 0
+
+    def pin(self, session_id: str) -> Callable[[], None]:
+        """
+        Giữ session trong bộ nhớ tới khi hàm trả về được gọi (gọi nhiều lần chỉ có
+        tác dụng một lần). Dùng cho request giữ dict session qua nhiều lần await.
+        """
+        self._pins[session_id] = self._pins.get(session_id, 0) + 1
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if released:
+                return
+            released = True
+            remaining = self._pins.get(session_id, 0) - 1
+            if remaining > 0:
+                self._pins[session_id] = remaining
+            else:
+                self._pins.pop(session_id, None)
+        return release
+
+    @contextmanager
+    def pinned(self, session_id: str):
+        """Context manager của pin(): giữ session trong suốt khối lệnh."""
+        release = self.pin(session_id)
+        try:
+            yield
+        finally:
+            release()
+
+    def _evictable(self, session_id: str) -> bool:
+        return session_id not in self._in_flight and not self.is_pinned(session_id)
+
+    def _evict(self, session_ids: Iterable[str]) -> int:
+        """
+        Bỏ các session khỏi bộ nhớ. Session còn thay đổi chưa ghi không được ghi ở đây
+        (tránh ghi đồng bộ trên event loop và ghi index ngoài _flush_lock): chúng được
+        đánh dấu chờ và flusher bỏ chúng sau khi ghi xong; không có flusher thì giữ lại
+        tới khi lần ghi đồng bộ kế tiếp thành công. Session đang được flush hoặc đang
+        được request giữ thì bỏ qua. Returns số session đã bỏ.
+        """
+        candidates = [sid for sid in session_ids if sid in self.sessions]
+        session_ids = [sid for sid in candidates if self._evictable(sid)]
+        self.metrics["evictions_skipped_pinned"] += sum(1 for sid in candidates if self.is_pinned(sid))
+        to_spill = {sid for sid in session_ids if sid in self._dirty}
+        if to_spill:
+            session_ids = [sid for sid in session_ids if sid not in to_spill]
+            if self.flusher_running:
+                self._evict_pending |= to_spill
+                self._flush_wakeup.set()
+        for session_id in session_ids:
+            self.sessions.pop(session_id, None)
+            self._last_access.pop(session_id, None)
+        return len(session_ids)
+
+    def sweep(self) -> Dict[str, int]:
+        """Bỏ khỏi bộ nhớ các session không được truy cập quá idle_ttl và xóa session quá hạn lưu giữ."""
+        now = time.monotonic()
+        idle = [sid for sid in self.sessions
+                if now - self._last_access.setdefault(sid, now) > self.idle_ttl]
+        expired = self._evict(idle)
+        removed = self.cleanup_old_sessions(self.retention_days) if self.retention_days > 0 else 0
+        self.metrics["sweeps"] += 1
+        self.metrics["cache_expired"] += expired
+        self.metrics["sessions_removed_by_sweeper"] += removed
+        if expired or removed:
+            logger.info(f"Sweeper session: bỏ {expired} session nhàn rỗi khỏi bộ nhớ, xóa {removed} session cũ.")
+        return {"expired": expired, "removed": removed}
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Lỗi trong sweeper session: {e}", exc_info=True)
+
+    async def start_sweeper(self) -> None:
+        """Khởi động sweeper nền (gọi khi server startup)."""
+        if self._sweep_task is not None and not self._sweep_task.done():
+            return
+        if self.sweep_interval <= 0:
+            logger.info("Sweeper session bị tắt (SESSION_SWEEP_INTERVAL_SECONDS <= 0).")
+            return
+        self._sweep_task = asyncio.create_task(self._sweep_loop())
+        logger.info(f"Sweeper session đã khởi động (interval={self.sweep_interval}s, idle_ttl={self.idle_ttl}s, "
+                    f"max_cached={self.max_cached}, retention_days={self.retention_days})")
+
+    async def stop_sweeper(self) -> None:
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            try:
+                await self._sweep_task
+            except asyncio.CancelledError:
+                pass
+            self._sweep_task = None
+
     def get_session(self, session_id):
         """Lấy session hoặc tạo mới nếu chưa tồn tại"""
-        if session_id not in self.sessions:
+        if not self._ensure_loaded(session_id):
             logger.info(f"Tạo session mới: {session_id}")
-            self.sessions[session_id] = {
+            self._cache_put(session_id, {
                 "messages": [],
                 "current_member": None,
                 "suggested_question": None,
@@ -60,19 +628,23 @@ class SessionManager:
                 "question_cache": {},
                 "created_at": datetime.datetime.now().isoformat(),
                 "last_updated": datetime.datetime.now().isoformat()
-            }
-            self._save_sessions() # Save immediately after creation
+            })
+            self._mark_dirty(session_id)
         return self.sessions[session_id]
 
+    def find_session(self, session_id) -> Optional[Dict[str, Any]]:
+        """Lấy session nếu đã tồn tại (không tạo mới); None nếu không có."""
+        if self._ensure_loaded(session_id):
+            return self.sessions[session_id]
+        return None
+
     def update_session(self, session_id, data):
         """Cập nhật dữ liệu session"""
-        if session_id in self.sessions:
+        if self._ensure_loaded(session_id):
             try:
                 self.sessions[session_id].update(data)
                 self.sessions[session_id]["last_updated"] = datetime.datetime.now().isoformat()
-                # Consider saving less often if performance is an issue.
-                if not self._save_sessions():
-                     logger.error(f"Cập nhật session {session_id} thành công trong bộ nhớ nhưng LƯU THẤT BẠI.")
+                self._mark_dirty(session_id)
                 return True
             except Exception as e:
                 logger.error(f"Lỗi khi cập nhật session {session_id} trong bộ nhớ: {e}", exc_info=True)
@@ -83,21 +655,24 @@ class SessionManager:
 
     def delete_session(self, session_id):
         """Xóa session"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            self._save_sessions()
+        if session_id in self.sessions or session_id in self.index or self._ensure_loaded(session_id):
+            self.sessions.pop(session_id, None)
+            self._last_access.pop(session_id, None)
+            self._mark_dirty(session_id)
             logger.info(f"Đã xóa session: {session_id}")
             return True
         return False
 
-    def cleanup_old_sessions(self, days_threshold=30):
-        """Xóa các session cũ không hoạt động sau số ngày nhất định"""
+    def cleanup_old_sessions(self, days_threshold=30) -> int:
+        """Xóa các session cũ không hoạt động sau số ngày nhất định. Returns số session đã xóa."""
+        self._ensure_index()
+        self._refresh_index()
         now = datetime.datetime.now(datetime.timezone.utc) # Use timezone-aware datetime
         sessions_to_remove = []
         removed_count = 0
 
-        for session_id, session_data in list(self.sessions.items()): # Iterate over a copy
-            last_updated_str = session_data.get("last_updated")
+        for session_id, session_meta in list(self.index.items()): # Iterate over a copy
+            last_updated_str = session_meta.get("last_updated")
             if last_updated_str:
                 try:
                     last_updated_date = datetime.datetime.fromisoformat(last_updated_str)
@@ -106,7 +681,7 @@ class SessionManager:
                         last_updated_date = last_updated_date.replace(tzinfo=datetime.timezone.utc)
 
                     time_inactive = now - last_updated_date
-                    if time_inactive.days > days_threshold:
+                    if time_inactive.days > days_threshold and not self.is_pinned(session_id):
                         sessions_to_remove.append(session_id)
                 except ValueError:
                     logger.error(f"Định dạng last_updated không hợp lệ ('{last_updated_str}') cho session {session_id}. Xem xét xóa.")
@@ -115,15 +690,50 @@ class SessionManager:
 
         if sessions_to_remove:
              for session_id in sessions_to_remove:
-                 if session_id in self.sessions:
-                     del self.sessions[session_id]
+                 if session_id in self.index:
+                     self.sessions.pop(session_id, None)
+                     self._last_access.pop(session_id, None)
                      removed_count += 1
              if removed_count > 0:
-                 self._save_sessions()
+                 self._mark_dirty(*sessions_to_remove)
                  logger.info(f"Đã xóa {removed_count} session cũ (quá {days_threshold} ngày không hoạt động).")
              else:
                   logger.info("Không có session cũ nào cần xóa.")
         else:
             logger.info("Không có session cũ nào cần xóa.")
+        return removed_count
+
+    def reload(self) -> int:
+        """
+        Đọc lại index và bỏ các session đã tải trong bộ nhớ (trừ session còn thay
+        đổi chưa ghi) để lần truy cập sau đọc lại shard từ đĩa.
+        Returns số session được bỏ khỏi bộ nhớ.
+        """
+        dropped = [session_id for session_id in self.sessions
+                   if session_id not in self._dirty and not self.is_pinned(session_id)]
+        for session_id in dropped:
+            self.sessions.pop(session_id, None)
+            self._last_access.pop(session_id, None)
+            self._shard_stamps.pop(session_id, None)
+        self.index = {}
+        if self.shared:
+            with file_lock(self.index_file):
+                self._load_index()
+        else:
+            self._load_index()
+        self._index_loaded = True
+        for session_id in set(self._dirty) | set(self.sessions):
+            if session_id in self.sessions:
+                self.index[session_id] = self._build_meta(self.sessions[session_id])
+            else:
+                self.index.pop(session_id, None)
+        logger.info(f"Đã tải lại index session ({len(self.index)} session), bỏ {len(dropped)} session khỏi bộ nhớ.")
+        return len(dropped)
+
+    def list_sessions(self) -> Dict[str, Dict[str, Any]]:
+        """Metadata của tất cả session (đọc từ index, không tải nội dung)."""
+        self._ensure_index()
+        self._refresh_index()
+        return {session_id: dict(meta) for session_id, meta in self.index.items()}
 
 session_manager = SessionManager()
\ No newline at end of file
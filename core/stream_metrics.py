@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+# Số request stream gần nhất dùng để tính phân vị
+STREAM_METRICS_WINDOW = 500
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class StreamTimer:
+    """Đo thời gian của một request stream: TTFB, token đầu tiên và khoảng cách giữa các chunk."""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.first_byte: Optional[float] = None
+        self.first_token: Optional[float] = None
+        self.last_chunk: Optional[float] = None
+        self.gaps: List[float] = []
+        self.chunks = 0
+
+    def frame(self) -> None:
+        """Gọi mỗi khi một frame (bất kỳ) được gửi cho client."""
+        if self.first_byte is None:
+            self.first_byte = time.perf_counter()
+
+    def token(self) -> None:
+        """Gọi mỗi khi một chunk nội dung được gửi cho client."""
+        now = time.perf_counter()
+        if self.first_byte is None:
+            self.first_byte = now
+        if self.first_token is None:
+            self.first_token = now
+        if self.last_chunk is not None:
+            self.gaps.append(now - self.last_chunk)
+        self.last_chunk = now
+        self.chunks += 1
+
+    def summary(self) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round((value - self.started) * 1000, 3) if value is not None else None
+        gaps_ms = [gap * 1000 for gap in self.gaps]
+        return {
+            "ttfb_ms": ms(self.first_byte),
+            "first_token_ms": ms(self.first_token),
+            "total_ms": ms(time.perf_counter()),
+            "chunks": self.chunks,
+            "inter_chunk_avg_ms": round(sum(gaps_ms) / len(gaps_ms), 3) if gaps_ms else 0.0,
+            "inter_chunk_p95_ms": round(_percentile(gaps_ms, 95), 3),
+            "inter_chunk_max_ms": round(max(gaps_ms), 3) if gaps_ms else 0.0,
+        }
+
+
+class StreamMetrics:
+    """Tổng hợp số liệu của các request stream gần nhất (p50/p95 TTFB, token đầu, khoảng cách chunk)."""
+
+    def __init__(self, window: int = STREAM_METRICS_WINDOW):
+        self._recent: deque = deque(maxlen=window)
+        self.streams_total = 0
+        self.streams_failed = 0
+
+    def record(self, summary: Dict[str, Any], failed: bool = False) -> None:
+        self.streams_total += 1
+        if failed:
+            self.streams_failed += 1
+        self._recent.append(summary)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        def values(key: str) -> List[float]:
+            return [item[key] for item in self._recent if item.get(key) is not None]
+        ttfb, first_token, gap_p95 = values("ttfb_ms"), values("first_token_ms"), values("inter_chunk_p95_ms")
+        return {
+            "streams_total": self.streams_total,
+            "streams_failed": self.streams_failed,
+            "window": len(self._recent),
+            "ttfb_p50_ms": round(_percentile(ttfb, 50), 3),
+            "ttfb_p95_ms": round(_percentile(ttfb, 95), 3),
+            "first_token_p50_ms": round(_percentile(first_token, 50), 3),
+            "first_token_p95_ms": round(_percentile(first_token, 95), 3),
+            "inter_chunk_p95_ms": round(_percentile(gap_p95, 95), 3),
+        }
+
+
+# Singleton instance
+stream_metrics = StreamMetrics()
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import re
+import json
+from typing import Dict, Any, List, Optional
+
+from config.settings import (
+    openai_model, CONTEXT_TOKEN_BUDGET, CONTEXT_SUMMARY_MAX_TOKENS, MODEL_CONTEXT_TOKENS,
+    RETRIEVED_CONTEXT_TOKENS,
+)
+from config.logging_config import logger
+
+try:
+    import tiktoken
+except ImportError: # tiktoken là tùy chọn
+    tiktoken = None
+
+# Overhead cố định của mỗi message (role, phân cách) và chi phí một ảnh ở chế độ low detail
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+IMAGE_PART_TOKENS = 85
+FALLBACK_ENCODING = "o200k_base"
+
+# Trần max_tokens (completion) theo từng loại lời gọi; giá trị thực tế còn bị giới hạn bởi
+# phần còn trống của context window của model
+COMPLETION_TOKEN_CAPS: Dict[str, int] = {
+    "chat": 2048,
+    "chat_tool_summary": 1024,
+    "search_intent": 150,
+    "intent_router": 200,
+    "weather_query": 150,
+    "weather_advice_intent": 150,
+    "search_summary": 1500,
+    "feng_shui": 2000,
+    "image_analysis": 1000,
+    "chat_summary": 100,
+    "context_summary": CONTEXT_SUMMARY_MAX_TOKENS,
+}
+# Trần token của phần nội dung đầu vào được tóm tắt/tổng hợp
+INPUT_TOKEN_CAPS: Dict[str, int] = {
+    "chat_summary": 1500,
+    "context_summary": 2000,
+}
+MIN_COMPLETION_TOKENS = 64
+
+# Ước lượng khi không có tiktoken: từ ASCII ~ 1 token/6 ký tự, âm tiết tiếng Việt có dấu ~ 1 token/3 ký tự,
+# số ~ 1 token/3 chữ số, mỗi ký tự đặc biệt 1 token
+_WORD_RE = re.compile(r"\d+|[^\W\d_]+|[^\w\s]|_")
+
+
+def _heuristic_count(text: str) -> int:
+    tokens = 0
+    for piece in _WORD_RE.findall(text):
+        if piece.isascii() and piece.isalpha():
+            tokens += 1 + len(piece) // 6
+        elif piece.isdigit():
+            tokens += 1 + (len(piece) - 1) // 3
+        elif piece.isalpha():
+            tokens += 1 + len(piece) // 3
+        else:
+            tokens += 1
+    return tokens
+
+
+class TokenCounter:
+    """Đếm token tại chỗ, tương thích tokenizer của model khi có tiktoken (không cần gọi API)."""
+
+    def __init__(self, model: str = openai_model):
+        self._encoding = self._load_encoding(model)
+        self.backend = "tiktoken" if self._encoding is not None else "heuristic"
+
+    @staticmethod
+    def _load_encoding(model: str) -> Any:
+        if tiktoken is None:
+            return None
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            pass
+        except Exception as e:
+            logger.warning(f"Không tải được tokenizer cho model '{model}': {e}. Dùng ước lượng.")
+            return None
+        try:
+            return tiktoken.get_encoding(FALLBACK_ENCODING)
+        except Exception as e:
+            logger.warning(f"Không tải được tokenizer {FALLBACK_ENCODING}: {e}. Dùng ước lượng.")
+            return None
+
+    def count(self, text: Optional[str]) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return _heuristic_count(text)
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        """Số token của một message OpenAI (text, ảnh, tool_calls)."""
+        tokens = MESSAGE_OVERHEAD_TOKENS
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += self.count(content)
+        elif isinstance(content, list):
+            for item in content:
+                if not isinstance(item, dict):
+                    tokens += self.count(str(item))
+                elif item.get("type") == "image_url":
+                    tokens += IMAGE_PART_TOKENS
+                else:
+                    tokens += self.count(item.get("text") or item.get("html") or "")
+        elif content is not None:
+            tokens += self.count(str(content))
+        if message.get("tool_calls"):
+            tokens += self.count(json.dumps(message["tool_calls"], ensure_ascii=False, default=str))
+        return tokens
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        return sum(self.count_message(message) for message in messages) + REPLY_PRIMING_TOKENS
+
+    def truncate(self, text: str, max_tokens: int, keep_end: bool = False) -> str:
+        """Cắt `text` còn tối đa `max_tokens` token (giữ phần đầu, hoặc phần cuối nếu keep_end)."""
+        if max_tokens <= 0 or not text:
+            return ""
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            kept = tokens[-max_tokens:] if keep_end else tokens[:max_tokens]
+            return self._encoding.decode(kept)
+        total = self.count(text)
+        if total <= max_tokens:
+            return text
+        cut = len(text) * max_tokens // total
+        while cut > 0:
+            piece = text[-cut:] if keep_end else text[:cut]
+            if self.count(piece) <= max_tokens:
+                return piece
+            cut = cut * 9 // 10
+        return ""
+
+
+class TokenBudgetManager:
+    """
+    Chia ngân sách prompt (CONTEXT_TOKEN_BUDGET) cho system prompt, ngữ cảnh truy xuất và lịch sử,
+    chọn max_tokens cho từng lời gọi và ghi log số token ước lượng cạnh số token API báo về.
+    """
+
+    def __init__(self, counter: TokenCounter, prompt_budget: int = CONTEXT_TOKEN_BUDGET,
+                 retrieved_tokens: int = RETRIEVED_CONTEXT_TOKENS, model_context: int = MODEL_CONTEXT_TOKENS):
+        self.counter = counter
+        self.prompt_budget = prompt_budget
+        self.retrieved_tokens = retrieved_tokens
+        self.model_context = model_context
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+
+    def history_budget(self, system_tokens: int) -> int:
+        """Phần ngân sách cho lịch sử (kể cả tóm tắt) sau khi trừ system prompt và phần dành cho ngữ cảnh truy xuất."""
+        return max(0, self.prompt_budget - system_tokens - self.retrieved_tokens)
+
+    def fit_retrieved(self, text: str, used_tokens: int) -> str:
+        """Cắt ngữ cảnh truy xuất cho vừa phần ngân sách còn lại (tối thiểu RETRIEVED_CONTEXT_TOKENS)."""
+        allowance = max(self.retrieved_tokens, self.prompt_budget - used_tokens)
+        fitted = self.counter.truncate(text, allowance)
+        if len(fitted) < len(text):
+            logger.info(f"Cắt ngữ cảnh truy xuất còn {allowance} token (prompt đã dùng {used_tokens}).")
+        return fitted
+
+    def fit_input(self, call: str, text: str, keep_end: bool = False) -> str:
+        """Cắt phần nội dung đầu vào của một lời gọi tóm tắt/tổng hợp theo INPUT_TOKEN_CAPS."""
+        cap = INPUT_TOKEN_CAPS.get(call)
+        return self.counter.truncate(text, cap, keep_end=keep_end) if cap else text
+
+    def max_tokens(self, call: str, prompt_tokens: int, cap: Optional[int] = None) -> int:
+        """max_tokens cho lời gọi: trần của loại lời gọi, không vượt phần còn trống của context window."""
+        cap = cap if cap is not None else COMPLETION_TOKEN_CAPS.get(call, COMPLETION_TOKEN_CAPS["chat"])
+        room = self.model_context - prompt_tokens
+        return max(MIN_COMPLETION_TOKENS, min(cap, room))
+
+    def record(self, call: str, estimated_prompt: int, usage: Any = None, max_tokens: Optional[int] = None) -> None:
+        """Ghi log và thống kê token ước lượng so với `usage` API trả về (None nếu không có, vd. stream)."""
+        stats = self.metrics.setdefault(call, {
+            "calls": 0, "estimated_prompt_tokens": 0, "reported_calls": 0,
+            "estimated_reported_prompt_tokens": 0, "actual_prompt_tokens": 0, "completion_tokens": 0,
+        })
+        stats["calls"] += 1
+        stats["estimated_prompt_tokens"] += estimated_prompt
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        if prompt_tokens is None:
+            logger.info(f"Token [{call}]: ước lượng prompt {estimated_prompt}, max_tokens {max_tokens}")
+            return
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        stats["reported_calls"] += 1
+        stats["estimated_reported_prompt_tokens"] += estimated_prompt
+        stats["actual_prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        logger.info(f"Token [{call}]: ước lượng prompt {estimated_prompt}, thực tế {prompt_tokens} "
+                    f"({(prompt_tokens - estimated_prompt):+d}), completion {completion_tokens}/{max_tokens}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        calls = {}
+        for call, stats in self.metrics.items():
+            estimated = stats["estimated_reported_prompt_tokens"]
+            calls[call] = {
+                **stats,
+                # Tỉ lệ thực tế/ước lượng: ~1.0 nghĩa là bộ đếm tại chỗ khớp tokenizer của API
+                "actual_to_estimated": round(stats["actual_prompt_tokens"] / estimated, 3) if estimated else None,
+            }
+        return {
+            "backend": self.counter.backend,
+            "prompt_budget": self.prompt_budget,
+            "retrieved_tokens": self.retrieved_tokens,
+            "model_context": self.model_context,
+            "calls": calls,
+        }
+
+
+# Singleton instance
+token_counter = TokenCounter()
+budget_manager = TokenBudgetManager(token_counter)
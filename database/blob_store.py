@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import os
+import re
+import uuid
+import base64
+import hashlib
+import mimetypes
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from config.settings import BLOBS_DIR, BLOB_RESOLVE_CACHE_MAX_BYTES
+from config.logging_config import logger
+
+# Tham chiếu lưu trong message thay cho data URL: "blob://<sha256>.<ext>"
+BLOB_REF_PREFIX = "blob://"
+_DATA_URL_RE = re.compile(r"^data:(?P<mime>[\w.+-]+/[\w.+-]+)?(?P<params>(;[^;,]*)*?);base64,", re.IGNORECASE)
+_BLOB_NAME_RE = re.compile(r"^[0-9a-f]{64}(\.[0-9a-z]+)?$")
+
+
+class BlobStore:
+    """
+    Kho nội dung nhị phân (ảnh, audio) trên đĩa, định địa chỉ theo SHA-256 nên
+    cùng một nội dung chỉ được lưu một lần. Session/lịch sử chỉ giữ tham chiếu
+    ngắn; tham chiếu được đổi lại thành data URL khi thật sự gửi lên upstream.
+    Data URL đã dựng lại được cache LRU giới hạn theo tổng dung lượng (không theo số
+    mục, vì mỗi mục là cả một ảnh base64).
+    """
+
+    def __init__(self, blobs_dir: str = BLOBS_DIR, resolve_cache_max_bytes: int = BLOB_RESOLVE_CACHE_MAX_BYTES):
+        self.blobs_dir = blobs_dir
+        self.resolve_cache_max_bytes = resolve_cache_max_bytes
+        self._resolved: "OrderedDict[str, str]" = OrderedDict()
+        self._resolved_bytes = 0
+        self.metrics = {
+            "resolve_hits": 0,
+            "resolve_misses": 0,
+            "resolve_evictions": 0,
+        }
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.blobs_dir, name[:2], name)
+
+    def put(self, data: bytes, mime_type: Optional[str] = None) -> Optional[str]:
+        """Lưu nội dung (bỏ qua nếu đã có) và trả về tham chiếu, hoặc None nếu lỗi."""
+        digest = hashlib.sha256(data).hexdigest()
+        extension = (mimetypes.guess_extension(mime_type) if mime_type else None) or ".bin"
+        name = digest + extension
+        path = self._path(name)
+        if not os.path.exists(path):
+            temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except OSError as e:
+                logger.error(f"Lỗi khi ghi blob {name}: {e}", exc_info=True)
+                return None
+            finally:
+                if os.path.exists(temp_path):
+                    try: os.remove(temp_path)
+                    except OSError: pass
+        return BLOB_REF_PREFIX + name
+
+    def put_data_url(self, url: str) -> str:
+        """Chuyển data URL base64 thành tham chiếu blob; URL khác (http...) giữ nguyên."""
+        match = _DATA_URL_RE.match(url or "")
+        if not match:
+            return url
+        try:
+            data = base64.b64decode(url[match.end():], validate=False)
+        except (ValueError, base64.binascii.Error) as e:
+            logger.error(f"Data URL base64 không hợp lệ, giữ nguyên trong message: {e}")
+            return url
+        return self.put(data, match.group("mime")) or url
+
+    @staticmethod
+    def is_ref(url: Any) -> bool:
+        return isinstance(url, str) and url.startswith(BLOB_REF_PREFIX)
+
+    def path_for(self, name: str) -> Optional[str]:
+        """Đường dẫn file của blob theo tên (sha256.ext), None nếu tên không hợp lệ hoặc không tồn tại."""
+        if not _BLOB_NAME_RE.match(name):
+            return None
+        path = self._path(name)
+        return path if os.path.exists(path) else None
+
+    def resolve(self, ref: str) -> Optional[str]:
+        """Đổi tham chiếu blob thành data URL base64 (có cache vì nội dung bất biến)."""
+        data_url = self._resolved.get(ref)
+        if data_url is not None:
+            self._resolved.move_to_end(ref)
+            self.metrics["resolve_hits"] += 1
+            return data_url
+        self.metrics["resolve_misses"] += 1
+        data_url = self._read_data_url(ref)
+        if data_url is not None and len(data_url) <= self.resolve_cache_max_bytes:
+            self._resolved[ref] = data_url
+            self._resolved_bytes += len(data_url)
+            while self._resolved_bytes > self.resolve_cache_max_bytes:
+                _, evicted = self._resolved.popitem(last=False)
+                self._resolved_bytes -= len(evicted)
+                self.metrics["resolve_evictions"] += 1
+        return data_url
+
+    def _read_data_url(self, ref: str) -> Optional[str]:
+        name = ref[len(BLOB_REF_PREFIX):]
+        if not _BLOB_NAME_RE.match(name):
+            logger.error(f"Tham chiếu blob không hợp lệ: {ref}")
+            return None
+        try:
+            with open(self._path(name), "rb") as f:
+                data = f.read()
+        except OSError as e:
+            logger.error(f"Không đọc được blob {name}: {e}")
+            return None
+        mime_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "resolve_cache_entries": len(self._resolved),
+            "resolve_cache_bytes": self._resolved_bytes,
+            "resolve_cache_max_bytes": self.resolve_cache_max_bytes,
+        }
+
+    def externalize_messages(self, messages: Optional[List[Dict[str, Any]]]) -> int:
+        """Thay tại chỗ các data URL trong image_url của messages bằng tham chiếu blob. Returns số phần đã thay."""
+        replaced = 0
+        for msg in messages or []:
+            content = msg.get("content") if isinstance(msg, dict) else None
+            if not isinstance(content, list):
+                continue
+            for item in content:
+                image_url = item.get("image_url") if isinstance(item, dict) else None
+                url = image_url.get("url") if isinstance(image_url, dict) else None
+                if url and url.startswith("data:"):
+                    ref = self.put_data_url(url)
+                    if ref != url:
+                        image_url["url"] = ref
+                        replaced += 1
+        return replaced
+
+    def resolve_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Bản sao message với tham chiếu blob đã đổi thành data URL (message không có blob được trả nguyên)."""
+        content = message.get("content")
+        if not isinstance(content, list) or not any(
+                isinstance(item, dict) and self.is_ref((item.get("image_url") or {}).get("url")) for item in content):
+            return message
+        resolved_content = []
+        for item in content:
+            url = (item.get("image_url") or {}).get("url") if isinstance(item, dict) else None
+            if self.is_ref(url):
+                data_url = self.resolve(url)
+                if data_url is None:
+                    resolved_content.append({"type": "text", "text": "[Ảnh không còn khả dụng]"})
+                    continue
+                item = {**item, "image_url": {**item["image_url"], "url": data_url}}
+            resolved_content.append(item)
+        return {**message, "content": resolved_content}
+
+
+# Singleton instance
+blob_store = BlobStore()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Optional
+
+from config.settings import DATA_CODEC
+from config.logging_config import logger
+from database.records import to_plain
+
+try:
+    import msgpack
+except ImportError: # msgpack là tùy chọn
+    msgpack = None
+
+CODEC_JSON = "json"                  # JSON indent=2 (định dạng cũ, dễ đọc)
+CODEC_JSON_COMPACT = "json-compact"  # JSON rút gọn, không khoảng trắng
+CODEC_MSGPACK = "msgpack"            # Nhị phân: BINARY_MAGIC + payload msgpack
+SUPPORTED_CODECS = (CODEC_JSON, CODEC_JSON_COMPACT, CODEC_MSGPACK)
+
+# Header nhận diện file nhị phân; file JSON luôn bắt đầu bằng '{', '[' hoặc khoảng trắng
+BINARY_MAGIC = b"\x00FAM1"
+
+
+def resolve_codec(codec: Optional[str] = None) -> str:
+    """Chuẩn hóa tên codec, fallback về json-compact nếu msgpack chưa được cài."""
+    name = (codec or DATA_CODEC or CODEC_JSON).lower()
+    if name not in SUPPORTED_CODECS:
+        logger.warning(f"Codec '{name}' không được hỗ trợ, dùng '{CODEC_JSON}'.")
+        return CODEC_JSON
+    if name == CODEC_MSGPACK and msgpack is None:
+        logger.warning("Chưa cài msgpack, dùng codec 'json-compact' thay thế.")
+        return CODEC_JSON_COMPACT
+    return name
+
+
+# Codec dùng khi ghi, xác định một lần lúc import
+ACTIVE_CODEC = resolve_codec()
+
+
+def encode(data: Any, codec: Optional[str] = None) -> bytes:
+    """Mã hóa dữ liệu theo codec cấu hình (hoặc codec chỉ định)."""
+    name = resolve_codec(codec) if codec else ACTIVE_CODEC
+    if name == CODEC_MSGPACK:
+        return BINARY_MAGIC + msgpack.packb(data, use_bin_type=True, default=to_plain)
+    if name == CODEC_JSON_COMPACT:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=to_plain).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, indent=2, default=to_plain).encode("utf-8")
+
+
+def decode(payload: bytes) -> Any:
+    """
+    Giải mã và tự nhận diện định dạng: nhị phân (có BINARY_MAGIC) hoặc JSON
+    (indent hay rút gọn đều được). Raises ValueError nếu dữ liệu không hợp lệ.
+    """
+    if payload.startswith(BINARY_MAGIC):
+        if msgpack is None:
+            raise ValueError("Dữ liệu ở định dạng msgpack nhưng chưa cài thư viện msgpack.")
+        try:
+            return msgpack.unpackb(payload[len(BINARY_MAGIC):], raw=False, strict_map_key=False)
+        except Exception as e:
+            raise ValueError(f"Dữ liệu msgpack không hợp lệ: {e}") from e
+    try:
+        return json.loads(payload.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Dữ liệu JSON không hợp lệ: {e}") from e
+
+
+def detect_codec(payload: bytes) -> str:
+    """Xác định codec của dữ liệu đã lưu (dùng cho log/benchmark)."""
+    if payload.startswith(BINARY_MAGIC):
+        return CODEC_MSGPACK
+    return CODEC_JSON_COMPACT if b"\n" not in payload[:200] else CODEC_JSON
@@ -2,81 +2,536 @@ from __future__ import annotations
 
 import os
 import json
-import shutil
-from typing import Dict, Any, Optional
+import uuid
+import itertools
+import threading
+import contextvars
+from collections.abc import Mapping, MutableMapping
+from typing import Dict, Any, Optional, List, Callable, Iterable, Set, Tuple
 
 from config.settings import (
-    FAMILY_DATA_FILE, EVENTS_DATA_FILE, NOTES_DATA_FILE, CHAT_HISTORY_FILE
+    FAMILY_DATA_FILE, EVENTS_DATA_FILE, NOTES_DATA_FILE, CHAT_HISTORY_FILE,
+    DATA_JOURNAL_ENABLED, JOURNAL_COMPACT_THRESHOLD_BYTES, STORAGE_ENGINE, SQLITE_DB_FILE,
+    MULTIPROCESS_STORAGE_ENABLED
 )
 from config.logging_config import logger
+from database import codec
+from database.journal import JournalWriter, replay_journal, journal_path_for
+from database.file_lock import file_lock, file_stamp
+from database.event_index import event_index
+from database.history_index import history_index
+from database.sqlite_store import SqliteDatabase, SqliteTable
+from database.records import MemberRecord, EventRecord, NoteRecord, to_plain
 
-# Global data containers
+def _event_participants(event: Any) -> List[Any]:
+    return (event.get("participants") or []) if isinstance(event, Mapping) else []
+
+def _note_tags(note: Any) -> List[Any]:
+    return (note.get("tags") or []) if isinstance(note, Mapping) else []
+
+def _history_session_ids(entries: Any) -> List[Any]:
+    if not isinstance(entries, list):
+        return []
+    return [entry.get("session_id") for entry in entries if isinstance(entry, dict)]
+
+# Cấu trúc bảng cho SQLite engine: cột đơn trị + cột đa trị được index
+SQLITE_TABLE_SPECS: Dict[str, Dict[str, Any]] = {
+    FAMILY_DATA_FILE: {"name": "family", "index_columns": [], "multi_index": {},
+                       "record_type": MemberRecord},
+    EVENTS_DATA_FILE: {"name": "events", "index_columns": ["created_by", "date", "category"],
+                       "multi_index": {"participants": _event_participants}, "record_type": EventRecord},
+    NOTES_DATA_FILE: {"name": "notes", "index_columns": ["created_by"],
+                      "multi_index": {"tags": _note_tags}, "record_type": NoteRecord},
+    CHAT_HISTORY_FILE: {"name": "chat_history", "index_columns": [],
+                        "multi_index": {"session_id": _history_session_ids}},
+}
+
+def open_sqlite_store(db_path: str) -> Dict[str, SqliteTable]:
+    """Tạo database SQLite (mở ở lần truy cập đầu tiên) và trả về bảng tương ứng với từng file dữ liệu."""
+    db = SqliteDatabase(db_path)
+    return {
+        file_path: db.table(spec["name"], spec["index_columns"], spec["multi_index"],
+                            record_type=spec.get("record_type"))
+        for file_path, spec in SQLITE_TABLE_SPECS.items()
+    }
+
+# Global data containers (SQLite engine: bảng giống dict, database chỉ được mở ở lần truy cập đầu tiên)
 family_data: Dict[str, Any] = {}
 events_data: Dict[str, Any] = {}
 notes_data: Dict[str, Any] = {}
 chat_history: Dict[str, Any] = {}
 
+_sqlite_tables: Dict[str, SqliteTable] = {}
+if STORAGE_ENGINE == "sqlite":
+    _sqlite_tables = open_sqlite_store(SQLITE_DB_FILE)
+    family_data = _sqlite_tables[FAMILY_DATA_FILE]
+    events_data = _sqlite_tables[EVENTS_DATA_FILE]
+    notes_data = _sqlite_tables[NOTES_DATA_FILE]
+    chat_history = _sqlite_tables[CHAT_HISTORY_FILE]
+elif STORAGE_ENGINE != "json":
+    logger.warning(f"STORAGE_ENGINE '{STORAGE_ENGINE}' không hợp lệ, dùng engine 'json'.")
+
+# Journal ghi offset theo từng process nên không an toàn khi nhiều worker cùng ghi
+JOURNAL_ACTIVE = DATA_JOURNAL_ENABLED and STORAGE_ENGINE != "sqlite" and not MULTIPROCESS_STORAGE_ENABLED
+if DATA_JOURNAL_ENABLED and MULTIPROCESS_STORAGE_ENABLED:
+    logger.warning("DATA_JOURNAL_ENABLED bị bỏ qua khi bật MULTIPROCESS_STORAGE_ENABLED.")
+
+# Journal writer cho từng file (chỉ dùng khi JOURNAL_ACTIVE)
+_journal_writers: Dict[str, JournalWriter] = {}
+
+# Dấu (mtime, size, inode) của file (và journal) lúc process này đọc/ghi lần cuối,
+# dùng để phát hiện thay đổi từ worker khác hoặc file bị sửa từ bên ngoài
+_file_stamps: Dict[str, Any] = {}
+
+def _store_stamp(file_path: str) -> Any:
+    if JOURNAL_ACTIVE:
+        return (file_stamp(file_path), file_stamp(journal_path_for(file_path)))
+    return file_stamp(file_path)
+
+# Callback khi nội dung một store được tải lại/thay đổi từ bên ngoài (rebuild index, cache...)
+_change_listeners: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+
+def on_store_changed(file_path: str, callback: Callable[[Dict[str, Any]], None]) -> None:
+    """Đăng ký callback(data) được gọi sau khi store của file_path được tải lại."""
+    _change_listeners.setdefault(file_path, []).append(callback)
+
+# Bộ đếm thay đổi của từng store trong process này (tăng sau mỗi lần ghi qua Repository hoặc
+# khi tải lại từ đĩa); cache dẫn xuất từ dữ liệu (vd. system prompt) so sánh để biết khi nào tính lại
+_store_versions: Dict[str, int] = {}
+
+def bump_store_version(file_path: str) -> None:
+    _store_versions[file_path] = _store_versions.get(file_path, 0) + 1
+
+def store_version(file_path: str) -> int:
+    return _store_versions.get(file_path, 0)
+
+def _notify_store_changed(file_path: str, data: Dict[str, Any]) -> None:
+    bump_store_version(file_path)
+    for callback in _change_listeners.get(file_path, []):
+        try:
+            callback(data)
+        except Exception as e:
+            logger.error(f"Lỗi khi xử lý thay đổi dữ liệu của {file_path}: {e}", exc_info=True)
+
+on_store_changed(EVENTS_DATA_FILE, event_index.rebuild)
+on_store_changed(CHAT_HISTORY_FILE, history_index.rebuild)
+
+def _stores() -> Dict[str, Dict[str, Any]]:
+    return {
+        FAMILY_DATA_FILE: family_data,
+        EVENTS_DATA_FILE: events_data,
+        NOTES_DATA_FILE: notes_data,
+        CHAT_HISTORY_FILE: chat_history,
+    }
+
+class StoreLoadError(RuntimeError):
+    """File dữ liệu tồn tại nhưng không đọc/giải mã được (vd. file msgpack khi chưa cài msgpack)."""
+
 def load_data(file_path: str) -> Dict[str, Any]:
     """
-    Load data from JSON file.
-    Returns empty dict if file does not exist or error occurs.
+    Load data from file (JSON or binary, auto-detected).
+    Returns empty dict if file does not exist.
+    Raises StoreLoadError nếu file tồn tại nhưng không đọc/giải mã được: trả về dữ
+    liệu trống ở đây sẽ khiến lần lưu kế tiếp ghi đè và xóa sạch store trên đĩa.
+    """
+    if not os.path.exists(file_path):
+        return {}
+    try:
+        with open(file_path, "rb") as f:
+            data = codec.decode(f.read())
+    except (OSError, ValueError) as e:
+        logger.critical(f"Không thể đọc {file_path}: {e}. Dừng tải để không ghi đè dữ liệu trên đĩa.")
+        raise StoreLoadError(f"Không thể đọc {file_path}: {e}") from e
+    if not isinstance(data, dict):
+        logger.critical(f"Dữ liệu trong {file_path} không phải từ điển. Dừng tải để không ghi đè dữ liệu trên đĩa.")
+        raise StoreLoadError(f"Dữ liệu trong {file_path} không phải từ điển ({type(data).__name__})")
+    return data
+
+# Thứ tự các snapshot đã mã hóa: payload được ghi (có thể ở luồng khác) sau khi mã hóa,
+# nên một snapshot cũ ghi muộn không được đè lên snapshot mới hơn của cùng file
+_encode_seq = itertools.count(1)
+_written_seq: Dict[str, int] = {}
+_write_locks: Dict[str, threading.Lock] = {}
+
+def encode_store(file_path: str, data: Dict[str, Any]) -> Tuple[bytes, int]:
+    """Mã hóa snapshot của data (DATA_CODEC). Returns (payload, seq) để ghi bằng write_payload."""
+    return codec.encode(data), next(_encode_seq)
+
+def write_payload(file_path: str, payload: bytes, seq: int) -> bool:
+    """
+    Ghi payload đã mã hóa (file tạm + os.replace). Không đọc dữ liệu trong bộ nhớ nên
+    gọi được từ luồng khác; bỏ qua nếu snapshot mới hơn của file đã được ghi.
+    Returns True if successful, False otherwise.
     """
-    if os.path.exists(file_path):
+    with _write_locks.setdefault(file_path, threading.Lock()):
+        if seq < _written_seq.get(file_path, 0):
+            return True
+        # Tên file tạm riêng cho mỗi lần ghi để các lần lưu đồng thời không ghi đè lên nhau
+        temp_file_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if not isinstance(data, dict):
-                     logger.warning(f"Dữ liệu trong {file_path} không phải từ điển. Khởi tạo lại.")
-                     return {}
-                return data
-        except json.JSONDecodeError as e:
-            logger.error(f"Lỗi JSON khi đọc {file_path}: {e}. Trả về dữ liệu trống.")
-            return {}
+            os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+            with open(temp_file_path, "wb") as f:
+                f.write(payload)
+            os.replace(temp_file_path, file_path)
+            _written_seq[file_path] = seq
+            return True
         except Exception as e:
-            logger.error(f"Lỗi không xác định khi đọc {file_path}: {e}", exc_info=True)
-            return {}
-    return {}
+            logger.error(f"Lỗi khi lưu dữ liệu vào {file_path}: {e}", exc_info=True)
+            if os.path.exists(temp_file_path):
+                 try: os.remove(temp_file_path)
+                 except OSError as rm_err: logger.error(f"Không thể xóa file tạm {temp_file_path}: {rm_err}")
+            return False
 
 def save_data(file_path: str, data: Dict[str, Any]) -> bool:
     """
-    Save data to JSON file.
+    Save data to file using the configured codec (DATA_CODEC).
     Returns True if successful, False otherwise.
     """
     try:
-        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
-        temp_file_path = file_path + ".tmp"
-        with open(temp_file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        shutil.move(temp_file_path, file_path)
-        return True
+        payload, seq = encode_store(file_path, data)
     except Exception as e:
         logger.error(f"Lỗi khi lưu dữ liệu vào {file_path}: {e}", exc_info=True)
-        if os.path.exists(temp_file_path):
-             try: os.remove(temp_file_path)
-             except OSError as rm_err: logger.error(f"Không thể xóa file tạm {temp_file_path}: {rm_err}")
         return False
+    return write_payload(file_path, payload, seq)
+
+def snapshot_copy(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Tạo bản sao độc lập của dữ liệu để ghi snapshot từ luồng nền.
+    Thử lại vài lần nếu dict bị thay đổi trong lúc đang sao chép.
+    """
+    for _ in range(5):
+        try:
+            return json.loads(json.dumps(data, ensure_ascii=False, default=to_plain))
+        except RuntimeError:
+            continue
+    logger.error("Không thể tạo snapshot do dữ liệu liên tục thay đổi.")
+    return None
+
+def _get_journal_writer(file_path: str) -> JournalWriter:
+    writer = _journal_writers.get(file_path)
+    if writer is None:
+        writer = _journal_writers.setdefault(
+            file_path, JournalWriter(file_path, JOURNAL_COMPACT_THRESHOLD_BYTES)
+        )
+    return writer
+
+# Thứ tự áp dụng các thay đổi được hoãn ghi (rollback chạy theo thứ tự ngược lại)
+_undo_seq = itertools.count(1)
+
+class PersistBatch:
+    """
+    Các thay đổi được hoãn ghi trong lúc chạy một tool call: {file_path: (data, keys)},
+    kèm hàm hoàn tác trong bộ nhớ của từng thay đổi để dùng khi ghi gộp thất bại.
+    Mỗi batch chỉ được một luồng dùng; commit_persist_batches ghi gộp nhiều batch.
+    """
+
+    def __init__(self):
+        self.pending: Dict[str, Tuple[Dict[str, Any], Dict[str, None]]] = {}
+        self.undo: List[Tuple[int, str, str, Callable[[], None]]] = []
+
+    def add(self, file_path: str, data: Dict[str, Any], key: str,
+            undo: Optional[Callable[[], None]] = None) -> None:
+        self.pending.setdefault(file_path, (data, {}))[1][key] = None
+        if undo is not None:
+            self.undo.append((next(_undo_seq), file_path, key, undo))
+
+    @property
+    def files(self) -> Set[str]:
+        return set(self.pending)
+
+    def failed_in(self, failed: Dict[str, Set[str]]) -> bool:
+        """True nếu một thay đổi của batch nằm trong các key ghi thất bại ({file_path: keys})."""
+        return any(failed.get(file_path, set()).intersection(keys)
+                   for file_path, (_, keys) in self.pending.items())
+
+# Batch đang hoạt động trong context hiện tại (None: ghi ngay như bình thường)
+_active_batch: contextvars.ContextVar[Optional[PersistBatch]] = contextvars.ContextVar("persist_batch", default=None)
+
+def run_batched(batch: PersistBatch, func: Callable[..., Any], *args: Any) -> Any:
+    """Gọi func(*args) trong một context riêng mà mọi persist_change chỉ được ghi nhận vào `batch`."""
+    context = contextvars.copy_context()
+    context.run(_active_batch.set, batch)
+    return context.run(func, *args)
+
+def prepare_persist_batches(batches: Iterable[PersistBatch]) -> Tuple[Dict[str, Tuple[bytes, int, Set[str]]], Dict[str, Set[str]]]:
+    """
+    (Gọi trên luồng sở hữu dữ liệu, vd. event loop) Gộp các batch theo file. Chế độ journal/nhiều
+    worker ghi ngay từng key (cần khóa file và merge vào dữ liệu trong bộ nhớ); ngược lại chỉ mã hóa
+    snapshot của mỗi store để ghi sau bằng write_payload, có thể ở luồng khác.
+    Returns ({file_path: (payload, seq, keys)}, {file_path: các key đã ghi thất bại}).
+    """
+    merged: Dict[str, Tuple[Dict[str, Any], Dict[str, None]]] = {}
+    for batch in batches:
+        for file_path, (data, keys) in batch.pending.items():
+            merged.setdefault(file_path, (data, {}))[1].update(keys)
+    payloads: Dict[str, Tuple[bytes, int, Set[str]]] = {}
+    failed: Dict[str, Set[str]] = {}
+    for file_path, (data, keys) in merged.items():
+        if isinstance(data, SqliteTable):
+            # Mọi thay đổi của bảng trong một transaction
+            failed_keys = data.persist_many(keys)
+            if not finish_batch_write(file_path, not failed_keys, len(keys)):
+                failed[file_path] = failed_keys
+            continue
+        if MULTIPROCESS_STORAGE_ENABLED or JOURNAL_ACTIVE:
+            failed_keys = {key for key in keys if not persist_change(file_path, data, key)}
+            if not finish_batch_write(file_path, not failed_keys, len(keys)):
+                failed[file_path] = failed_keys
+            continue
+        try:
+            payload, seq = encode_store(file_path, data)
+        except Exception as e:
+            logger.error(f"Lỗi khi mã hóa {file_path}: {e}", exc_info=True)
+            finish_batch_write(file_path, False, len(keys))
+            failed[file_path] = set(keys)
+            continue
+        payloads[file_path] = (payload, seq, set(keys))
+    return payloads, failed
+
+def finish_batch_write(file_path: str, ok: bool, count: int) -> bool:
+    """Ghi log và cập nhật dấu file sau khi ghi gộp `count` thay đổi. Returns ok."""
+    if ok:
+        if not (MULTIPROCESS_STORAGE_ENABLED or JOURNAL_ACTIVE or file_path in _sqlite_tables):
+            _file_stamps[file_path] = _store_stamp(file_path)
+        logger.info(f"Đã ghi gộp {count} thay đổi vào {file_path}")
+    else:
+        logger.error(f"Ghi gộp {count} thay đổi vào {file_path} thất bại.")
+    return ok
+
+def rollback_persist_batches(batches: Iterable[PersistBatch], failed: Dict[str, Set[str]]) -> int:
+    """
+    Hoàn tác trong bộ nhớ (và index) các thay đổi chưa ghi được, theo thứ tự ngược với lúc áp dụng,
+    để dữ liệu trong bộ nhớ khớp với đĩa. Returns số thay đổi đã hoàn tác.
+    """
+    undos = sorted((entry for batch in batches for entry in batch.undo
+                    if entry[2] in failed.get(entry[1], ())), key=lambda entry: entry[0], reverse=True)
+    for _, file_path, key, undo in undos:
+        try:
+            undo()
+        except Exception as e:
+            logger.error(f"Lỗi khi rollback key {key} của {file_path}: {e}", exc_info=True)
+    if undos:
+        logger.info(f"Đã rollback {len(undos)} thay đổi trong bộ nhớ do ghi gộp thất bại.")
+    return len(undos)
+
+def commit_persist_batches(batches: Iterable[PersistBatch]) -> Dict[str, Set[str]]:
+    """
+    Ghi các thay đổi đã hoãn: một lần ghi file cho mỗi store (journal: mỗi key một bản ghi).
+    Thay đổi ghi thất bại được rollback trong bộ nhớ. Returns {file_path: các key ghi thất bại}.
+    """
+    batches = list(batches)
+    payloads, failed = prepare_persist_batches(batches)
+    for file_path, (payload, seq, keys) in payloads.items():
+        if not finish_batch_write(file_path, write_payload(file_path, payload, seq), len(keys)):
+            failed[file_path] = keys
+    rollback_persist_batches(batches, failed)
+    return failed
+
+def persist_change(file_path: str, data: Dict[str, Any], key: str, record: Any = None,
+                   undo: Optional[Callable[[], None]] = None) -> bool:
+    """
+    Lưu thay đổi của một key (thêm/sửa nếu key còn trong data, xóa nếu không).
+    Ở chế độ journal chỉ append một bản ghi gọn; ngược lại ghi lại toàn bộ file.
+    Trong run_batched, thay đổi chỉ được ghi nhận và ghi khi commit_persist_batches;
+    `undo` (hoàn tác thay đổi trong bộ nhớ) được gọi nếu lần ghi gộp đó thất bại.
+    `record`: object vừa sửa của key; SQLite engine ghi đúng object này (record
+    có thể đã bị đẩy khỏi cache của bảng giữa lúc sửa và lúc ghi). Thay đổi đã
+    stage trong SqliteTable cũng được hoãn tới lúc ghi gộp.
+    Returns True if successful, False otherwise.
+    """
+    batch = _active_batch.get()
+    if isinstance(data, SqliteTable):
+        if batch is not None and data.is_staged(key):
+            batch.add(file_path, data, key, undo)
+            return True
+        return data.persist(key, record)
+    if batch is not None:
+        batch.add(file_path, data, key, undo)
+        return True
+    if MULTIPROCESS_STORAGE_ENABLED:
+        return _persist_shared(file_path, data, key)
+    if not JOURNAL_ACTIVE:
+        if not save_data(file_path, data):
+            return False
+        _file_stamps[file_path] = _store_stamp(file_path)
+        return True
+
+    writer = _get_journal_writer(file_path)
+    writer.attach(data)
+    if key in data:
+        ok = writer.append("set", key, data[key])
+    else:
+        ok = writer.append("del", key)
+    if ok:
+        _file_stamps[file_path] = _store_stamp(file_path)
+    return ok
+
+def flush_store(file_path: str, data: Dict[str, Any]) -> bool:
+    """
+    Ghi toàn bộ dữ liệu xuống đĩa (dùng khi tắt server).
+    Ở chế độ journal sẽ compact snapshot và cắt journal.
+    """
+    if isinstance(data, SqliteTable):
+        return True # Mỗi thay đổi đã được commit ngay
+    if MULTIPROCESS_STORAGE_ENABLED:
+        return True # Mỗi thay đổi đã được ghi (có merge) ngay; ghi đè cả file sẽ làm mất dữ liệu của worker khác
+    if JOURNAL_ACTIVE:
+        return _get_journal_writer(file_path).compact(data)
+    return save_data(file_path, data)
+
+def _wrap_records(file_path: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    record_type = SQLITE_TABLE_SPECS.get(file_path, {}).get("record_type")
+    if record_type is not None:
+        for key, value in data.items():
+            data[key] = record_type.from_value(value)
+    return data
+
+def _swap_contents(target: Dict[str, Any], new_data: Dict[str, Any], keep_key: Optional[str] = None) -> bool:
+    """
+    Thay nội dung container tại chỗ để mọi module đã import nó đều thấy dữ liệu mới.
+    Thêm/sửa trước rồi mới xóa, và chỉ gán lại record thực sự khác, nên mỗi lần đọc
+    một key luôn thấy bản cũ hoặc bản mới đầy đủ (không bao giờ thấy store rỗng).
+    `keep_key` giữ nguyên giá trị trong bộ nhớ. Returns True nếu có thay đổi.
+    """
+    changed = False
+    for key, value in new_data.items():
+        if key != keep_key and (key not in target or target[key] != value):
+            target[key] = value
+            changed = True
+    for key in [k for k in target if k not in new_data and k != keep_key]:
+        del target[key]
+        changed = True
+    return changed
+
+def _read_store(file_path: str) -> Dict[str, Any]:
+    """Đọc trạng thái hiện tại trên đĩa (snapshot + journal nếu bật) để tải lại."""
+    data = load_data(file_path)
+    if JOURNAL_ACTIVE:
+        replay_journal(file_path, data)
+    return _wrap_records(file_path, data)
+
+def _merge_from_disk_locked(file_path: str, data: Dict[str, Any], keep_key: Optional[str] = None) -> bool:
+    """
+    (Gọi khi đang giữ khóa file) Nếu file đã bị process khác ghi, đưa nội dung
+    trên đĩa vào `data` tại chỗ; riêng `keep_key` giữ giá trị trong bộ nhớ vì đó
+    là thay đổi đang được lưu. Returns True nếu dữ liệu trong bộ nhớ thay đổi.
+    """
+    stamp = _store_stamp(file_path)
+    if stamp is None or stamp == _file_stamps.get(file_path):
+        return False
+    changed = _swap_contents(data, _read_store(file_path), keep_key=keep_key)
+    _file_stamps[file_path] = stamp
+    if changed:
+        logger.info(f"Đã đồng bộ {file_path} với thay đổi từ worker khác.")
+        _notify_store_changed(file_path, data)
+    return changed
+
+def _persist_shared(file_path: str, data: Dict[str, Any], key: str) -> bool:
+    """Ghi một thay đổi khi nhiều process cùng dùng file: khóa, merge với bản trên đĩa, rồi ghi."""
+    with file_lock(file_path):
+        try:
+            _merge_from_disk_locked(file_path, data, keep_key=key)
+        except StoreLoadError:
+            # Không merge được thì không ghi: ghi đè sẽ làm mất dữ liệu của worker khác
+            return False
+        if not save_data(file_path, data):
+            return False
+        _file_stamps[file_path] = _store_stamp(file_path)
+        return True
+
+def refresh_if_changed() -> List[str]:
+    """
+    Kiểm tra thay đổi do worker khác ghi (chế độ nhiều worker) và làm mới
+    dữ liệu trong bộ nhớ, cache record và index. Returns các file đã thay đổi.
+    """
+    changed: List[str] = []
+    if _sqlite_tables:
+        db = next(iter(_sqlite_tables.values())).db
+        changed_tables = set(db.changed_tables())
+        for file_path, table in _sqlite_tables.items():
+            if table.name in changed_tables:
+                _notify_store_changed(file_path, table)
+                changed.append(file_path)
+        return changed
+
+    for file_path, data in _stores().items():
+        if _store_stamp(file_path) == _file_stamps.get(file_path):
+            continue
+        with file_lock(file_path, shared=True):
+            try:
+                if _merge_from_disk_locked(file_path, data):
+                    changed.append(file_path)
+            except StoreLoadError:
+                continue # Giữ dữ liệu trong bộ nhớ, thử lại ở lần kiểm tra sau
+    return changed
+
+def select_records(data: Dict[str, Any], **filters: Any) -> Dict[str, Any]:
+    """
+    Lọc record theo field (AND giữa các điều kiện). Field dạng list (participants,
+    tags...) khớp nếu chứa giá trị cần tìm; value dạng list các entry (chat_history)
+    khớp nếu có ít nhất một entry khớp. SQLite engine dùng cột index,
+    JSON engine quét tuần tự.
+    """
+    if isinstance(data, SqliteTable):
+        return data.select(**filters)
+
+    def matches(record: Any) -> bool:
+        if isinstance(record, list):
+            return any(matches(entry) for entry in record)
+        if not isinstance(record, Mapping):
+            return False
+        for field, expected in filters.items():
+            actual = record.get(field)
+            if isinstance(actual, list):
+                if expected not in actual:
+                    return False
+            elif actual != expected:
+                return False
+        return True
+
+    return {key: value for key, value in data.items() if matches(value)}
+
+def load_store(file_path: str) -> Dict[str, Any]:
+    """
+    Tải snapshot và (ở chế độ journal) replay journal lên trên, sau đó chuyển
+    các record sang kiểu gọn (EventRecord...) nếu file có kiểu record riêng.
+    Nếu journal đang tắt mà vẫn còn file journal cũ, gộp nó vào snapshot rồi xóa
+    để các lần ghi sau không bị journal cũ ghi đè khi tải lại.
+    """
+    data = load_data(file_path)
+    if JOURNAL_ACTIVE:
+        replay_journal(file_path, data)
+    elif os.path.exists(journal_path_for(file_path)):
+        with file_lock(file_path):
+            data = load_data(file_path)
+            if replay_journal(file_path, data) and not save_data(file_path, data):
+                logger.error(f"Không thể gộp journal cũ vào {file_path}, giữ nguyên journal.")
+            else:
+                os.remove(journal_path_for(file_path))
+                logger.info(f"Đã gộp journal cũ vào snapshot {file_path}.")
+    return _wrap_records(file_path, data)
 
 def verify_data_structure():
     """Kiểm tra và đảm bảo cấu trúc dữ liệu ban đầu."""
     global family_data, events_data, notes_data, chat_history
     needs_save = False
 
-    if not isinstance(family_data, dict):
+    if not isinstance(family_data, MutableMapping):
         logger.warning("family_data không phải từ điển. Khởi tạo lại.")
         family_data = {}
         needs_save = True
 
-    if not isinstance(events_data, dict):
+    if not isinstance(events_data, MutableMapping):
         logger.warning("events_data không phải từ điển. Khởi tạo lại.")
         events_data = {}
         needs_save = True
 
-    if not isinstance(notes_data, dict):
+    if not isinstance(notes_data, MutableMapping):
         logger.warning("notes_data không phải từ điển. Khởi tạo lại.")
         notes_data = {}
         needs_save = True
 
-    if not isinstance(chat_history, dict):
+    if not isinstance(chat_history, MutableMapping):
         logger.warning("chat_history không phải từ điển. Khởi tạo lại.")
         chat_history = {}
         needs_save = True
@@ -89,11 +544,67 @@ def verify_data_structure():
         save_data(CHAT_HISTORY_FILE, chat_history)
 
 def load_all_data():
-    """Load all data from files"""
-    global family_data, events_data, notes_data, chat_history
-    
-    family_data = load_data(FAMILY_DATA_FILE)
-    events_data = load_data(EVENTS_DATA_FILE)
-    notes_data = load_data(NOTES_DATA_FILE)
-    chat_history = load_data(CHAT_HISTORY_FILE)
-    verify_data_structure()
\ No newline at end of file
+    """
+    Load all data from files (in place, giữ nguyên các object container đã được import).
+    Raises StoreLoadError nếu một file không giải mã được (server không khởi động
+    thay vì chạy với store trống rồi ghi đè file).
+    """
+    if STORAGE_ENGINE == "sqlite":
+        logger.info(f"SQLite engine: {len(family_data)} thành viên, {len(events_data)} sự kiện, "
+                    f"{len(notes_data)} ghi chú trong {SQLITE_DB_FILE}")
+    else:
+        for file_path, data in _stores().items():
+            with file_lock(file_path):
+                _file_stamps[file_path] = _store_stamp(file_path)
+                _swap_contents(data, load_store(file_path))
+        verify_data_structure()
+
+    for file_path, data in _stores().items():
+        _notify_store_changed(file_path, data)
+
+def read_changed_stores(force: bool = False) -> Dict[str, Any]:
+    """
+    Đọc (ngoài event loop) các file dữ liệu đã thay đổi trên đĩa so với lần
+    đọc/ghi cuối của process này, hoặc tất cả nếu force=True.
+    Returns {file_path: (stamp, data)} để áp dụng bằng apply_store_contents().
+    """
+    loaded: Dict[str, Any] = {}
+    if _sqlite_tables:
+        return loaded
+    for file_path in _stores():
+        if not force and _store_stamp(file_path) == _file_stamps.get(file_path):
+            continue
+        with file_lock(file_path, shared=True):
+            stamp = _store_stamp(file_path)
+            try:
+                loaded[file_path] = (stamp, _read_store(file_path))
+            except StoreLoadError:
+                continue # Giữ dữ liệu trong bộ nhớ, thử lại ở lần kiểm tra sau
+    return loaded
+
+def apply_store_contents(loaded: Dict[str, Any]) -> List[str]:
+    """
+    Áp dụng dữ liệu đã đọc bằng read_changed_stores() vào các container tại chỗ
+    rồi rebuild index. Gọi trên event loop (đồng bộ, không await) để request
+    đang chạy không thấy trạng thái nửa chừng. File bị process này ghi sau lúc
+    đọc sẽ được bỏ qua (lần kiểm tra sau sẽ đọc lại). Returns các file đã thay đổi.
+    """
+    changed: List[str] = []
+    if _sqlite_tables:
+        for file_path, table in _sqlite_tables.items():
+            table.invalidate_cache()
+            _notify_store_changed(file_path, table)
+            changed.append(file_path)
+        return changed
+
+    stores = _stores()
+    for file_path, (stamp, new_data) in loaded.items():
+        if _store_stamp(file_path) != stamp:
+            logger.info(f"{file_path} vừa thay đổi sau khi đọc, bỏ qua lần tải lại này.")
+            continue
+        data = stores[file_path]
+        if _swap_contents(data, new_data):
+            _notify_store_changed(file_path, data)
+            changed.append(file_path)
+        _file_stamps[file_path] = stamp
+    return changed
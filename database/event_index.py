@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import bisect
+import threading
+from collections.abc import Mapping
+from typing import Dict, Any, Optional, List, Set, Tuple, Iterable
+
+from config.logging_config import logger
+
+
+class EventIndex:
+    """
+    Index trong bộ nhớ cho events_data: người tạo, người tham gia, category,
+    ngày (danh sách đã sắp xếp cho truy vấn khoảng) và thứ tự created_on.
+    Được cập nhật từng phần qua reindex() mỗi khi sự kiện thay đổi.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_creator: Dict[str, Set[str]] = {}
+        self._by_participant: Dict[str, Set[str]] = {}
+        self._by_category: Dict[str, Set[str]] = {}
+        self._by_date: List[Tuple[str, str]] = []     # (date, event_id), đã sắp xếp
+        self._by_created: List[Tuple[str, str]] = []  # (created_on, event_id), đã sắp xếp
+        # Các giá trị đã index của mỗi event, để gỡ đúng entry cũ khi event bị sửa/xóa
+        self._entries: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _extract(event: Dict[str, Any]) -> Dict[str, Any]:
+        participants = event.get("participants") or []
+        if not isinstance(participants, list):
+            participants = [participants]
+        return {
+            "created_by": event.get("created_by"),
+            "participants": tuple(dict.fromkeys(p for p in participants if isinstance(p, str))),
+            "category": event.get("category"),
+            "date": event.get("date") if isinstance(event.get("date"), str) else None,
+            "created_on": str(event.get("created_on") or ""),
+        }
+
+    @staticmethod
+    def _discard(bucket: Dict[str, Set[str]], value: Any, event_id: str) -> None:
+        ids = bucket.get(value)
+        if ids is not None:
+            ids.discard(event_id)
+            if not ids:
+                del bucket[value]
+
+    @staticmethod
+    def _remove_sorted(items: List[Tuple[str, str]], item: Tuple[str, str]) -> None:
+        pos = bisect.bisect_left(items, item)
+        if pos < len(items) and items[pos] == item:
+            del items[pos]
+
+    def _remove_locked(self, event_id: str) -> None:
+        entry = self._entries.pop(event_id, None)
+        if entry is None:
+            return
+        if entry["created_by"] is not None:
+            self._discard(self._by_creator, entry["created_by"], event_id)
+        for name in entry["participants"]:
+            self._discard(self._by_participant, name, event_id)
+        if entry["category"] is not None:
+            self._discard(self._by_category, entry["category"], event_id)
+        if entry["date"] is not None:
+            self._remove_sorted(self._by_date, (entry["date"], event_id))
+        self._remove_sorted(self._by_created, (entry["created_on"], event_id))
+
+    def _add_locked(self, event_id: str, event: Dict[str, Any], keep_sorted: bool = True) -> None:
+        entry = self._extract(event)
+        self._entries[event_id] = entry
+        if entry["created_by"] is not None:
+            self._by_creator.setdefault(entry["created_by"], set()).add(event_id)
+        for name in entry["participants"]:
+            self._by_participant.setdefault(name, set()).add(event_id)
+        if entry["category"] is not None:
+            self._by_category.setdefault(entry["category"], set()).add(event_id)
+        if keep_sorted:
+            if entry["date"] is not None:
+                bisect.insort(self._by_date, (entry["date"], event_id))
+            bisect.insort(self._by_created, (entry["created_on"], event_id))
+        else:
+            if entry["date"] is not None:
+                self._by_date.append((entry["date"], event_id))
+            self._by_created.append((entry["created_on"], event_id))
+
+    def reindex(self, event_id: str, event: Optional[Dict[str, Any]]) -> None:
+        """Cập nhật index cho một event (event=None nghĩa là đã bị xóa)."""
+        with self._lock:
+            self._remove_locked(event_id)
+            if isinstance(event, Mapping):
+                self._add_locked(event_id, event)
+
+    def rebuild(self, events: Dict[str, Any]) -> None:
+        """Xây lại toàn bộ index từ events_data (khi khởi động/tải lại dữ liệu)."""
+        with self._lock:
+            self._by_creator.clear()
+            self._by_participant.clear()
+            self._by_category.clear()
+            self._entries.clear()
+            self._by_date = []
+            self._by_created = []
+            for event_id, event in events.items():
+                if isinstance(event, Mapping):
+                    self._add_locked(event_id, event, keep_sorted=False)
+            self._by_date.sort()
+            self._by_created.sort()
+        logger.info(f"Đã xây dựng index cho {len(self._entries)} sự kiện.")
+
+    def ids_by_creator(self, member_id: str) -> Set[str]:
+        with self._lock:
+            return set(self._by_creator.get(member_id, ()))
+
+    def ids_by_participant(self, name: str) -> Set[str]:
+        with self._lock:
+            return set(self._by_participant.get(name, ()))
+
+    def ids_by_category(self, category: str) -> Set[str]:
+        with self._lock:
+            return set(self._by_category.get(category, ()))
+
+    def ids_in_date_range(self, start: Optional[str] = None, end: Optional[str] = None) -> List[str]:
+        """ID các event có date trong [start, end] (YYYY-MM-DD, bao gồm hai đầu), theo thứ tự ngày."""
+        with self._lock:
+            lo = bisect.bisect_left(self._by_date, (start, "")) if start else 0
+            # "\uffff" lớn hơn mọi event_id nên bao gồm cả các event có date == end
+            hi = bisect.bisect_right(self._by_date, (end, "\uffff")) if end else len(self._by_date)
+            return [event_id for _, event_id in self._by_date[lo:hi]]
+
+    def recent_ids(self, limit: int) -> List[str]:
+        """ID các event được tạo gần nhất (created_on giảm dần)."""
+        with self._lock:
+            return [event_id for _, event_id in reversed(self._by_created[-limit:])] if limit > 0 else []
+
+    def order_by_created(self, event_ids: Iterable[str]) -> List[str]:
+        """Sắp xếp các ID theo created_on tăng dần (thứ tự thêm vào)."""
+        with self._lock:
+            return sorted(
+                (eid for eid in event_ids if eid in self._entries),
+                key=lambda eid: (self._entries[eid]["created_on"], eid)
+            )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Singleton instance
+event_index = EventIndex()
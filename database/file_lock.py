@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from config.logging_config import logger
+
+try:
+    import fcntl
+except ImportError: # Không có trên Windows
+    fcntl = None
+
+LOCK_SUFFIX = ".lock"
+
+# flock gắn với file descriptor, nên các luồng trong cùng process vẫn cần
+# một threading.Lock riêng cho mỗi file để loại trừ lẫn nhau
+_thread_locks: Dict[str, threading.RLock] = {}
+_thread_locks_guard = threading.Lock()
+# Các file mà luồng hiện tại đang giữ khóa (để lồng khóa không tự chặn chính mình)
+_held = threading.local()
+
+if fcntl is None:
+    logger.warning("Không có fcntl: khóa file liên process bị tắt, chỉ khóa trong process hiện tại.")
+
+
+def _thread_lock_for(path: str) -> threading.RLock:
+    with _thread_locks_guard:
+        lock = _thread_locks.get(path)
+        if lock is None:
+            lock = _thread_locks[path] = threading.RLock()
+        return lock
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False) -> Iterator[None]:
+    """
+    Khóa liên process cho `path` qua file `<path>.lock` (fcntl.flock).
+    shared=True dùng khóa đọc (nhiều process đọc cùng lúc), ngược lại khóa ghi độc quyền.
+    Lồng khóa trong cùng luồng được phép và giữ nguyên chế độ của khóa ngoài cùng.
+    """
+    lock_path = path + LOCK_SUFFIX
+    held = getattr(_held, "paths", None)
+    if held is None:
+        held = _held.paths = set()
+    if lock_path in held:
+        yield
+        return
+    with _thread_lock_for(lock_path):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            held.add(lock_path)
+            try:
+                yield
+            finally:
+                held.discard(lock_path)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+def file_stamp(path: str):
+    """(mtime_ns, size, inode) của file, dùng để phát hiện process khác đã ghi; None nếu chưa tồn tại."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
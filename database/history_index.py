@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import threading
+from typing import Dict, Any, Optional, List, Set, Tuple
+
+from config.logging_config import logger
+
+
+class HistoryIndex:
+    """
+    Index session_id -> [(member_id, entry)] cho chat_history, sắp xếp theo
+    timestamp giảm dần. Mỗi lần lưu lịch sử chỉ cập nhật lại phần của một member.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_session: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        self._member_sessions: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def _sort_key(item: Tuple[str, Dict[str, Any]]) -> Tuple[str, str]:
+        member_id, entry = item
+        return (str(entry.get("timestamp", "")), member_id)
+
+    def _remove_member_locked(self, member_id: str) -> Set[str]:
+        session_ids = self._member_sessions.pop(member_id, set())
+        for session_id in session_ids:
+            items = [item for item in self._by_session.get(session_id, []) if item[0] != member_id]
+            if items:
+                self._by_session[session_id] = items
+            else:
+                self._by_session.pop(session_id, None)
+        return session_ids
+
+    def _add_member_locked(self, member_id: str, entries: Any) -> Set[str]:
+        touched = set()
+        if not isinstance(entries, list):
+            return touched
+        for entry in entries:
+            session_id = entry.get("session_id") if isinstance(entry, dict) else None
+            if not session_id:
+                continue
+            self._by_session.setdefault(session_id, []).append((member_id, entry))
+            touched.add(session_id)
+        if touched:
+            self._member_sessions[member_id] = touched
+        return touched
+
+    def reindex_member(self, member_id: str, entries: Optional[List[Dict[str, Any]]]) -> None:
+        """Cập nhật index cho toàn bộ lịch sử của một member (entries=None nghĩa là đã bị xóa)."""
+        with self._lock:
+            self._remove_member_locked(member_id)
+            for session_id in self._add_member_locked(member_id, entries):
+                self._by_session[session_id].sort(key=self._sort_key, reverse=True)
+
+    def rebuild(self, chat_history: Dict[str, Any]) -> None:
+        """Xây lại toàn bộ index từ chat_history (khi khởi động/tải lại dữ liệu)."""
+        with self._lock:
+            self._by_session.clear()
+            self._member_sessions.clear()
+            for member_id, entries in chat_history.items():
+                self._add_member_locked(member_id, entries)
+            for items in self._by_session.values():
+                items.sort(key=self._sort_key, reverse=True)
+        logger.info(f"Đã xây dựng index lịch sử chat cho {len(self._by_session)} session.")
+
+    def session_entries(self, session_id: str, after: Optional[Tuple[str, str]] = None,
+                        limit: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Các (member_id, entry) của session, mới nhất trước. `after` là
+        (timestamp, member_id) của phần tử cuối trang trước (cursor).
+        """
+        with self._lock:
+            items = self._by_session.get(session_id, [])
+            if after is not None:
+                items = [item for item in items if self._sort_key(item) < after]
+            return list(items[:limit] if limit is not None else items)
+
+    def __len__(self) -> int:
+        return len(self._by_session)
+
+
+# Singleton instance
+history_index = HistoryIndex()
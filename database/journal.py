@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import os
+import json
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from config.logging_config import logger
+from database.records import to_plain
+from database.file_lock import file_lock
+
+JOURNAL_SUFFIX = ".journal"
+
+
+def journal_path_for(file_path: str) -> str:
+    """Đường dẫn file journal đi kèm file snapshot."""
+    return file_path + JOURNAL_SUFFIX
+
+
+def encode_record(op: str, key: str, value: Any = None) -> str:
+    """Mã hóa một bản ghi journal thành một dòng JSON gọn (không indent)."""
+    record: Dict[str, Any] = {"op": op, "k": key}
+    if op == "set":
+        record["v"] = value
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=to_plain) + "\n"
+
+
+def replay_journal(file_path: str, data: Dict[str, Any]) -> int:
+    """
+    Áp dụng các bản ghi trong journal lên dữ liệu snapshot đã tải.
+    Bản ghi là giá trị đầy đủ theo key nên việc replay là idempotent.
+    Dòng cuối bị cắt dở (do crash giữa chừng) sẽ được bỏ qua.
+    Returns số bản ghi đã áp dụng.
+    """
+    path = journal_path_for(file_path)
+    if not os.path.exists(path):
+        return 0
+
+    applied = 0
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Bỏ qua dòng journal hỏng {path}:{line_no}")
+                    continue
+                key = record.get("k")
+                if key is None:
+                    continue
+                if record.get("op") == "del":
+                    data.pop(key, None)
+                else:
+                    data[key] = record.get("v")
+                applied += 1
+    except Exception as e:
+        logger.error(f"Lỗi khi replay journal {path}: {e}", exc_info=True)
+
+    if applied:
+        logger.info(f"Đã replay {applied} bản ghi journal cho {file_path}")
+    return applied
+
+
+class JournalWriter:
+    """
+    Ghi journal append-only cho một file dữ liệu với group commit:
+    các luồng ghi đồng thời được gom lại và chỉ tốn một lần fsync.
+    Khi journal vượt ngưỡng, một luồng nền sẽ compact thành snapshot mới.
+    """
+
+    def __init__(self, file_path: str, compact_threshold_bytes: int = 1024 * 1024):
+        self.file_path = file_path
+        self.journal_path = journal_path_for(file_path)
+        self.compact_threshold_bytes = compact_threshold_bytes
+
+        self._cond = threading.Condition(threading.Lock())
+        self._pending: List[str] = []
+        self._appended_seq = 0
+        self._durable_seq = 0
+        self._flushing = False
+        self._failed_ranges: List[Tuple[int, int]] = []
+        self._compacting = False
+        self._data: Optional[Dict[str, Any]] = None
+        # Đã kiểm tra (và cắt) dòng cuối bị ghi dở trước lần append đầu tiên hay chưa
+        self._tail_checked = False
+
+    def attach(self, data: Dict[str, Any]) -> None:
+        """Gắn container dữ liệu trong bộ nhớ dùng làm nguồn khi compact."""
+        self._data = data
+
+    def append(self, op: str, key: str, value: Any = None) -> bool:
+        """
+        Thêm một bản ghi và chờ tới khi nó được fsync (bởi chính luồng này
+        hoặc bởi luồng leader đang flush cả nhóm).
+        """
+        try:
+            line = encode_record(op, key, value)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Không thể mã hóa bản ghi journal cho key {key}: {e}")
+            return False
+
+        with self._cond:
+            self._pending.append(line)
+            self._appended_seq += 1
+            my_seq = self._appended_seq
+
+            while self._durable_seq < my_seq:
+                if self._flushing:
+                    self._cond.wait()
+                    continue
+                self._flush_pending_locked()
+
+            ok = not any(start <= my_seq <= end for start, end in self._failed_ranges)
+
+        if ok:
+            self._maybe_compact()
+        return ok
+
+    def _flush_pending_locked(self) -> None:
+        """Leader: lấy toàn bộ batch đang chờ, ghi + fsync ngoài lock."""
+        batch = self._pending
+        batch_start = self._durable_seq + 1
+        batch_end = self._appended_seq
+        self._pending = []
+        self._flushing = True
+        self._cond.release()
+        ok = False
+        try:
+            ok = self._write_batch(batch)
+        finally:
+            self._cond.acquire()
+            self._flushing = False
+            if not ok:
+                self._failed_ranges = self._failed_ranges[-63:] + [(batch_start, batch_end)]
+            self._durable_seq = batch_end
+            self._cond.notify_all()
+
+    def _write_batch(self, batch: List[str]) -> bool:
+        try:
+            os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+            if not self._tail_checked:
+                self._truncate_torn_tail()
+                self._tail_checked = True
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write("".join(batch))
+                f.flush()
+                os.fsync(f.fileno())
+            logger.debug(f"Group commit {len(batch)} bản ghi vào {self.journal_path}")
+            return True
+        except Exception as e:
+            # Lần ghi lỗi có thể để lại dòng dở: kiểm tra lại trước lần append sau
+            self._tail_checked = False
+            logger.error(f"Lỗi khi ghi journal {self.journal_path}: {e}", exc_info=True)
+            return False
+
+    def _truncate_torn_tail(self) -> None:
+        """
+        Cắt dòng cuối bị ghi dở (crash giữa lúc ghi) để bản ghi mới không bị nối
+        vào nó: replay sẽ bỏ cả dòng ghép đó và làm mất lần ghi đã xác nhận.
+        """
+        try:
+            f = open(self.journal_path, "r+b")
+        except FileNotFoundError:
+            return
+        with f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            end = size
+            keep = 0
+            while end > 0:
+                start = max(0, end - 64 * 1024)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    keep = start + newline + 1
+                    break
+                end = start
+            f.truncate(keep)
+            f.flush()
+            os.fsync(f.fileno())
+        logger.warning(f"Đã cắt {size - keep} bytes ghi dở ở cuối journal {self.journal_path}")
+
+    def _journal_size(self) -> int:
+        try:
+            return os.path.getsize(self.journal_path)
+        except OSError:
+            return 0
+
+    def _maybe_compact(self) -> None:
+        if self.compact_threshold_bytes <= 0 or self._journal_size() < self.compact_threshold_bytes:
+            return
+        with self._cond:
+            if self._compacting:
+                return
+            self._compacting = True
+        threading.Thread(target=self._compact_in_background, name=f"compact:{os.path.basename(self.file_path)}",
+                         daemon=True).start()
+
+    def _compact_in_background(self) -> None:
+        try:
+            if self._data is None:
+                logger.warning(f"Chưa gắn dữ liệu trong bộ nhớ cho {self.file_path}, bỏ qua compact.")
+                return
+            self.compact(self._data)
+        finally:
+            with self._cond:
+                self._compacting = False
+
+    def compact(self, data: Dict[str, Any]) -> bool:
+        """
+        Ghi snapshot mới rồi cắt bỏ phần journal đã nằm trong snapshot.
+        Các bản ghi được append trong lúc snapshot đang ghi sẽ được giữ lại
+        (replay idempotent nên trùng lặp với snapshot cũng không sao).
+        """
+        from database.data_manager import snapshot_copy
+
+        with self._cond:
+            while self._flushing or self._pending:
+                if not self._flushing:
+                    self._flush_pending_locked()
+                else:
+                    self._cond.wait()
+            covered_bytes = self._journal_size()
+
+        snapshot = snapshot_copy(data)
+        # Khóa file để người đang tải lại (snapshot + journal) không đọc giữa hai bước
+        with file_lock(self.file_path):
+            return self._replace_snapshot(snapshot, covered_bytes)
+
+    def _replace_snapshot(self, snapshot: Optional[Dict[str, Any]], covered_bytes: int) -> bool:
+        from database.data_manager import save_data
+
+        if snapshot is None or not save_data(self.file_path, snapshot):
+            logger.error(f"Compact {self.file_path} thất bại, giữ nguyên journal.")
+            return False
+
+        with self._cond:
+            while self._flushing:
+                self._cond.wait()
+            try:
+                tail = b""
+                if os.path.exists(self.journal_path):
+                    with open(self.journal_path, "rb") as f:
+                        f.seek(covered_bytes)
+                        tail = f.read()
+                temp_path = f"{self.journal_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.journal_path)
+            except Exception as e:
+                logger.error(f"Lỗi khi cắt journal {self.journal_path}: {e}", exc_info=True)
+                return False
+
+        logger.info(f"Đã compact {self.file_path} (journal còn {len(tail)} bytes)")
+        return True
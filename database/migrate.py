@@ -0,0 +1,45 @@
+"""
+Import dữ liệu từ các file data/*.json vào SQLite engine.
+
+Sử dụng:
+    python -m database.migrate                 # dùng DATA_DIR / SQLITE_DB_FILE từ môi trường
+    python -m database.migrate --db data/family_assistant.db --replace
+"""
+from __future__ import annotations
+
+import argparse
+
+from config.settings import SQLITE_DB_FILE
+from config.logging_config import logger
+from database.data_manager import SQLITE_TABLE_SPECS, open_sqlite_store, load_store
+
+
+def migrate_json_to_sqlite(db_path: str, replace: bool = False) -> dict:
+    """Đọc snapshot (+ journal nếu bật) của từng file và ghi vào bảng SQLite tương ứng."""
+    tables = open_sqlite_store(db_path)
+    summary = {}
+    for file_path, table in tables.items():
+        data = load_store(file_path)
+        if replace:
+            table.clear()
+        count = table.bulk_load(data)
+        summary[SQLITE_TABLE_SPECS[file_path]["name"]] = count
+        logger.info(f"Đã import {count} record từ {file_path} vào bảng {table.name}")
+    next(iter(tables.values())).db.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import data/*.json vào SQLite storage engine")
+    parser.add_argument("--db", type=str, default=SQLITE_DB_FILE, help="Đường dẫn file SQLite")
+    parser.add_argument("--replace", action="store_true", help="Xóa dữ liệu cũ trong các bảng trước khi import")
+    args = parser.parse_args()
+
+    summary = migrate_json_to_sqlite(args.db, replace=args.replace)
+    for table_name, count in summary.items():
+        print(f"{table_name}: {count} record")
+    print(f"Hoàn tất. Đặt STORAGE_ENGINE=sqlite (SQLITE_DB_FILE={args.db}) để sử dụng.")
+
+
+if __name__ == "__main__":
+    main()
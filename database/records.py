@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from collections.abc import Mapping, MutableMapping
+from typing import Dict, Any, Optional, Iterator, Tuple, FrozenSet
+
+
+class Record(MutableMapping):
+    """
+    Record gọn nhẹ dựa trên __slots__ nhưng dùng như dict (get, [], items...)
+    để code hiện có không phải thay đổi. Field nằm ngoài FIELDS được giữ
+    trong `_extra` (chỉ cấp phát khi cần).
+    """
+
+    __slots__ = ("_extra",)
+    FIELDS: Tuple[str, ...] = ()
+    _FIELD_SET: FrozenSet[str] = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+
+    def __init__(self, data: Optional[Mapping] = None, **kwargs: Any):
+        self._extra: Optional[Dict[str, Any]] = None
+        if data:
+            field_set = self._FIELD_SET
+            for key, value in data.items():
+                if key in field_set:
+                    setattr(self, key, value)
+                else:
+                    self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self._FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in self._FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for field in self.FIELDS:
+            if hasattr(self, field):
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for field in self.FIELDS if hasattr(self, field)) + len(self._extra or ())
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __reduce__(self):
+        return (type(self), (self.to_dict(),))
+
+    def copy(self) -> "Record":
+        return type(self)(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    @classmethod
+    def from_value(cls, value: Any) -> Any:
+        """Chuyển dict đọc từ đĩa thành record; giá trị khác giữ nguyên."""
+        if isinstance(value, Mapping) and not isinstance(value, cls):
+            return cls(value)
+        return value
+
+
+class MemberRecord(Record):
+    FIELDS = ("id", "name", "age", "preferences", "added_on", "last_updated")
+    __slots__ = FIELDS
+
+
+class EventRecord(Record):
+    FIELDS = ("id", "title", "date", "time", "description", "participants", "repeat_type",
+              "category", "created_by", "created_on", "last_updated")
+    __slots__ = FIELDS
+
+
+class NoteRecord(Record):
+    FIELDS = ("id", "title", "content", "tags", "created_by", "created_on", "last_updated")
+    __slots__ = FIELDS
+
+
+def to_plain(obj: Any) -> Any:
+    """Hook `default` cho json/msgpack khi mã hóa dữ liệu có chứa Record."""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
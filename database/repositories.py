@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import uuid
+from typing import Dict, Any, Optional, Callable, Tuple, Type
+
+from config.logging_config import logger
+from config.settings import FAMILY_DATA_FILE, EVENTS_DATA_FILE, NOTES_DATA_FILE
+from database.data_manager import family_data, events_data, notes_data, persist_change, bump_store_version
+from database.event_index import event_index
+from database.sqlite_store import SqliteTable
+from database.records import Record, MemberRecord, EventRecord, NoteRecord
+
+
+class Repository:
+    """
+    CRUD cho một store (dict module-level hoặc SqliteTable). create/update/delete
+    trả về trực tiếp record đã lưu (và ID) thay vì bool, tự rollback trong bộ nhớ
+    khi lưu thất bại, tăng version của store và gọi `on_change` để các index được cập nhật.
+    Với SqliteTable, thay đổi chỉ được stage trong bộ nhớ: persist_change là lần ghi
+    row duy nhất (gộp vào PersistBatch trong lượt tool).
+    """
+
+    def __init__(self, file_path: str, data: Dict[str, Any], record_type: Type[Record],
+                 on_change: Optional[Callable[[str, Optional[Record]], None]] = None):
+        self.file_path = file_path
+        self.data = data
+        self.record_type = record_type
+        self.on_change = on_change
+
+    def _notify(self, record_id: str, record: Optional[Record]) -> None:
+        bump_store_version(self.file_path)
+        if self.on_change is not None:
+            self.on_change(record_id, record)
+
+    def _put(self, record_id: str, record: Record) -> None:
+        if isinstance(self.data, SqliteTable):
+            self.data.stage(record_id, record)
+        else:
+            self.data[record_id] = record
+
+    def _remove(self, record_id: str) -> Record:
+        record = self.data[record_id]
+        if isinstance(self.data, SqliteTable):
+            self.data.stage_delete(record_id)
+        else:
+            del self.data[record_id]
+        return record
+
+    def _rollback(self, record_id: str, previous: Optional[Record]) -> None:
+        """Đưa record về trạng thái trước thay đổi (None: record chưa tồn tại)."""
+        if isinstance(self.data, SqliteTable):
+            self.data.unstage(record_id, previous)
+        elif previous is None:
+            self.data.pop(record_id, None)
+        else:
+            self.data[record_id] = previous
+        self._notify(record_id, previous)
+
+    def _persist(self, record_id: str, record: Optional[Record], previous: Optional[Record]) -> bool:
+        # Trong lượt tool (run_batched) việc ghi được hoãn: rollback sẽ chạy nếu lần ghi gộp thất bại
+        return persist_change(self.file_path, self.data, record_id, record,
+                              undo=lambda: self._rollback(record_id, previous))
+
+    def get(self, record_id: str) -> Optional[Record]:
+        return self.data.get(str(record_id))
+
+    def create(self, fields: Dict[str, Any]) -> Optional[Tuple[str, Record]]:
+        """Tạo record mới với ID ngẫu nhiên. Returns (id, record) hoặc None nếu lưu thất bại."""
+        record_id = str(uuid.uuid4())
+        record = self.record_type(fields)
+        record["id"] = record_id
+        self._put(record_id, record)
+        self._notify(record_id, record)
+        if self._persist(record_id, record, None):
+            return record_id, record
+        logger.error(f"Lưu record mới {record_id} vào {self.file_path} thất bại.")
+        self._rollback(record_id, None)
+        return None
+
+    def update(self, record_id: str, changes: Dict[str, Any]) -> Optional[Record]:
+        """Áp dụng các thay đổi lên record. Returns record đã cập nhật hoặc None."""
+        record_id = str(record_id)
+        record = self.data.get(record_id)
+        if record is None:
+            logger.warning(f"Không tìm thấy record ID={record_id} trong {self.file_path} để cập nhật.")
+            return None
+        original = record.copy()
+        for key, value in changes.items():
+            record[key] = value
+        self._put(record_id, record)
+        self._notify(record_id, record)
+        if self._persist(record_id, record, original):
+            return record
+        logger.error(f"Lưu cập nhật record ID {record_id} vào {self.file_path} thất bại.")
+        self._rollback(record_id, original)
+        logger.info(f"Đã rollback thay đổi trong bộ nhớ cho record ID {record_id}.")
+        return None
+
+    def delete(self, record_id: str) -> Optional[Record]:
+        """Xóa record. Returns record đã xóa hoặc None nếu không tìm thấy/lưu thất bại."""
+        record_id = str(record_id)
+        if record_id not in self.data:
+            logger.warning(f"Không tìm thấy record ID={record_id} trong {self.file_path} để xóa.")
+            return None
+        record = self._remove(record_id)
+        self._notify(record_id, None)
+        if self._persist(record_id, None, record):
+            return record
+        logger.error(f"Lưu sau khi xóa record ID {record_id} khỏi {self.file_path} thất bại.")
+        self._rollback(record_id, record)
+        logger.info(f"Đã rollback xóa trong bộ nhớ cho record ID {record_id}.")
+        return None
+
+
+# Singleton instances
+family_repository = Repository(FAMILY_DATA_FILE, family_data, MemberRecord)
+event_repository = Repository(EVENTS_DATA_FILE, events_data, EventRecord, on_change=event_index.reindex)
+note_repository = Repository(NOTES_DATA_FILE, notes_data, NoteRecord)
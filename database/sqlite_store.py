@@ -0,0 +1,500 @@
+from __future__ import annotations
+
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping, ItemsView, ValuesView
+from typing import Dict, Any, Optional, List, Callable, Iterator, Tuple, Iterable, Set
+
+from config.logging_config import logger
+from database.records import to_plain
+
+VERSIONS_TABLE = "_table_versions"
+
+# Giá trị staged đánh dấu key đang chờ xóa
+_DELETED = object()
+
+
+class SqliteDatabase:
+    """
+    Kết nối SQLite dùng chung (WAL mode) cho tất cả các bảng dữ liệu.
+    Mọi truy cập đều đi qua một RLock vì connection được chia sẻ giữa các luồng.
+    Connection (và schema các bảng) chỉ được mở ở lần truy cập đầu tiên, không phải lúc import.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version = 0
+        self.tables: Dict[str, "SqliteTable"] = {}
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self.lock:
+                if self._conn is None:
+                    self._open()
+        return self._conn
+
+    @property
+    def is_open(self) -> bool:
+        return self._conn is not None
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        # Mỗi bảng có một bộ đếm version, tăng trong cùng transaction với mỗi lần ghi,
+        # để process khác biết bảng nào đã đổi (kết hợp với PRAGMA data_version)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        self._data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        self._conn = conn
+        for table in self.tables.values():
+            table._create_schema()
+        logger.info(f"Đã mở SQLite database {self.db_path} (WAL)")
+
+    def table(self, name: str, index_columns: Optional[List[str]] = None,
+              multi_index: Optional[Dict[str, Callable[[Any], List[Any]]]] = None,
+              cache_size: int = 1024, record_type: Optional[type] = None) -> "SqliteTable":
+        table = SqliteTable(self, name, index_columns or [], multi_index or {}, cache_size, record_type)
+        self.tables[name] = table
+        if self.is_open:
+            table._create_schema()
+        return table
+
+    def changed_tables(self) -> List[str]:
+        """
+        Tên các bảng đã bị connection/process khác ghi kể từ lần kiểm tra trước.
+        Cache record của các bảng đó được xóa. Chi phí khi không có gì thay đổi
+        chỉ là một PRAGMA data_version.
+        """
+        with self.lock:
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return []
+            self._data_version = data_version
+            versions = dict(self.conn.execute(f"SELECT name, version FROM {VERSIONS_TABLE}").fetchall())
+            changed = []
+            for name, table in self.tables.items():
+                version = versions.get(name, 0)
+                if version != table.known_version:
+                    table.known_version = version
+                    table.invalidate_cache()
+                    changed.append(name)
+            return changed
+
+    def close(self) -> None:
+        with self.lock:
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as e:
+                logger.warning(f"Không thể checkpoint WAL cho {self.db_path}: {e}")
+            self._conn.close()
+            self._conn = None
+
+
+class _TableItemsView(ItemsView):
+    def __iter__(self):
+        yield from self._mapping._iter_items()
+
+
+class _TableValuesView(ValuesView):
+    def __iter__(self):
+        for _, value in self._mapping._iter_items():
+            yield value
+
+
+class SqliteTable(MutableMapping):
+    """
+    Bảng key -> JSON value với giao diện giống dict để các router/tool dùng
+    như module-level dict cũ. Các cột index được trích từ value khi ghi:
+    `index_columns` là các field đơn trị (lưu ngay trên bảng chính),
+    `multi_index` là các field đa trị (lưu ở bảng phụ <name>__<column>).
+
+    Các record vừa đọc được giữ trong một LRU nhỏ để code hiện có có thể sửa
+    trực tiếp object (ví dụ update_event) rồi gọi persist(key, value) để ghi lại.
+    Record có thể bị đẩy khỏi LRU giữa lúc sửa và lúc ghi, nên caller truyền
+    chính object đã sửa vào persist.
+
+    Repository dùng stage()/stage_delete() để đưa thay đổi vào bộ nhớ mà chưa ghi
+    row: lần ghi duy nhất là persist() (hoặc persist_many() cho cả lượt tool, một
+    transaction). Trong lúc chờ, các lần đọc đều thấy thay đổi đã stage; unstage()
+    bỏ thay đổi khi ghi thất bại.
+    """
+
+    def __init__(self, db: SqliteDatabase, name: str, index_columns: List[str],
+                 multi_index: Dict[str, Callable[[Any], List[Any]]], cache_size: int = 1024,
+                 record_type: Optional[type] = None):
+        self.db = db
+        self.name = name
+        self.index_columns = list(index_columns)
+        self.multi_index = dict(multi_index)
+        self.cache_size = cache_size
+        self.record_type = record_type
+        self._live: "OrderedDict[str, Any]" = OrderedDict()
+        # Thay đổi đã áp dụng trong bộ nhớ nhưng chưa ghi: key -> value (hoặc _DELETED)
+        self._staged: Dict[str, Any] = {}
+        self.known_version = 0
+
+    # --- Schema ---
+    def _create_schema(self) -> None:
+        extra_cols = "".join(f", {col} TEXT" for col in self.index_columns)
+        with self.db.lock:
+            self.db.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.name} (key TEXT PRIMARY KEY, value TEXT NOT NULL{extra_cols})"
+            )
+            for col in self.index_columns:
+                self.db.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.name}_{col} ON {self.name}({col})")
+            for col in self.multi_index:
+                side = f"{self.name}__{col}"
+                self.db.conn.execute(f"CREATE TABLE IF NOT EXISTS {side} (key TEXT NOT NULL, {col} TEXT)")
+                self.db.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{side}_{col} ON {side}({col})")
+                self.db.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{side}_key ON {side}(key)")
+            self.db.conn.execute(f"INSERT OR IGNORE INTO {VERSIONS_TABLE} (name, version) VALUES (?, 0)", (self.name,))
+            self.known_version = self.db.conn.execute(
+                f"SELECT version FROM {VERSIONS_TABLE} WHERE name = ?", (self.name,)
+            ).fetchone()[0]
+
+    def _bump_version(self) -> None:
+        """Tăng version của bảng; caller chịu trách nhiệm transaction."""
+        self.db.conn.execute(f"UPDATE {VERSIONS_TABLE} SET version = version + 1 WHERE name = ?", (self.name,))
+        self.known_version += 1
+
+    # --- Live record cache ---
+    def _remember(self, key: str, value: Any) -> None:
+        self._live[key] = value
+        self._live.move_to_end(key)
+        while len(self._live) > self.cache_size:
+            self._live.popitem(last=False)
+
+    def _decode(self, key: str, raw: str) -> Any:
+        cached = self._live.get(key)
+        if cached is not None:
+            return cached
+        value = json.loads(raw)
+        if self.record_type is not None:
+            value = self.record_type.from_value(value)
+        self._remember(key, value)
+        return value
+
+    # --- Staged changes ---
+    def stage(self, key: str, value: Any) -> None:
+        """Đặt value cho key trong bộ nhớ; row chỉ được ghi khi persist/persist_many."""
+        with self.db.lock:
+            self._staged[key] = value
+            self._remember(key, value)
+
+    def stage_delete(self, key: str) -> None:
+        """Xóa key trong bộ nhớ; row chỉ bị xóa khi persist/persist_many."""
+        with self.db.lock:
+            self._staged[key] = _DELETED
+            self._live.pop(key, None)
+
+    def unstage(self, key: str, previous: Any = None) -> None:
+        """Bỏ thay đổi chưa ghi của key và đưa bộ nhớ về `previous` (None: key chưa tồn tại)."""
+        with self.db.lock:
+            self._staged.pop(key, None)
+            if previous is None:
+                self._live.pop(key, None)
+            else:
+                self._remember(key, previous)
+
+    def is_staged(self, key: str) -> bool:
+        with self.db.lock:
+            return key in self._staged
+
+    def invalidate_cache(self) -> None:
+        """Bỏ các record đang giữ trong bộ nhớ để lần đọc sau lấy lại từ database."""
+        with self.db.lock:
+            self._live.clear()
+
+    # --- Writes ---
+    def _upsert(self, key: str, value: Any) -> None:
+        """Ghi một record và các cột index; caller chịu trách nhiệm transaction."""
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=to_plain)
+        is_record = isinstance(value, Mapping)
+        col_values = [str(value.get(col)) if is_record and value.get(col) is not None else None
+                      for col in self.index_columns]
+        cols = ", ".join(["key", "value"] + self.index_columns)
+        placeholders = ", ".join("?" for _ in range(2 + len(self.index_columns)))
+        conn = self.db.conn
+        conn.execute(f"INSERT OR REPLACE INTO {self.name} ({cols}) VALUES ({placeholders})",
+                     [key, payload] + col_values)
+        for col, extractor in self.multi_index.items():
+            side = f"{self.name}__{col}"
+            conn.execute(f"DELETE FROM {side} WHERE key = ?", (key,))
+            values = {str(v) for v in (extractor(value) or []) if v is not None}
+            conn.executemany(f"INSERT INTO {side} (key, {col}) VALUES (?, ?)",
+                             [(key, v) for v in values])
+
+    def _write_row(self, key: str, value: Any) -> None:
+        conn = self.db.conn
+        with self.db.lock:
+            conn.execute("BEGIN")
+            try:
+                self._upsert(key, value)
+                self._bump_version()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _delete_row(self, key: str) -> None:
+        conn = self.db.conn
+        with self.db.lock:
+            conn.execute("BEGIN")
+            try:
+                conn.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+                for col in self.multi_index:
+                    conn.execute(f"DELETE FROM {self.name}__{col} WHERE key = ?", (key,))
+                self._bump_version()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def persist(self, key: str, value: Any = None) -> bool:
+        """
+        Ghi lại record `value` (object caller đã sửa) của key. Không có value: ghi bản
+        đang giữ trong bộ nhớ, hoặc xóa nếu key không còn. Returns False nếu ghi lỗi
+        hoặc record đã bị đẩy khỏi bộ nhớ (thay đổi trên object cũ không còn ghi được).
+        """
+        try:
+            with self.db.lock:
+                staged = self._staged.get(key)
+                if staged is _DELETED and value is None:
+                    self._delete_row(key)
+                    self._staged.pop(key, None)
+                elif value is not None or staged is not None:
+                    value = value if value is not None else staged
+                    self._write_row(key, value)
+                    self._staged.pop(key, None)
+                    self._remember(key, value)
+                elif key in self._live:
+                    self._write_row(key, self._live[key])
+                elif key in self:
+                    logger.error(f"Key {key} của bảng {self.name} không còn trong bộ nhớ, không thể ghi thay đổi.")
+                    return False
+                else:
+                    self._delete_row(key)
+            return True
+        except Exception as e:
+            logger.error(f"Lỗi khi lưu key {key} vào bảng {self.name}: {e}", exc_info=True)
+            return False
+
+    def persist_many(self, keys: Iterable[str]) -> Set[str]:
+        """
+        Ghi các thay đổi đã stage của `keys` trong một transaction (key không được
+        stage thì bỏ qua). Returns các key ghi thất bại (tất cả nếu transaction lỗi).
+        """
+        conn = self.db.conn
+        with self.db.lock:
+            pending = {key: self._staged[key] for key in keys if key in self._staged}
+            if not pending:
+                return set()
+            try:
+                conn.execute("BEGIN")
+                try:
+                    for key, value in pending.items():
+                        if value is _DELETED:
+                            conn.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+                            for col in self.multi_index:
+                                conn.execute(f"DELETE FROM {self.name}__{col} WHERE key = ?", (key,))
+                        else:
+                            self._upsert(key, value)
+                    self._bump_version()
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            except Exception as e:
+                logger.error(f"Lỗi khi ghi {len(pending)} thay đổi vào bảng {self.name}: {e}", exc_info=True)
+                return set(pending)
+            for key in pending:
+                self._staged.pop(key, None)
+            return set()
+
+    def _staged_matches(self, value: Any, filters: Dict[str, Any]) -> bool:
+        """Như điều kiện WHERE của select(), áp dụng cho record đã stage (chưa có row)."""
+        if not isinstance(value, Mapping):
+            return False
+        for col, expected in filters.items():
+            if col in self.index_columns:
+                if value.get(col) is None or str(value.get(col)) != str(expected):
+                    return False
+            elif str(expected) not in {str(v) for v in (self.multi_index[col](value) or []) if v is not None}:
+                return False
+        return True
+
+    def _overlay(self, rows: List[Tuple[str, str]], match: Callable[[Any], bool]) -> List[Tuple[str, Any]]:
+        """(Đang giữ lock) Kết quả truy vấn đã giải mã, thay bằng các thay đổi đã stage."""
+        items = [(key, self._decode(key, raw)) for key, raw in rows if key not in self._staged]
+        items += [(key, value) for key, value in self._staged.items()
+                  if value is not _DELETED and match(value)]
+        return items
+
+    # --- MutableMapping API ---
+    def __getitem__(self, key: str) -> Any:
+        with self.db.lock:
+            staged = self._staged.get(key)
+            if staged is _DELETED:
+                raise KeyError(key)
+            if staged is not None:
+                return staged
+            if key in self._live:
+                self._live.move_to_end(key)
+                return self._live[key]
+            row = self.db.conn.execute(f"SELECT value FROM {self.name} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                raise KeyError(key)
+            return self._decode(key, row[0])
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        with self.db.lock:
+            self._write_row(key, value)
+            self._staged.pop(key, None)
+            self._remember(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        with self.db.lock:
+            if key not in self:
+                raise KeyError(key)
+            self._delete_row(key)
+            self._staged.pop(key, None)
+            self._live.pop(key, None)
+
+    def __contains__(self, key: object) -> bool:
+        with self.db.lock:
+            if key in self._staged:
+                return self._staged[key] is not _DELETED
+            if key in self._live:
+                return True
+            row = self.db.conn.execute(f"SELECT 1 FROM {self.name} WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def __iter__(self) -> Iterator[str]:
+        with self.db.lock:
+            keys = [row[0] for row in self.db.conn.execute(f"SELECT key FROM {self.name} ORDER BY rowid")]
+            if self._staged:
+                keys = [key for key in keys if key not in self._staged]
+                keys += [key for key, value in self._staged.items() if value is not _DELETED]
+        return iter(keys)
+
+    def __len__(self) -> int:
+        with self.db.lock:
+            if self._staged:
+                return sum(1 for _ in self)
+            return self.db.conn.execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+
+    def _iter_items(self) -> Iterator[Tuple[str, Any]]:
+        with self.db.lock:
+            rows = self.db.conn.execute(f"SELECT key, value FROM {self.name} ORDER BY rowid").fetchall()
+            staged = dict(self._staged)
+        for key, raw in rows:
+            if key in staged:
+                continue
+            with self.db.lock:
+                value = self._decode(key, raw)
+            yield key, value
+        for key, value in staged.items():
+            if value is not _DELETED:
+                yield key, value
+
+    def items(self):
+        return _TableItemsView(self)
+
+    def values(self):
+        return _TableValuesView(self)
+
+    def clear(self) -> None:
+        conn = self.db.conn
+        with self.db.lock:
+            conn.execute("BEGIN")
+            try:
+                conn.execute(f"DELETE FROM {self.name}")
+                for col in self.multi_index:
+                    conn.execute(f"DELETE FROM {self.name}__{col}")
+                self._bump_version()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._staged.clear()
+            self._live.clear()
+
+    # --- Filtered reads ---
+    def select(self, **filters: Any) -> Dict[str, Any]:
+        """
+        Lọc record theo các cột đã index (AND giữa các điều kiện).
+        Ví dụ: events.select(created_by="m1", category="Health").
+        """
+        clauses, params = [], []
+        for col, value in filters.items():
+            if col in self.index_columns:
+                clauses.append(f"{col} = ?")
+                params.append(str(value))
+            elif col in self.multi_index:
+                clauses.append(f"key IN (SELECT key FROM {self.name}__{col} WHERE {col} = ?)")
+                params.append(str(value))
+            else:
+                raise KeyError(f"Cột '{col}' không được index trong bảng {self.name}")
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                f"SELECT key, value FROM {self.name}{where} ORDER BY rowid", params
+            ).fetchall()
+            return dict(self._overlay(rows, lambda value: self._staged_matches(value, filters)))
+
+    def select_range(self, column: str, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Any]:
+        """Lọc theo khoảng giá trị [start, end] của một cột đơn trị đã index (ví dụ date)."""
+        if column not in self.index_columns:
+            raise KeyError(f"Cột '{column}' không được index trong bảng {self.name}")
+        clauses, params = [f"{column} IS NOT NULL"], []
+        if start is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append(f"{column} <= ?")
+            params.append(end)
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                f"SELECT key, value FROM {self.name} WHERE {' AND '.join(clauses)} ORDER BY {column}", params
+            ).fetchall()
+            if not self._staged:
+                return {key: self._decode(key, raw) for key, raw in rows}
+
+            def in_range(value: Any) -> bool:
+                actual = value.get(column) if isinstance(value, Mapping) else None
+                return (actual is not None and (start is None or str(actual) >= start)
+                        and (end is None or str(actual) <= end))
+            items = self._overlay(rows, in_range)
+            items.sort(key=lambda item: str(item[1].get(column)))
+            return dict(items)
+
+    def bulk_load(self, data: Dict[str, Any]) -> int:
+        """Import nhiều record trong một transaction (dùng cho migrate)."""
+        count = 0
+        conn = self.db.conn
+        with self.db.lock:
+            conn.execute("BEGIN")
+            try:
+                for key, value in data.items():
+                    self._upsert(str(key), value)
+                    count += 1
+                self._bump_version()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._live.clear()
+        return count
+
+    def __repr__(self) -> str:
+        return f"<SqliteTable {self.name} ({self.db.db_path})>"
@@ -34,6 +34,9 @@ class ChatResponse(BaseModel):
     response_format: Optional[str] = "html"
     content_type: Optional[str] = "text" # Reflect back the input type
     event_data: Optional[Dict[str, Any]] = None # Include event data if generated
+    context_stats: Optional[Dict[str, Any]] = None # Token của prompt đầy đủ/thực gửi/tiết kiệm
+    audio_id: Optional[str] = None # Audio TTS tạo ở nền: GET /chat/audio/{audio_id}
+    answer_cached: bool = False # Câu trả lời lấy từ answer cache (không gọi tìm kiếm/thời tiết/OpenAI)
 
 class MemberModel(BaseModel):
     name: str
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import re
+import time
+import datetime
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from config.settings import INTENT_CACHE_MAX_ENTRIES, INTENT_CACHE_TTL_SECONDS
+from services.intent.local_classifier import normalize_text
+
+
+def cache_key_text(query: str) -> str:
+    """Chuẩn hóa câu hỏi tiếng Việt làm khóa cache (như normalize_text, bỏ thêm dấu hỏi)."""
+    return re.sub(r"\s+", " ", normalize_text(query).replace("?", " ")).strip()
+
+
+class IntentCache:
+    """
+    Cache LRU + TTL cho kết quả phân loại ý định bằng LLM, dùng chung giữa các session.
+    Khóa gồm câu hỏi đã chuẩn hóa và ngày hiện tại: "ngày mai", "cuối tuần" đổi nghĩa
+    sau nửa đêm nên kết quả của hôm trước không được dùng lại.
+    """
+
+    def __init__(self, max_entries: int = INTENT_CACHE_MAX_ENTRIES, ttl_seconds: float = INTENT_CACHE_TTL_SECONDS):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0,
+            "stores": 0,
+        }
+
+    @staticmethod
+    def make_key(query: str, *scope: Any) -> Tuple:
+        """`scope`: các yếu tố khác ảnh hưởng tới kết quả (chế độ router, nhánh được bật...)."""
+        return (cache_key_text(query), datetime.date.today().isoformat(), *scope)
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.metrics["misses"] += 1
+            return None
+        stored_at, intent = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            self.metrics["expired"] += 1
+            self.metrics["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.metrics["hits"] += 1
+        return dict(intent)
+
+    def put(self, key: Tuple, intent: Dict[str, Any]) -> None:
+        self._entries[key] = (time.monotonic(), dict(intent))
+        self._entries.move_to_end(key)
+        self.metrics["stores"] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lookups = self.metrics["hits"] + self.metrics["misses"]
+        return {
+            **self.metrics,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hit_rate": round(self.metrics["hits"] / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Singleton instance
+intent_cache = IntentCache()
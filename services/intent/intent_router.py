@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import json
+import time
+import asyncio
+import datetime
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Tuple
+
+from config.settings import openai_model, INTENT_ROUTER_MODE, INTENT_LOCAL_ENABLED, INTENT_LOCAL_CONFIDENCE
+from config.logging_config import logger
+from core.token_budget import token_counter, budget_manager
+from services.llm.client_pool import llm_clients
+from services.intent.local_classifier import local_intent_classifier
+from services.intent.intent_cache import intent_cache
+from services.search.search_service import detect_search_intent
+from services.weather.weather_parser import WeatherQueryParser
+from services.weather.weather_advisor import WeatherAdvisor
+
+INTENT_MODES = ("unified", "concurrent", "sequential")
+DEFAULT_LOCATION = "Hanoi"
+WEATHER_KEYWORDS = ["thời tiết", "dự báo", "nhiệt độ", "nắng", "mưa", "gió", "mấy độ", "bao nhiêu độ", "mặc gì", "nên đi"]
+ADVICE_TYPES = ("clothing", "items", "places", "activities", "general")
+
+
+def empty_intent(query: str) -> Dict[str, Any]:
+    """Kết quả phân loại mặc định: không cần tư vấn, thời tiết hay tìm kiếm."""
+    return {
+        "is_advice_query": False,
+        "advice_type": None,
+        "is_weather_query": False,
+        "location": None,
+        "date_description": None,
+        "need_search": False,
+        "search_query": query,
+        "is_news_query": False,
+        "is_feng_shui_query": False,
+    }
+
+
+def _unified_system_prompt() -> str:
+    current_date_str = datetime.datetime.now().strftime("%Y-%m-%d")
+    return f"""
+Bạn là bộ định tuyến ý định cho trợ lý gia đình. Phân tích câu hỏi của người dùng và trả về MỘT object JSON:
+1. `is_advice_query`: câu hỏi có xin tư vấn dựa trên thời tiết không (nên mặc gì, mang theo gì, nên đi đâu, nên làm gì...).
+2. `advice_type`: nếu is_advice_query, một trong "clothing", "items", "places", "activities", "general"; ngược lại null.
+3. `is_weather_query`: câu hỏi có hỏi về thời tiết/dự báo không (kể cả khi là tư vấn).
+4. `location`: địa điểm nhắc tới (vd. "Da Nang", "Hanoi"; "Sài Gòn" -> "Ho Chi Minh City"), null nếu không có.
+5. `date_description`: mô tả thời gian NGUYÊN VĂN trong câu hỏi ("ngày mai", "thứ 2 tuần sau", "cuối tuần"), null nếu không có. Không diễn giải.
+6. `need_search`: có cần tìm thông tin thực tế/tin tức/dữ liệu cập nhật trên web không. Câu hỏi thời tiết hoặc tư vấn theo thời tiết KHÔNG cần tìm kiếm; kiến thức chung đơn giản cũng không.
+7. `search_query`: nếu need_search, truy vấn tìm kiếm tối ưu (kèm yếu tố thời gian nếu có); ngược lại chính câu hỏi.
+8. `is_news_query`: câu hỏi chủ yếu về tin tức, thời sự, thể thao, sự kiện hiện tại (giá cả, sản phẩm, hướng dẫn KHÔNG phải tin tức).
+9. `is_feng_shui_query`: câu hỏi về phong thủy, ngày tốt xấu, ngày thuận lợi/may mắn (những câu này need_search = true).
+
+Hôm nay là ngày: {current_date_str}.
+
+Ví dụ:
+- "hôm nay nên mặc gì" -> {{"is_advice_query": true, "advice_type": "clothing", "is_weather_query": true, "location": null, "date_description": "hôm nay", "need_search": false, "search_query": "hôm nay nên mặc gì", "is_news_query": false, "is_feng_shui_query": false}}
+- "thời tiết Hà Nội thứ 2 tuần sau" -> {{"is_advice_query": false, "advice_type": null, "is_weather_query": true, "location": "Hanoi", "date_description": "thứ 2 tuần sau", "need_search": false, "search_query": "thời tiết Hà Nội thứ 2 tuần sau", "is_news_query": false, "is_feng_shui_query": false}}
+- "tin tức covid hôm nay" -> {{"is_advice_query": false, "advice_type": null, "is_weather_query": false, "location": null, "date_description": "hôm nay", "need_search": true, "search_query": "tin tức covid mới nhất ngày {current_date_str}", "is_news_query": true, "is_feng_shui_query": false}}
+- "những ngày nào thuận lợi trong tuần này" -> {{"is_advice_query": false, "advice_type": null, "is_weather_query": false, "location": null, "date_description": "tuần này", "need_search": true, "search_query": "ngày tốt xấu phong thủy tuần này từ {current_date_str}", "is_news_query": false, "is_feng_shui_query": true}}
+- "thủ đô nước Pháp là gì?" -> {{"is_advice_query": false, "advice_type": null, "is_weather_query": false, "location": null, "date_description": null, "need_search": false, "search_query": "thủ đô nước Pháp là gì?", "is_news_query": false, "is_feng_shui_query": false}}
+
+Chỉ trả về JSON hợp lệ với đúng 9 trường trên.
+"""
+
+
+def normalize_intent(raw: Dict[str, Any], query: str) -> Dict[str, Any]:
+    """Chuẩn hóa kết quả phân loại (kiểu dữ liệu, giá trị mặc định) giống các bộ phân loại cũ."""
+    intent = empty_intent(query)
+    intent["is_advice_query"] = bool(raw.get("is_advice_query"))
+    intent["is_weather_query"] = bool(raw.get("is_weather_query")) or intent["is_advice_query"]
+    intent["location"] = raw.get("location") or None
+    intent["date_description"] = raw.get("date_description") or None
+    if intent["is_advice_query"]:
+        advice_type = raw.get("advice_type")
+        intent["advice_type"] = advice_type if advice_type in ADVICE_TYPES else "general"
+    if intent["is_weather_query"] and not intent["location"]:
+        intent["location"] = DEFAULT_LOCATION
+
+    need_search = bool(raw.get("need_search"))
+    # Câu hỏi thời tiết không bao giờ đi qua tìm kiếm web
+    if intent["is_weather_query"] or any(keyword in query.lower() for keyword in WEATHER_KEYWORDS):
+        need_search = False
+    intent["need_search"] = need_search
+    intent["is_feng_shui_query"] = bool(raw.get("is_feng_shui_query"))
+    if need_search:
+        intent["search_query"] = raw.get("search_query") or query
+        intent["is_news_query"] = bool(raw.get("is_news_query"))
+    return intent
+
+
+class IntentRouter:
+    """
+    Phân loại ý định của câu hỏi (tư vấn thời tiết, thời tiết, tìm kiếm web) trước
+    lần gọi completion chính. Bộ phân loại cục bộ quyết định các câu rõ ràng; câu mơ hồ
+    mới chuyển lên LLM, mặc định bằng một lần gọi có cấu trúc thay vì ba bộ phân loại tuần tự.
+    """
+
+    def __init__(self, mode: str = INTENT_ROUTER_MODE, local_enabled: bool = INTENT_LOCAL_ENABLED,
+                 local_confidence: float = INTENT_LOCAL_CONFIDENCE):
+        if mode not in INTENT_MODES:
+            logger.warning(f"INTENT_ROUTER_MODE không hợp lệ '{mode}', dùng 'unified'.")
+            mode = "unified"
+        self.mode = mode
+        self.local_enabled = local_enabled
+        self.local_confidence = local_confidence
+        self.metrics = {
+            "requests": 0,
+            "local_decisions": 0,
+            "escalations": 0,
+            "llm_calls": 0,
+            "cancelled_calls": 0,
+            "classifier_errors": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+        }
+
+    async def classify(self, query: str, api_key: str, weather_enabled: bool = True,
+                       search_enabled: bool = True, mode: Optional[str] = None) -> Dict[str, Any]:
+        """Phân loại `query`. `weather_enabled`/`search_enabled` bỏ qua nhánh không dùng tới."""
+        if not query or not api_key or not (weather_enabled or search_enabled):
+            return empty_intent(query)
+        mode = mode or self.mode
+        started = time.perf_counter()
+        decision = local_intent_classifier.classify(query) if self.local_enabled else None
+        if decision is not None and decision.confidence >= self.local_confidence:
+            # Trường hợp rõ ràng: quyết định tại chỗ, không gọi LLM
+            intent = normalize_intent(decision.raw, query)
+            self.metrics["local_decisions"] += 1
+            mode = f"local:{decision.rule}"
+        else:
+            if decision is not None:
+                self.metrics["escalations"] += 1
+            cache_key = intent_cache.make_key(query, mode, weather_enabled, search_enabled)
+            intent = intent_cache.get(cache_key)
+            if intent is not None:
+                mode = f"cache:{mode}"
+            else:
+                intent, cacheable = await self._classify_llm(mode, query, api_key, weather_enabled, search_enabled)
+                if cacheable:
+                    intent_cache.put(cache_key, intent) # Lỗi LLM: không cache để lần sau thử lại
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.metrics["requests"] += 1
+        self.metrics["total_ms"] += elapsed_ms
+        self.metrics["max_ms"] = max(self.metrics["max_ms"], elapsed_ms)
+        logger.info(f"Intent router ({mode}) {elapsed_ms:.0f} ms: advice={intent['is_advice_query']}, "
+                    f"weather={intent['is_weather_query']}, search={intent['need_search']}")
+        return intent
+
+    async def _classify_llm(self, mode: str, query: str, api_key: str, weather_enabled: bool,
+                            search_enabled: bool) -> Tuple[Dict[str, Any], bool]:
+        """
+        Phân loại bằng LLM theo `mode`. Returns (intent, cacheable); cacheable=False khi
+        có lời gọi LLM thất bại (kết quả có thể là âm tính giả, không được cache).
+        """
+        if mode == "concurrent":
+            return await self._classify_concurrent(query, api_key, weather_enabled, search_enabled)
+        if mode == "sequential":
+            return await self._classify_sequential(query, api_key, weather_enabled, search_enabled)
+        intent = await self._classify_unified(query, api_key)
+        if intent is None:
+            return empty_intent(query), False
+        return intent, True
+
+    async def _classify_unified(self, query: str, api_key: str) -> Optional[Dict[str, Any]]:
+        self.metrics["llm_calls"] += 1
+        try:
+            client = llm_clients.get(api_key)
+            intent_messages = [
+                {"role": "system", "content": _unified_system_prompt()},
+                {"role": "user", "content": f"Câu hỏi của người dùng: \"{query}\""},
+            ]
+            estimated_prompt = token_counter.count_messages(intent_messages)
+            max_tokens = budget_manager.max_tokens("intent_router", estimated_prompt)
+            response = await client.chat.completions.create(
+                model=openai_model,
+                messages=intent_messages,
+                temperature=0.1,
+                max_tokens=max_tokens,
+                response_format={"type": "json_object"},
+            )
+            budget_manager.record("intent_router", estimated_prompt, response.usage, max_tokens)
+            result_str = response.choices[0].message.content
+            logger.info(f"Kết quả intent router (raw): {result_str}")
+            raw = json.loads(result_str)
+            if not isinstance(raw, dict):
+                raise TypeError("Kết quả không phải object JSON")
+            return normalize_intent(raw, query)
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.error(f"Lỗi giải mã JSON từ intent router: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Lỗi khi gọi OpenAI trong intent router: {e}", exc_info=True)
+            return None
+
+    def _classifiers(self, query: str, api_key: str, weather_enabled: bool,
+                     search_enabled: bool) -> List[Callable[[], Awaitable[Dict[str, Any]]]]:
+        """
+        Ba bộ phân loại cũ theo thứ tự ưu tiên, mỗi bộ trả về intent (hoặc None nếu âm
+        tính) và raise nếu lời gọi LLM thất bại.
+        """
+        async def advice():
+            is_advice, advice_type, location, date_description = await WeatherAdvisor.detect_weather_advice_need(
+                query, api_key, raise_errors=True)
+            if not is_advice:
+                return None
+            return normalize_intent({"is_advice_query": True, "advice_type": advice_type, "location": location,
+                                     "date_description": date_description}, query)
+
+        async def weather():
+            is_weather, location, date_description = await WeatherQueryParser.parse_weather_query(
+                query, api_key, raise_errors=True)
+            if not is_weather:
+                return None
+            return normalize_intent({"is_weather_query": True, "location": location,
+                                     "date_description": date_description}, query)
+
+        async def search():
+            need_search, search_query, is_news, is_feng_shui = await detect_search_intent(query, api_key, raise_errors=True)
+            if not need_search:
+                return None
+            return normalize_intent({"need_search": True, "search_query": search_query, "is_news_query": is_news,
+                                     "is_feng_shui_query": is_feng_shui}, query)
+
+        classifiers = []
+        if weather_enabled:
+            classifiers += [advice, weather]
+        if search_enabled:
+            classifiers.append(search)
+        return classifiers
+
+    async def _classify_sequential(self, query: str, api_key: str, weather_enabled: bool,
+                                   search_enabled: bool) -> Tuple[Dict[str, Any], bool]:
+        """Chạy lần lượt các bộ phân loại; bộ bị lỗi được coi là âm tính nhưng kết quả không được cache."""
+        failed = False
+        for classifier in self._classifiers(query, api_key, weather_enabled, search_enabled):
+            self.metrics["llm_calls"] += 1
+            try:
+                intent = await classifier()
+            except Exception:
+                self.metrics["classifier_errors"] += 1
+                failed = True
+                continue
+            if intent is not None:
+                return intent, not failed
+        return empty_intent(query), not failed
+
+    async def _classify_concurrent(self, query: str, api_key: str, weather_enabled: bool,
+                                   search_enabled: bool) -> Tuple[Dict[str, Any], bool]:
+        """
+        Chạy song song các bộ phân loại; ngay khi bộ có ưu tiên cao nhất còn lại cho kết
+        quả dương tính (và mọi bộ ưu tiên cao hơn đều âm tính) thì hủy các bộ còn lại.
+        Bộ bị lỗi được coi là âm tính nhưng kết quả không được cache.
+        """
+        tasks = [asyncio.create_task(classifier())
+                 for classifier in self._classifiers(query, api_key, weather_enabled, search_enabled)]
+        self.metrics["llm_calls"] += len(tasks)
+        try:
+            pending = set(tasks)
+            while pending:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:
+                    if not task.done():
+                        break # Bộ ưu tiên cao hơn chưa xong: chưa quyết định được
+                    intent = None if task.cancelled() or task.exception() else task.result()
+                    if intent is not None:
+                        return intent, not self._failed(tasks[:tasks.index(task)])
+            return empty_intent(query), not self._failed(tasks)
+        finally:
+            self.metrics["classifier_errors"] += self._failed(tasks)
+            losers = [task for task in tasks if not task.done()]
+            for task in losers:
+                task.cancel()
+            self.metrics["cancelled_calls"] += len(losers)
+
+    @staticmethod
+    def _failed(tasks: List[asyncio.Task]) -> int:
+        """Số task đã kết thúc với lỗi (không tính task bị hủy)."""
+        return sum(1 for task in tasks if task.done() and not task.cancelled() and task.exception() is not None)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        requests = self.metrics["requests"]
+        return {
+            **self.metrics,
+            "mode": self.mode,
+            "local_enabled": self.local_enabled,
+            "local_confidence": self.local_confidence,
+            "cache": intent_cache.get_metrics(),
+            "local_decision_rate": round(self.metrics["local_decisions"] / requests, 3) if requests else 0.0,
+            "total_ms": round(self.metrics["total_ms"], 3),
+            "max_ms": round(self.metrics["max_ms"], 3),
+            "avg_ms": round(self.metrics["total_ms"] / requests, 3) if requests else 0.0,
+        }
+
+
+# Singleton instance
+intent_router = IntentRouter()
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Dict, Any, Optional, List, Tuple, NamedTuple
+
+from config.settings import VIETNAMESE_WEEKDAY_MAP
+from core.datetime_handler import DateTimeHandler
+
+# Nhãn ý định của bộ phân loại cục bộ
+LABEL_ADVICE = "advice"
+LABEL_WEATHER = "weather"
+LABEL_SEARCH = "search"
+LABEL_NONE = "none"
+
+# Từ điển địa danh: biến thể tiếng Việt (đã chuẩn hóa) -> tên dùng cho OpenWeatherMap
+PLACE_GAZETTEER = {
+    "hà nội": "Hanoi", "ha noi": "Hanoi", "hn": "Hanoi",
+    "sài gòn": "Ho Chi Minh City", "sai gon": "Ho Chi Minh City", "hồ chí minh": "Ho Chi Minh City",
+    "tp hcm": "Ho Chi Minh City", "tphcm": "Ho Chi Minh City", "hcm": "Ho Chi Minh City",
+    "đà nẵng": "Da Nang", "da nang": "Da Nang",
+    "hải phòng": "Hai Phong", "huế": "Hue", "hội an": "Hoi An",
+    "nha trang": "Nha Trang", "đà lạt": "Da Lat", "cần thơ": "Can Tho",
+    "vũng tàu": "Vung Tau", "sa pa": "Sa Pa", "sapa": "Sa Pa",
+    "hạ long": "Ha Long", "phú quốc": "Phu Quoc", "quy nhơn": "Quy Nhon",
+    "vinh": "Vinh", "buôn ma thuột": "Buon Ma Thuot", "phan thiết": "Phan Thiet",
+    "mũi né": "Mui Ne", "ninh bình": "Ninh Binh", "hà giang": "Ha Giang",
+    "thanh hóa": "Thanh Hoa", "nghệ an": "Nghe An", "quảng ninh": "Quang Ninh",
+    "biên hòa": "Bien Hoa", "thái nguyên": "Thai Nguyen", "lào cai": "Lao Cai",
+}
+
+# Từ khóa thời tiết: mạnh (gần như chắc chắn) và yếu (cần thêm ngữ cảnh)
+WEATHER_STRONG_CUES = [
+    "thời tiết", "dự báo", "nhiệt độ", "mấy độ", "bao nhiêu độ", "độ ẩm", "có mưa không",
+    "mưa không", "nắng không", "có nắng", "trời mưa", "trời nắng", "trời có", "bão", "áp thấp",
+    "rét không", "lạnh không", "nóng không", "chỉ số uv",
+]
+WEATHER_WEAK_CUES = ["mưa", "nắng", "gió", "lạnh", "nóng", "rét", "trời", "sương mù", "oi"]
+
+# Từ khóa tư vấn theo loại (thứ tự: cụ thể trước, chung sau)
+ADVICE_CUES: List[Tuple[str, List[str]]] = [
+    ("clothing", ["mặc gì", "mặc quần áo", "mặc áo", "mặc đồ", "trang phục", "nên mặc"]),
+    ("items", ["mang theo gì", "mang gì", "mang theo những gì", "mang ô", "mang áo mưa", "cần mang"]),
+    ("places", ["nên đi đâu", "đi chơi ở đâu", "đi đâu chơi", "chỗ nào để đi chơi", "thích hợp để đi chơi",
+                "có nên đi chơi", "đi chơi được không"]),
+    ("activities", ["nên làm gì", "hoạt động gì", "làm gì cho vui", "chơi gì"]),
+    ("general", ["chuẩn bị thế nào", "chuẩn bị những gì", "chuẩn bị gì", "tư vấn giúp", "có nên đi", "nên đi"]),
+]
+
+NEWS_CUES = [
+    "tin tức", "thời sự", "tin mới", "mới nhất", "kết quả trận", "tỷ số", "giá vàng", "giá xăng",
+    "tỷ giá", "chứng khoán", "giá bitcoin", "lịch thi đấu", "bảng xếp hạng", "vừa xảy ra", "sự kiện nổi bật",
+]
+FENG_SHUI_CUES = [
+    "phong thủy", "ngày tốt", "ngày xấu", "ngày đẹp", "hoàng đạo", "hắc đạo", "thuận lợi", "may mắn",
+    "ngày nào hợp", "hợp tuổi", "xem ngày", "giờ tốt", "khai trương", "động thổ",
+]
+# Yêu cầu tìm kiếm/tra cứu rõ ràng: luôn chuyển sang tìm kiếm web
+SEARCH_REQUEST_CUES = [
+    "tìm", "tìm kiếm", "tìm giúp", "tìm hộ", "tìm cho", "tra cứu", "tra giúp", "tra hộ", "tra google",
+    "google", "search", "lên mạng xem",
+]
+# Câu lệnh dành cho tool (sự kiện, ghi chú, thành viên): không cần phân loại thời tiết/tìm kiếm
+COMMAND_CUES = [
+    "thêm sự kiện", "tạo sự kiện", "sửa sự kiện", "xóa sự kiện", "xoá sự kiện", "đặt lịch", "lên lịch",
+    "nhắc tôi", "nhắc mình", "nhắc nhở", "thêm ghi chú", "ghi chú", "ghi lại", "thêm thành viên",
+    "cập nhật thành viên", "sở thích của", "lịch của", "danh sách sự kiện", "có sự kiện",
+    "tìm sự kiện", "tìm ghi chú", "tìm lịch",
+]
+GREETINGS = {
+    "chào", "xin chào", "chào bạn", "hi", "hello", "hey", "alo", "cảm ơn", "cám ơn", "cảm ơn bạn",
+    "thanks", "thank you", "ok", "oke", "okay", "vâng", "dạ", "ừ", "uh", "được", "tạm biệt", "bye",
+    "chúc ngủ ngon", "chào buổi sáng", "tuyệt", "hay quá",
+}
+# Dấu hiệu câu hỏi thông tin (có thể cần tra cứu web): để LLM quyết định
+FACT_QUESTION_CUES = [
+    "là gì", "là ai", "bao nhiêu", "ở đâu", "khi nào", "bao giờ", "tại sao", "vì sao", "như thế nào",
+    "thế nào", "giá", "có phải", "ai là", "mấy giờ", "review", "so sánh",
+    "cho tôi biết", "cho mình biết", "kể về", "giới thiệu về", "thông tin về",
+]
+
+# Độ tin cậy theo quy tắc; hiệu chỉnh trên benchmarks/intent_eval_set.json
+CONFIDENCE = {
+    "empty": 1.0,
+    "greeting": 0.97,
+    "command": 0.95,
+    "weather_strong": 0.95,
+    "advice_with_weather": 0.95,
+    "advice_with_context": 0.9,
+    "feng_shui": 0.9,
+    "search_request": 0.9,
+    "news": 0.88,
+    # Câu không khớp quy tắc nào: có thể vẫn cần tra cứu, để LLM quyết định
+    "plain_statement": 0.6,
+    "advice_without_context": 0.55,
+    "weather_weak": 0.5,
+    "fact_question": 0.4,
+}
+
+
+class LocalDecision(NamedTuple):
+    """Kết quả phân loại cục bộ: `raw` cùng dạng JSON của intent router, `rule` là quy tắc đã khớp."""
+    label: str
+    confidence: float
+    raw: Dict[str, Any]
+    rule: str
+
+
+# Viết tắt thường gặp khi nhắn tin, đưa về dạng viết đầy đủ
+ABBREVIATIONS = {
+    "ko": "không", "k": "không", "hok": "không", "khong": "không", "j": "gì", "gi": "gì",
+    "hnay": "hôm nay", "hum nay": "hôm nay", "ntn": "như thế nào",
+    "bn": "bao nhiêu", "sg": "sài gòn", "dc": "được", "đc": "được",
+}
+_ABBREVIATION_RE = re.compile(r"(?<!\w)(" + "|".join(sorted(map(re.escape, ABBREVIATIONS), key=len, reverse=True)) + r")(?!\w)")
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa câu tiếng Việt: NFC, chữ thường, bỏ dấu câu thừa, mở rộng viết tắt, gộp khoảng trắng."""
+    text = unicodedata.normalize("NFC", text or "").lower()
+    text = re.sub(r"[\"'“”‘’,;:!.()\[\]{}]+", " ", text)
+    text = _ABBREVIATION_RE.sub(lambda match: ABBREVIATIONS[match.group(1)], text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _phrase_pattern(phrases: List[str]) -> "re.Pattern[str]":
+    # Khớp nguyên cụm từ (không khớp "mai" trong "mailbox", "hn" trong "hnay"...)
+    alternatives = "|".join(re.escape(p) for p in sorted(set(phrases), key=len, reverse=True))
+    return re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)")
+
+
+_PLACE_RE = _phrase_pattern(list(PLACE_GAZETTEER))
+_WEATHER_STRONG_RE = _phrase_pattern(WEATHER_STRONG_CUES)
+_WEATHER_WEAK_RE = _phrase_pattern(WEATHER_WEAK_CUES)
+_ADVICE_RES = [(advice_type, _phrase_pattern(cues)) for advice_type, cues in ADVICE_CUES]
+_NEWS_RE = _phrase_pattern(NEWS_CUES)
+_FENG_SHUI_RE = _phrase_pattern(FENG_SHUI_CUES)
+_SEARCH_REQUEST_RE = _phrase_pattern(SEARCH_REQUEST_CUES)
+_COMMAND_RE = _phrase_pattern(COMMAND_CUES)
+_FACT_RE = _phrase_pattern(FACT_QUESTION_CUES)
+
+# Mô tả thời gian: dùng từ khóa của DateTimeHandler, thứ trong tuần và "cuối tuần"
+_WEEKDAYS = [day for day in VIETNAMESE_WEEKDAY_MAP if not re.fullmatch(r"t\d|cn", day)]
+_RELATIVE = [term for term in DateTimeHandler.VIETNAMESE_RELATIVE_TIME if term not in ("qua", "nay")]
+_TIME_OF_DAY = [f"{part} nay" for part in DateTimeHandler.VIETNAMESE_TIME_OF_DAY] + ["tối qua", "đêm qua"]
+_DATE_RE = re.compile(
+    rf"(?<!\w)(?:(?:{'|'.join(map(re.escape, _WEEKDAYS))})(?: (?:tuần )?(?:này|sau|tới|trước))?"
+    rf"|cuối tuần(?: này| sau| tới)?|{'|'.join(map(re.escape, sorted(_RELATIVE + _TIME_OF_DAY, key=len, reverse=True)))})(?!\w)"
+)
+
+
+def extract_date_description(text: str) -> Optional[str]:
+    match = _DATE_RE.search(text)
+    return match.group(0) if match else None
+
+
+def extract_location(text: str) -> Optional[str]:
+    match = _PLACE_RE.search(text)
+    return PLACE_GAZETTEER[match.group(0)] if match else None
+
+
+class LocalIntentClassifier:
+    """
+    Phân loại ý định bằng quy tắc từ khóa, từ điển địa danh và mô tả thời gian của
+    DateTimeHandler. Quyết định các trường hợp rõ ràng (lời chào, lệnh sự kiện/ghi chú,
+    câu hỏi thời tiết...) mà không gọi LLM; trường hợp mơ hồ trả về độ tin cậy thấp để
+    intent router chuyển lên LLM.
+    """
+
+    def __init__(self):
+        self.metrics = {"classified": 0}
+
+    def classify(self, query: str) -> LocalDecision:
+        self.metrics["classified"] += 1
+        text = normalize_text(query)
+        raw: Dict[str, Any] = {"search_query": query}
+        if not text:
+            return LocalDecision(LABEL_NONE, CONFIDENCE["empty"], raw, "empty")
+
+        date_description = extract_date_description(text)
+        location = extract_location(text)
+        raw.update({"location": location, "date_description": date_description})
+        weather_strong = bool(_WEATHER_STRONG_RE.search(text))
+        weather_weak = bool(_WEATHER_WEAK_RE.search(text))
+        advice_type = next((advice_type for advice_type, pattern in _ADVICE_RES if pattern.search(text)), None)
+
+        if _COMMAND_RE.search(text) and not weather_strong:
+            return LocalDecision(LABEL_NONE, CONFIDENCE["command"], raw, "command")
+
+        if advice_type:
+            raw.update({"is_advice_query": True, "is_weather_query": True, "advice_type": advice_type})
+            if weather_strong or weather_weak:
+                return LocalDecision(LABEL_ADVICE, CONFIDENCE["advice_with_weather"], raw, "advice_with_weather")
+            if date_description or location:
+                return LocalDecision(LABEL_ADVICE, CONFIDENCE["advice_with_context"], raw, "advice_with_context")
+            return LocalDecision(LABEL_ADVICE, CONFIDENCE["advice_without_context"], raw, "advice_without_context")
+
+        if weather_strong:
+            raw["is_weather_query"] = True
+            return LocalDecision(LABEL_WEATHER, CONFIDENCE["weather_strong"], raw, "weather_strong")
+
+        if _FENG_SHUI_RE.search(text):
+            raw.update({"need_search": True, "is_feng_shui_query": True})
+            return LocalDecision(LABEL_SEARCH, CONFIDENCE["feng_shui"], raw, "feng_shui")
+
+        if _NEWS_RE.search(text):
+            raw.update({"need_search": True, "is_news_query": True})
+            return LocalDecision(LABEL_SEARCH, CONFIDENCE["news"], raw, "news")
+
+        if _SEARCH_REQUEST_RE.search(text):
+            raw["need_search"] = True
+            return LocalDecision(LABEL_SEARCH, CONFIDENCE["search_request"], raw, "search_request")
+
+        if weather_weak:
+            raw["is_weather_query"] = True
+            return LocalDecision(LABEL_WEATHER, CONFIDENCE["weather_weak"], raw, "weather_weak")
+
+        if text in GREETINGS or (len(text.split()) <= 4 and any(text.startswith(g + " ") for g in GREETINGS)):
+            return LocalDecision(LABEL_NONE, CONFIDENCE["greeting"], raw, "greeting")
+
+        if "?" in text or _FACT_RE.search(text) or text.endswith(" không"):
+            return LocalDecision(LABEL_NONE, CONFIDENCE["fact_question"], raw, "fact_question")
+
+        return LocalDecision(LABEL_NONE, CONFIDENCE["plain_statement"], raw, "plain_statement")
+
+
+# Singleton instance
+local_intent_classifier = LocalIntentClassifier()
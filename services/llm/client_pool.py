@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Any
+
+import httpx
+from openai import AsyncOpenAI
+
+from config.settings import (
+    LLM_CLIENT_POOL_SIZE, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_TIMEOUT_SECONDS, LLM_MAX_RETRIES,
+)
+from config.logging_config import logger
+
+# Client bị đẩy khỏi pool được đóng sau khoảng này để request đang dùng kịp hoàn tất
+EVICTED_CLIENT_CLOSE_DELAY_SECONDS = 120.0
+
+
+class LLMClientPool:
+    """
+    Registry AsyncOpenAI dùng chung giữa các request, theo API key. Mỗi client có
+    connection pool keep-alive riêng với số kết nối giới hạn; số key được giữ cũng
+    giới hạn (LRU), client ít dùng nhất được đóng khi vượt giới hạn.
+    """
+
+    def __init__(self, max_clients: int = LLM_CLIENT_POOL_SIZE, max_connections: int = LLM_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = LLM_MAX_KEEPALIVE_CONNECTIONS,
+                 timeout: float = LLM_TIMEOUT_SECONDS, max_retries: int = LLM_MAX_RETRIES):
+        self.max_clients = max(1, max_clients)
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        # Khóa là hash của API key để key gốc không xuất hiện trong log/metrics
+        self._clients: "OrderedDict[str, AsyncOpenAI]" = OrderedDict()
+        self.metrics = {
+            "clients_created": 0,
+            "clients_reused": 0,
+            "clients_evicted": 0,
+        }
+
+    @staticmethod
+    def _key(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+    def _create(self, api_key: str) -> AsyncOpenAI:
+        # httpx.AsyncClient tự tạo (openai nhận cả client httpx); follow_redirects giống mặc định của openai
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_keepalive_connections),
+            timeout=httpx.Timeout(self.timeout, connect=10.0),
+            follow_redirects=True,
+        )
+        return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=self.max_retries)
+
+    def get(self, api_key: str) -> AsyncOpenAI:
+        """AsyncOpenAI dùng chung cho api_key (tạo mới nếu chưa có)."""
+        key = self._key(api_key)
+        client = self._clients.get(key)
+        if client is not None:
+            self._clients.move_to_end(key)
+            self.metrics["clients_reused"] += 1
+            return client
+        client = self._create(api_key)
+        self._clients[key] = client
+        self.metrics["clients_created"] += 1
+        while len(self._clients) > self.max_clients:
+            _, evicted = self._clients.popitem(last=False)
+            self.metrics["clients_evicted"] += 1
+            self._close_later(evicted)
+        return client
+
+    def _close_later(self, client: AsyncOpenAI) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return # Không có event loop: để GC dọn
+        loop.call_later(EVICTED_CLIENT_CLOSE_DELAY_SECONDS, lambda: loop.create_task(client.close()))
+
+    async def close_all(self) -> None:
+        """Đóng toàn bộ client (gọi khi shutdown)."""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.error(f"Lỗi khi đóng LLM client: {e}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {**self.metrics, "clients_active": len(self._clients), "max_clients": self.max_clients}
+
+
+# Singleton instance
+llm_clients = LLMClientPool()
@@ -2,39 +2,29 @@ from __future__ import annotations
 
 import re
 import base64
-import os
-import uuid
 from io import BytesIO
 from typing import Dict, Any, Optional
 
 from html import unescape
 from gtts import gTTS
-from openai import OpenAI
 
 from config.logging_config import logger
-from config.settings import TEMP_DIR
+from services.llm.client_pool import llm_clients
 
-def process_audio(message_dict: Dict[str, Any], api_key: str) -> Optional[Dict[str, Any]]:
-    """Chuyển đổi audio base64 sang text dùng Whisper."""
+async def process_audio(message_dict: Dict[str, Any], api_key: str) -> Optional[Dict[str, Any]]:
+    """Chuyển đổi audio base64 sang text dùng Whisper (không chặn event loop)."""
     try:
         if not message_dict.get("audio_data"):
             logger.error("process_audio: Thiếu audio_data.")
             return None
         audio_data = base64.b64decode(message_dict["audio_data"])
 
-        temp_audio_path = os.path.join(TEMP_DIR, f"{uuid.uuid4()}.wav") # Assume wav for simplicity
-
-        with open(temp_audio_path, "wb") as f:
-            f.write(audio_data)
-
-        client = OpenAI(api_key=api_key)
-        with open(temp_audio_path, "rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-            )
-
-        os.remove(temp_audio_path)
+        client = llm_clients.get(api_key)
+        # Gửi thẳng bytes trong bộ nhớ, không cần file tạm
+        transcript = await client.audio.transcriptions.create(
+            model="whisper-1",
+            file=("audio.wav", audio_data), # Assume wav for simplicity
+        )
 
         return {"type": "text", "text": transcript.text}
 
@@ -43,9 +33,6 @@ def process_audio(message_dict: Dict[str, Any], api_key: str) -> Optional[Dict[s
         return None
     except Exception as e:
         logger.error(f"Lỗi khi xử lý audio: {e}", exc_info=True)
-        if 'temp_audio_path' in locals() and os.path.exists(temp_audio_path):
-             try: os.remove(temp_audio_path)
-             except OSError: pass
         return None
 
 def text_to_speech_google(text: str, lang: str = 'vi', slow: bool = False, max_length: int = 5000) -> Optional[str]:
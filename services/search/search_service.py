@@ -6,16 +6,23 @@ import datetime
 import requests
 from typing import Dict, Any, List, Optional, Tuple
 
-from config.settings import VIETNAMESE_NEWS_DOMAINS, openai_model
+from config.settings import (
+    VIETNAMESE_NEWS_DOMAINS, openai_model, SEARCH_SOURCE_MAX_TOKENS, SEARCH_CONTEXT_MAX_TOKENS,
+)
 from config.logging_config import logger
-
-async def detect_search_intent(query: str, api_key: str) -> Tuple[bool, str, bool, bool]:
-    """Phát hiện ý định tìm kiếm (async wrapper)."""
+from core.token_budget import token_counter, budget_manager
+from services.llm.client_pool import llm_clients
+
+async def detect_search_intent(query: str, api_key: str, raise_errors: bool = False) -> Tuple[bool, str, bool, bool]:
+    """
+    Phát hiện ý định tìm kiếm (async wrapper).
+    Lỗi LLM/JSON được coi là không cần tìm kiếm, hoặc raise lại nếu `raise_errors`
+    (intent router cần phân biệt kết quả âm tính với lời gọi thất bại để không cache).
+    """
     if not api_key or not query: return False, query, False, False
 
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=api_key)
+        client = llm_clients.get(api_key)
         current_date_str = datetime.datetime.now().strftime("%Y-%m-%d")
         system_prompt = f"""
 Bạn là một hệ thống phân loại và tinh chỉnh câu hỏi thông minh. Nhiệm vụ của bạn là:
@@ -38,17 +45,20 @@ Ví dụ:
 
 Trả lời DƯỚI DẠNG JSON HỢP LỆ với 4 trường: need_search (boolean), search_query (string), is_news_query (boolean), is_feng_shui_query (boolean).
 """
-        response = await asyncio.to_thread(
-             client.chat.completions.create,
+        intent_messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Câu hỏi của người dùng: \"{query}\""}
+        ]
+        estimated_prompt = token_counter.count_messages(intent_messages)
+        max_tokens = budget_manager.max_tokens("search_intent", estimated_prompt)
+        response = await client.chat.completions.create(
              model=openai_model,
-             messages=[
-                 {"role": "system", "content": system_prompt},
-                 {"role": "user", "content": f"Câu hỏi của người dùng: \"{query}\""}
-             ],
+             messages=intent_messages,
              temperature=0.1,
-             max_tokens=150,
+             max_tokens=max_tokens,
              response_format={"type": "json_object"}
         )
+        budget_manager.record("search_intent", estimated_prompt, response.usage, max_tokens)
 
         result_str = response.choices[0].message.content
         logger.info(f"Kết quả detect_search_intent (raw): {result_str}")
@@ -76,9 +86,13 @@ Trả lời DƯỚI DẠNG JSON HỢP LỆ với 4 trường: need_search (boole
 
         except (json.JSONDecodeError, TypeError) as e:
             logger.error(f"Lỗi giải mã JSON từ detect_search_intent: {e}. Raw: {result_str}")
+            if raise_errors:
+                raise
             return False, query, False, False
     except Exception as e:
         logger.error(f"Lỗi khi gọi OpenAI trong detect_search_intent: {e}", exc_info=True)
+        if raise_errors:
+            raise
         return False, query, False, False
 
 async def tavily_extract(api_key: str, urls: List[str], include_images: bool = False, extract_depth: str = "advanced") -> Optional[Dict[str, Any]]:
@@ -158,19 +172,21 @@ Trình bày thông tin sử dụng HTML đơn giản và định dạng dễ đ
 """
 
             try:
-                from openai import OpenAI
-                client = OpenAI(api_key=openai_api_key)
+                client = llm_clients.get(openai_api_key)
                 
-                response = await asyncio.to_thread(
-                     client.chat.completions.create,
+                feng_shui_messages = [
+                    {"role": "system", "content": "Bạn là chuyên gia phong thủy và tử vi hàng đầu. Bạn có kiến thức sâu rộng về Ngũ hành, Bát quái, Can Chi, và các học thuyết phong thủy phương Đông. Bạn cung cấp phân tích chi tiết, chính xác và có tính ứng dụng cao về các ngày tốt xấu trong phong thủy."},
+                    {"role": "user", "content": feng_shui_prompt}
+                ]
+                estimated_prompt = token_counter.count_messages(feng_shui_messages)
+                max_tokens = budget_manager.max_tokens("feng_shui", estimated_prompt)
+                response = await client.chat.completions.create(
                      model=openai_model,
-                     messages=[
-                         {"role": "system", "content": "Bạn là chuyên gia phong thủy và tử vi hàng đầu. Bạn có kiến thức sâu rộng về Ngũ hành, Bát quái, Can Chi, và các học thuyết phong thủy phương Đông. Bạn cung cấp phân tích chi tiết, chính xác và có tính ứng dụng cao về các ngày tốt xấu trong phong thủy."},
-                         {"role": "user", "content": feng_shui_prompt}
-                     ],
+                     messages=feng_shui_messages,
                      temperature=0.7,
-                     max_tokens=2000
+                     max_tokens=max_tokens
                 )
+                budget_manager.record("feng_shui", estimated_prompt, response.usage, max_tokens)
                 
                 feng_shui_analysis = response.choices[0].message.content
                 logger.info(f"Đã tạo phân tích phong thủy (độ dài: {len(feng_shui_analysis)})")
@@ -201,8 +217,8 @@ Trình bày thông tin sử dụng HTML đơn giản và định dạng dễ đ
              for res in extract_result["results"]:
                   content = res.get("raw_content", "")
                   if content:
-                       max_len_per_source = 4000
-                       content = content[:max_len_per_source] + "..." if len(content) > max_len_per_source else content
+                       truncated = token_counter.truncate(content, SEARCH_SOURCE_MAX_TOKENS)
+                       content = truncated + "..." if len(truncated) < len(content) else content
                        extracted_contents.append({"url": res.get("url"), "content": content})
                   else:
                        logger.warning(f"Nội dung trống rỗng từ URL: {res.get('url')}")
@@ -222,19 +238,18 @@ Trình bày thông tin sử dụng HTML đơn giản và định dạng dễ đ
 
         logger.info(f"Tổng hợp {len(extracted_contents)} nguồn trích xuất cho '{query}'.")
         
-        from openai import OpenAI
-        client = OpenAI(api_key=openai_api_key)
+        client = llm_clients.get(openai_api_key)
 
         content_for_prompt = ""
-        total_len = 0
-        max_total_len = 15000
+        total_tokens = 0
         for item in extracted_contents:
              source_text = f"\n--- Nguồn: {item['url']} ---\n{item['content']}\n--- Hết nguồn ---\n"
-             if total_len + len(source_text) > max_total_len:
-                  logger.warning(f"Đã đạt giới hạn độ dài context khi tổng hợp, bỏ qua các nguồn sau.")
+             source_tokens = token_counter.count(source_text)
+             if total_tokens + source_tokens > SEARCH_CONTEXT_MAX_TOKENS:
+                  logger.warning(f"Đã đạt giới hạn token context khi tổng hợp ({total_tokens} token), bỏ qua các nguồn sau.")
                   break
              content_for_prompt += source_text
-             total_len += len(source_text)
+             total_tokens += source_tokens
 
         prompt = f"""
         Dưới đây là nội dung trích xuất từ các trang web liên quan đến câu hỏi: "{query}"
@@ -254,16 +269,21 @@ Trình bày thông tin sử dụng HTML đơn giản và định dạng dễ đ
         """
 
         try:
-            response = await asyncio.to_thread(
-                 client.chat.completions.create,
+            summary_messages = [
+                {"role": "system", "content": "Bạn là một trợ lý tổng hợp thông tin chuyên nghiệp. Nhiệm vụ của bạn là tổng hợp nội dung từ các nguồn được cung cấp để tạo ra một bản tóm tắt chính xác, tập trung vào yêu cầu của người dùng và trích dẫn nguồn nếu có thể."},
+                {"role": "user", "content": prompt}
+            ]
+            estimated_prompt = token_counter.count_messages(summary_messages)
+            # Bản tóm tắt tỉ lệ với lượng nội dung nguồn (ít nguồn -> max_tokens nhỏ hơn)
+            max_tokens = budget_manager.max_tokens("search_summary", estimated_prompt,
+                                                   cap=min(1500, max(400, total_tokens // 2)))
+            response = await client.chat.completions.create(
                  model=openai_model,
-                 messages=[
-                     {"role": "system", "content": "Bạn là một trợ lý tổng hợp thông tin chuyên nghiệp. Nhiệm vụ của bạn là tổng hợp nội dung từ các nguồn được cung cấp để tạo ra một bản tóm tắt chính xác, tập trung vào yêu cầu của người dùng và trích dẫn nguồn nếu có thể."},
-                     {"role": "user", "content": prompt}
-                 ],
+                 messages=summary_messages,
                  temperature=0.3,
-                 max_tokens=1500
+                 max_tokens=max_tokens
             )
+            budget_manager.record("search_summary", estimated_prompt, response.usage, max_tokens)
             summarized_info = response.choices[0].message.content
             return summarized_info.strip()
 
@@ -2,41 +2,39 @@ from __future__ import annotations
 
 import uuid
 import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 
 from config.logging_config import logger
-from database.data_manager import family_data, save_data
-from config.settings import FAMILY_DATA_FILE
+from database.records import MemberRecord
+from database.repositories import family_repository
 
-def add_family_member(details: Dict[str, Any]) -> bool:
-    """Thêm thành viên mới."""
-    global family_data
+def create_family_member(details: Dict[str, Any]) -> Optional[Tuple[str, MemberRecord]]:
+    """Thêm thành viên mới và trả về (member_id, member)."""
     try:
-        member_id = str(uuid.uuid4())
         if not details.get("name"):
              logger.error("Không thể thêm thành viên: thiếu tên.")
-             return False
-        family_data[member_id] = {
-            "id": member_id,
+             return None
+        created = family_repository.create({
             "name": details.get("name"),
             "age": details.get("age", ""),
             "preferences": details.get("preferences", {}),
             "added_on": datetime.datetime.now().isoformat()
-        }
-        if save_data(FAMILY_DATA_FILE, family_data):
-             logger.info(f"Đã thêm thành viên ID {member_id}: {details.get('name')}")
-             return True
+        })
+        if created:
+             logger.info(f"Đã thêm thành viên ID {created[0]}: {details.get('name')}")
         else:
-             logger.error(f"Lưu thất bại sau khi thêm thành viên {member_id} vào bộ nhớ.")
-             if member_id in family_data: del family_data[member_id]
-             return False
+             logger.error(f"Lưu thất bại sau khi thêm thành viên {details.get('name')} vào bộ nhớ.")
+        return created
     except Exception as e:
          logger.error(f"Lỗi khi thêm thành viên: {e}", exc_info=True)
-         return False
+         return None
+
+def add_family_member(details: Dict[str, Any]) -> bool:
+    """Thêm thành viên mới (dùng cho tool calling, trả về bool)."""
+    return create_family_member(details) is not None
 
 def update_preference(details: Dict[str, Any]) -> bool:
     """Cập nhật sở thích."""
-    global family_data
     try:
         member_id = str(details.get("member_id"))
         preference_key = details.get("preference_key")
@@ -46,28 +44,24 @@ def update_preference(details: Dict[str, Any]) -> bool:
              logger.error(f"Thiếu thông tin để cập nhật sở thích: {details}")
              return False
 
-        if member_id in family_data:
-            if "preferences" not in family_data[member_id] or not isinstance(family_data[member_id]["preferences"], dict):
-                family_data[member_id]["preferences"] = {}
+        member = family_repository.get(member_id)
+        if member is not None:
+            preferences = member.get("preferences")
+            preferences = dict(preferences) if isinstance(preferences, dict) else {}
+            preferences[preference_key] = preference_value
 
-            original_value = family_data[member_id]["preferences"].get(preference_key)
-            family_data[member_id]["preferences"][preference_key] = preference_value
-            family_data[member_id]["last_updated"] = datetime.datetime.now().isoformat()
-
-            if save_data(FAMILY_DATA_FILE, family_data):
+            if family_repository.update(member_id, {
+                "preferences": preferences,
+                "last_updated": datetime.datetime.now().isoformat()
+            }) is not None:
                 logger.info(f"Đã cập nhật sở thích '{preference_key}' cho thành viên {member_id}")
                 return True
             else:
                  logger.error(f"Lưu thất bại sau khi cập nhật sở thích cho {member_id}.")
-                 if original_value is not None:
-                      family_data[member_id]["preferences"][preference_key] = original_value
-                 else:
-                      if preference_key in family_data[member_id]["preferences"]:
-                           del family_data[member_id]["preferences"][preference_key]
                  return False
         else:
             logger.warning(f"Không tìm thấy thành viên ID={member_id} để cập nhật sở thích.")
             return False
     except Exception as e:
          logger.error(f"Lỗi khi cập nhật sở thích: {e}", exc_info=True)
-         return False
\ No newline at end of file
+         return False
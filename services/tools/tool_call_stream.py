@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import json
+from typing import Dict, Any, List
+
+from openai.types.chat import ChatCompletionMessageToolCall
+
+from config.logging_config import logger
+
+
+class JsonObjectTracker:
+    """
+    Theo dõi tăng dần một JSON object đang được stream theo từng mảnh: đếm độ sâu ngoặc
+    (bỏ qua ngoặc trong chuỗi) để biết object ngoài cùng đã đóng mà không parse lại từ đầu.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.opened = False
+        self.closed = False
+        self.trailing = False  # Còn ký tự khác khoảng trắng sau khi object đã đóng -> JSON không hợp lệ
+
+    def feed(self, text: str) -> bool:
+        """Thêm một mảnh; True nếu object ngoài cùng đã đóng."""
+        for char in text:
+            if self.closed:
+                if not char.isspace():
+                    self.trailing = True
+                continue
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+                self.opened = True
+            elif char in "}]":
+                self.depth -= 1
+                if self.opened and self.depth == 0:
+                    self.closed = True
+        return self.closed and not self.trailing
+
+
+class ToolCallAssembler:
+    """
+    Ghép các mảnh tool_call của stream theo index. ready() trả về các call đã có id, name
+    và arguments là JSON object hợp lệ để chạy ngay trong lúc model còn stream các call sau;
+    call được trả về theo đúng thứ tự index (call sau không chạy trước call trước).
+    """
+
+    def __init__(self):
+        self.chunks: Dict[int, Dict[str, Any]] = {}
+        self._trackers: Dict[int, JsonObjectTracker] = {}
+        self._next_index = 0
+
+    def feed(self, tc_chunk: Any) -> None:
+        index = tc_chunk.index
+        if index not in self.chunks:
+            self.chunks[index] = {"function": {"arguments": ""}}
+            self._trackers[index] = JsonObjectTracker()
+        chunk_data = self.chunks[index]
+        if tc_chunk.id: chunk_data["id"] = tc_chunk.id
+        if tc_chunk.type: chunk_data["type"] = tc_chunk.type
+        if tc_chunk.function:
+            if tc_chunk.function.name: chunk_data["function"]["name"] = tc_chunk.function.name
+            if tc_chunk.function.arguments:
+                chunk_data["function"]["arguments"] += tc_chunk.function.arguments
+                self._trackers[index].feed(tc_chunk.function.arguments)
+
+    def _is_complete(self, index: int) -> bool:
+        chunk_data = self.chunks[index]
+        if not (chunk_data.get("id") and chunk_data["function"].get("name")):
+            return False
+        tracker = self._trackers[index]
+        if not tracker.closed or tracker.trailing:
+            return False
+        try:
+            return isinstance(json.loads(chunk_data["function"]["arguments"]), dict)
+        except ValueError:
+            return False
+
+    def _build(self, index: int) -> List[ChatCompletionMessageToolCall]:
+        chunk_data = self.chunks[index]
+        if not (chunk_data.get("id") and chunk_data.get("function", {}).get("name")):
+            logger.error(f"Incomplete data for tool call reconstruction at index {index}: {chunk_data}")
+            return []
+        try:
+            return [ChatCompletionMessageToolCall(id=chunk_data["id"], type='function', function=chunk_data["function"])]
+        except Exception as recon_err:
+            logger.error(f"Error reconstructing tool call at index {index}: {recon_err} - Data: {chunk_data}")
+            return []
+
+    def ready(self) -> List[ChatCompletionMessageToolCall]:
+        """Các call mới đã đủ arguments hợp lệ (mỗi call chỉ được trả về một lần)."""
+        tool_calls = []
+        while self._next_index in self.chunks and self._is_complete(self._next_index):
+            tool_calls.extend(self._build(self._next_index))
+            self._next_index += 1
+        return tool_calls
+
+    def remaining(self) -> List[ChatCompletionMessageToolCall]:
+        """Khi stream kết thúc: các call chưa được ready() trả về (arguments có thể không hợp lệ)."""
+        tool_calls = []
+        for index in sorted(i for i in self.chunks if i >= self._next_index):
+            tool_calls.extend(self._build(index))
+        self._next_index = max(self.chunks, default=-1) + 1
+        return tool_calls
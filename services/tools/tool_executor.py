@@ -9,6 +9,7 @@ from openai.types.chat import ChatCompletionMessageToolCall
 from config.logging_config import logger
 from core.datetime_handler import DateTimeHandler, get_date_from_relative_term, determine_repeat_type
 from core.event_manager import classify_event
+from database.data_manager import events_data
 from services.tools.family_tools import add_family_member, update_preference
 from services.tools.event_tools import add_event, update_event, delete_event
 from services.tools.note_tools import add_note
@@ -91,7 +92,7 @@ def execute_tool_call(tool_call: ChatCompletionMessageToolCall, current_member_i
                          # Nếu update mà date_description không parse được, không nên xóa date cũ
                          logger.info(f"Update event: date_description '{date_description}' không hợp lệ, giữ nguyên date cũ nếu có.")
                          # Không cần làm gì thêm, date cũ vẫn trong arguments nếu được truyền
-                    elif "date" in arguments and final_date_str is None and event_to_update.get("repeat_type") == "ONCE":
+                    elif "date" in arguments and final_date_str is None and events_data.get(arguments.get("id"), {}).get("repeat_type") == "ONCE":
                         # Nếu update sự kiện ONCE mà date_desc không parse đc, nên báo lỗi hoặc giữ ngày cũ thay vì xóa?
                         # Hiện tại đang giữ nguyên date cũ trong arguments nếu có.
                         pass
@@ -134,6 +135,11 @@ def execute_tool_call(tool_call: ChatCompletionMessageToolCall, current_member_i
             elif function_name == "update_event":
                  arguments["updated_by"] = current_member_id
 
+        # Lấy category của event sắp bị xóa trước khi gọi delete_event (sau đó event không còn trong events_data)
+        deleted_category = "Unknown"
+        if function_name == "delete_event":
+            deleted_category = events_data.get(str(arguments.get("event_id")), {}).get("category", "Unknown")
+
         # --- Execute the function ---
         if function_name in tool_functions:
             func_to_call = tool_functions[function_name]
@@ -149,8 +155,6 @@ def execute_tool_call(tool_call: ChatCompletionMessageToolCall, current_member_i
                      # Xử lý event_action_data cho delete
                      if function_name == "delete_event":
                          deleted_event_id = arguments.get("event_id")
-                         # Cố gắng lấy category của event bị xóa để trả về (nếu cần)
-                         deleted_category = events_data.get(str(deleted_event_id), {}).get("category", "Unknown") if str(deleted_event_id) in events_data else "Unknown" # Lấy trước khi pop
                          # Logic xóa thực tế nằm trong hàm delete_event được gọi ở trên
                          # Cập nhật event_action_data sau khi hàm delete_event chạy thành công
                          event_action_data = {
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Set, AsyncIterator, Tuple
+
+from openai.types.chat import ChatCompletionMessageToolCall
+
+from config.settings import TOOL_EXECUTOR_WORKERS
+from config.logging_config import logger
+from database.data_manager import (
+    PersistBatch, run_batched, prepare_persist_batches, write_payload, finish_batch_write,
+    rollback_persist_batches,
+)
+from services.tools.tool_executor import execute_tool_call
+
+# Tham số xác định thực thể mà tool call thay đổi; call trùng khóa phải chạy tuần tự
+CONFLICT_FIELDS = {"event_id": "event", "member_id": "member"}
+
+
+def conflict_keys(tool_call: ChatCompletionMessageToolCall) -> Set[str]:
+    """Các khóa thực thể (vd. "event:<id>") mà tool call đọc/ghi, lấy từ arguments."""
+    try:
+        arguments = json.loads(tool_call.function.arguments or "{}")
+    except (TypeError, ValueError):
+        return set()
+    if not isinstance(arguments, dict):
+        return set()
+    return {f"{prefix}:{arguments[field]}" for field, prefix in CONFLICT_FIELDS.items() if arguments.get(field)}
+
+
+class ToolRun:
+    """Một tool call trong lượt: kết quả cho LLM, event_data cho frontend và thời gian chờ/chạy."""
+
+    def __init__(self, index: int, tool_call: ChatCompletionMessageToolCall):
+        self.index = index
+        self.tool_call = tool_call
+        self.name = tool_call.function.name
+        self.keys = conflict_keys(tool_call)
+        self.batch = PersistBatch()
+        self.event_data: Optional[Dict[str, Any]] = None
+        self.result = ""
+        self.started_at: Optional[float] = None
+        self.wait_ms = 0.0
+        self.latency_ms = 0.0
+
+    def tool_message(self) -> Dict[str, Any]:
+        return {"tool_call_id": self.tool_call.id, "role": "tool", "name": self.name, "content": self.result}
+
+
+class ToolTurn:
+    """
+    Các tool call của một lượt trả lời. Call có thể được submit dần trong lúc stream của model
+    còn đang đến; finish() trả về các sự kiện còn lại rồi ghi dữ liệu một lần cho cả lượt.
+    """
+
+    def __init__(self, scheduler: "ToolScheduler", member_id: Optional[str]):
+        self.scheduler = scheduler
+        self.member_id = member_id
+        self.runs: List[ToolRun] = []
+        self._tasks: List[asyncio.Task] = []
+        self._last_by_key: Dict[str, asyncio.Task] = {}
+        self._events: asyncio.Queue = asyncio.Queue()
+        self._consumed = 0
+        self._started = time.perf_counter()
+        self._submissions_done: Optional[float] = None
+        self._closed = False
+
+    def submit(self, tool_call: ChatCompletionMessageToolCall, early: bool = False) -> ToolRun:
+        """
+        Bắt đầu chạy một call (sau các call trước có chung event_id/member_id).
+        `early`: call được gửi khi model còn đang stream (chỉ để thống kê).
+        """
+        run = ToolRun(len(self.runs), tool_call)
+        if early:
+            self.scheduler.metrics["dispatched_early"] += 1
+        depends_on = list({id(self._last_by_key[key]): self._last_by_key[key]
+                           for key in run.keys if key in self._last_by_key}.values())
+        if depends_on:
+            self.scheduler.metrics["serialized"] += 1
+        task = asyncio.create_task(self.scheduler._execute(run, self.member_id, depends_on, self._events))
+        for key in run.keys:
+            self._last_by_key[key] = task
+        self.runs.append(run)
+        self._tasks.append(task)
+        return run
+
+    def ready_events(self) -> List[Tuple[str, ToolRun]]:
+        """Các sự kiện ("start"/"end", run) đã có, không chờ (để gửi frame xen giữa stream)."""
+        events = []
+        while not self._events.empty():
+            events.append(self._events.get_nowait())
+        self._consumed += len(events)
+        return events
+
+    async def finish(self) -> AsyncIterator[Tuple[str, ToolRun]]:
+        """
+        Chờ các sự kiện start/end còn lại, ghi dữ liệu, rồi trả về ("commit", run) cho từng call
+        theo thứ tự submit; run.result lúc này là kết quả cuối cùng (đã tính lỗi ghi file).
+        """
+        if self._submissions_done is None:
+            self._submissions_done = time.perf_counter()
+        try:
+            while self._consumed < 2 * len(self.runs):
+                event = await self._events.get()
+                self._consumed += 1
+                yield event
+        finally:
+            await self.close()
+        for run in self.runs:
+            yield "commit", run
+
+    async def close(self) -> None:
+        """Chờ các call đã submit chạy xong rồi ghi dữ liệu (chỉ một lần; cũng dùng khi stream lỗi giữa chừng)."""
+        if self._closed:
+            return
+        self._closed = True
+        submissions_done = self._submissions_done or time.perf_counter()
+        # Client ngắt kết nối giữa chừng: vẫn chờ các tool đã chạy xong rồi mới ghi dữ liệu
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        failed_files = await self.scheduler._commit([run.batch for run in self.runs])
+        metrics = self.scheduler.metrics
+        for run in self.runs:
+            if run.batch.failed_in(failed_files):
+                metrics["commit_failures"] += 1
+                run.event_data = None
+                run.result = f"Thất bại khi lưu dữ liệu của {run.name}. Chi tiết lỗi đã được ghi lại."
+            metrics["total_tool_ms"] += run.latency_ms
+            # Phần thời gian chạy tool trùng với lúc model còn đang stream (các call sau)
+            if run.started_at is not None:
+                metrics["overlapped_ms"] += max(0.0, min(run.started_at + run.latency_ms / 1000, submissions_done)
+                                                - run.started_at) * 1000
+        metrics["turns"] += 1
+        metrics["tool_calls"] += len(self.runs)
+        turn_ms = (time.perf_counter() - self._started) * 1000
+        metrics["total_turn_ms"] += turn_ms
+        logger.info(f"Đã chạy {len(self.runs)} tool call trong {turn_ms:.0f} ms "
+                    f"(tổng thời gian từng tool {sum(run.latency_ms for run in self.runs):.0f} ms)")
+
+
+class ToolScheduler:
+    """
+    Chạy các tool call của một lượt trả lời. Tool chạy trên event loop (cùng luồng với các
+    request đọc store, nên không ai thấy dict/index đang sửa dở); call có chung
+    event_id/member_id chờ call trước đó (theo thứ tự model trả về). Mọi thay đổi dữ liệu
+    được gom và ghi một lần cho mỗi file khi cả lượt xong: snapshot được mã hóa trên event
+    loop, còn việc ghi file chạy song song trên thread pool.
+    """
+
+    def __init__(self, workers: int = TOOL_EXECUTOR_WORKERS):
+        self.workers = max(0, workers)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.metrics = {
+            "turns": 0,
+            "tool_calls": 0,
+            "serialized": 0,
+            "commit_failures": 0,
+            "dispatched_early": 0,
+            "total_tool_ms": 0.0,
+            "overlapped_ms": 0.0,
+            "total_turn_ms": 0.0,
+        }
+
+    def _executor(self) -> Optional[ThreadPoolExecutor]:
+        if self.workers and self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tool-io")
+        return self._pool
+
+    async def _execute(self, run: ToolRun, member_id: Optional[str], depends_on: List[asyncio.Task],
+                       events: asyncio.Queue) -> ToolRun:
+        queued = time.perf_counter()
+        if depends_on:
+            await asyncio.wait(depends_on)
+        run.started_at = time.perf_counter()
+        run.wait_ms = (run.started_at - queued) * 1000
+        events.put_nowait(("start", run))
+        try:
+            run.event_data, run.result = run_batched(run.batch, execute_tool_call, run.tool_call, member_id)
+        except Exception as e:
+            logger.error(f"Lỗi khi chạy tool {run.name}: {e}", exc_info=True)
+            run.event_data, run.result = None, f"Lỗi không xác định khi thực thi {run.name}."
+        run.latency_ms = (time.perf_counter() - run.started_at) * 1000
+        events.put_nowait(("end", run))
+        return run
+
+    async def _commit(self, batches: List[PersistBatch]) -> Dict[str, Set[str]]:
+        """
+        Ghi gộp các batch của lượt; thay đổi ghi thất bại được rollback trong bộ nhớ.
+        Returns {file_path: các key ghi thất bại}.
+        """
+        payloads, failed = prepare_persist_batches(batches)
+        executor = self._executor()
+        loop = asyncio.get_running_loop()
+        files = list(payloads)
+        if executor is None:
+            results = [write_payload(file_path, *payloads[file_path][:2]) for file_path in files]
+        else:
+            results = await asyncio.gather(*[
+                loop.run_in_executor(executor, write_payload, file_path, *payloads[file_path][:2])
+                for file_path in files
+            ], return_exceptions=True)
+        for file_path, ok in zip(files, results):
+            if isinstance(ok, BaseException):
+                logger.error(f"Lỗi khi ghi {file_path}: {ok}")
+                ok = False
+            if not finish_batch_write(file_path, ok, len(payloads[file_path][2])):
+                failed[file_path] = payloads[file_path][2]
+        # Chạy trên event loop sau khi các luồng ghi đã xong
+        rollback_persist_batches(batches, failed)
+        return failed
+
+    def begin(self, member_id: Optional[str]) -> ToolTurn:
+        """Bắt đầu một lượt để submit call dần dần (vd. ngay khi arguments trong stream đã đầy đủ)."""
+        return ToolTurn(self, member_id)
+
+    async def stream(self, tool_calls: List[ChatCompletionMessageToolCall],
+                     member_id: Optional[str]) -> AsyncIterator[Tuple[str, ToolRun]]:
+        """Chạy các tool call đã có đủ; sự kiện như ToolTurn.finish()."""
+        turn = self.begin(member_id)
+        for tool_call in tool_calls:
+            turn.submit(tool_call)
+        async for event in turn.finish():
+            yield event
+
+    async def run(self, tool_calls: List[ChatCompletionMessageToolCall], member_id: Optional[str]) -> List[ToolRun]:
+        """Chạy các tool call và trả về kết quả theo thứ tự ban đầu."""
+        return [run async for kind, run in self.stream(tool_calls, member_id) if kind == "commit"]
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        turns = self.metrics["turns"]
+        return {
+            **self.metrics,
+            "total_tool_ms": round(self.metrics["total_tool_ms"], 1),
+            "overlapped_ms": round(self.metrics["overlapped_ms"], 1),
+            "total_turn_ms": round(self.metrics["total_turn_ms"], 1),
+            "workers": self.workers,
+            "avg_turn_ms": round(self.metrics["total_turn_ms"] / turns, 1) if turns else 0.0,
+        }
+
+
+# Singleton instance
+tool_scheduler = ToolScheduler()
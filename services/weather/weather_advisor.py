@@ -1,10 +1,13 @@
 from __future__ import annotations
 
 import re
+import json
 import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 
 from config.logging_config import logger
+from core.token_budget import token_counter, budget_manager
+from services.llm.client_pool import llm_clients
 
 class WeatherAdvisor:
     """
@@ -781,13 +784,15 @@ class WeatherAdvisor:
         return "\n".join(result)
     
     @classmethod
-    async def detect_weather_advice_need(cls, query: str, openai_api_key: str) -> Tuple[bool, str, Optional[str]]:
+    async def detect_weather_advice_need(cls, query: str, openai_api_key: str,
+                                         raise_errors: bool = False) -> Tuple[bool, str, Optional[str]]:
         """
         Phát hiện nhu cầu tư vấn liên quan đến thời tiết từ câu hỏi.
         
         Args:
             query: Câu hỏi của người dùng
             openai_api_key: API key của OpenAI
+            raise_errors: Raise lại lỗi LLM/JSON thay vì trả về kết quả âm tính
             
         Returns:
             Tuple (is_advice_query, advice_type, location, date_description)
@@ -796,8 +801,7 @@ class WeatherAdvisor:
             return False, "general", None, None
             
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=openai_api_key)
+            client = llm_clients.get(openai_api_key)
             
             system_prompt = """
 Bạn là một hệ thống phân loại truy vấn tư vấn thời tiết thông minh. Nhiệm vụ của bạn là:
@@ -821,17 +825,20 @@ Ví dụ:
 
 Trả lời DƯỚI DẠNG JSON HỢP LỆ với 4 trường: is_advice_query (boolean), advice_type (string hoặc null), location (string hoặc null), date_description (string hoặc null).
 """
-            response = await asyncio.to_thread(
-                 client.chat.completions.create,
+            query_messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"Câu hỏi của người dùng: \"{query}\""}
+            ]
+            estimated_prompt = token_counter.count_messages(query_messages)
+            max_tokens = budget_manager.max_tokens("weather_advice_intent", estimated_prompt)
+            response = await client.chat.completions.create(
                  model="gpt-4o-mini",
-                 messages=[
-                     {"role": "system", "content": system_prompt},
-                     {"role": "user", "content": f"Câu hỏi của người dùng: \"{query}\""}
-                 ],
+                 messages=query_messages,
                  temperature=0.1,
-                 max_tokens=150,
+                 max_tokens=max_tokens,
                  response_format={"type": "json_object"}
             )
+            budget_manager.record("weather_advice_intent", estimated_prompt, response.usage, max_tokens)
 
             result_str = response.choices[0].message.content
             logger.info(f"Kết quả detect_weather_advice_need (raw): {result_str}")
@@ -854,8 +861,12 @@ Trả lời DƯỚI DẠNG JSON HỢP LỆ với 4 trường: is_advice_query (b
 
             except (json.JSONDecodeError, TypeError) as e:
                 logger.error(f"Lỗi giải mã JSON từ detect_weather_advice_need: {e}. Raw: {result_str}")
+                if raise_errors:
+                    raise
                 return False, "general", None, None
                 
         except Exception as e:
             logger.error(f"Lỗi khi gọi OpenAI trong detect_weather_advice_need: {e}", exc_info=True)
+            if raise_errors:
+                raise
             return False, "general", None, None
\ No newline at end of file
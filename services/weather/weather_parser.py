@@ -7,7 +7,9 @@ import datetime
 from typing import Dict, Any, Optional, List, Tuple
 
 from config.logging_config import logger
+from core.token_budget import token_counter, budget_manager
 from core.datetime_handler import DateTimeHandler
+from services.llm.client_pool import llm_clients
 from services.weather.weather_service import WeatherService
 
 class WeatherQueryParser:
@@ -17,7 +19,8 @@ class WeatherQueryParser:
     """
     
     @classmethod
-    async def parse_weather_query(cls, query: str, openai_api_key: str) -> Tuple[bool, str, Optional[str]]:
+    async def parse_weather_query(cls, query: str, openai_api_key: str,
+                                  raise_errors: bool = False) -> Tuple[bool, str, Optional[str]]:
         """
         Phân tích truy vấn thời tiết để xác định:
         - Có phải truy vấn thời tiết không
@@ -27,6 +30,7 @@ class WeatherQueryParser:
         Args:
             query: Chuỗi truy vấn của người dùng 
             openai_api_key: API key của OpenAI
+            raise_errors: Raise lại lỗi LLM/JSON thay vì trả về kết quả âm tính
             
         Returns:
             Tuple (is_weather_query, location, date_description)
@@ -35,8 +39,7 @@ class WeatherQueryParser:
             return False, None, None
             
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=openai_api_key)
+            client = llm_clients.get(openai_api_key)
             
             system_prompt = """
 Bạn là một hệ thống phân loại truy vấn thời tiết thông minh. Nhiệm vụ của bạn là:
@@ -59,17 +62,20 @@ Ví dụ:
 
 Trả lời DƯỚI DẠNG JSON HỢP LỆ với 3 trường: is_weather_query (boolean), location (string hoặc null), date_description (string hoặc null).
 """
-            response = await asyncio.to_thread(
-                 client.chat.completions.create,
+            query_messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"Câu hỏi của người dùng: \"{query}\""}
+            ]
+            estimated_prompt = token_counter.count_messages(query_messages)
+            max_tokens = budget_manager.max_tokens("weather_query", estimated_prompt)
+            response = await client.chat.completions.create(
                  model="gpt-4o-mini",
-                 messages=[
-                     {"role": "system", "content": system_prompt},
-                     {"role": "user", "content": f"Câu hỏi của người dùng: \"{query}\""}
-                 ],
+                 messages=query_messages,
                  temperature=0.1,
-                 max_tokens=150,
+                 max_tokens=max_tokens,
                  response_format={"type": "json_object"}
             )
+            budget_manager.record("weather_query", estimated_prompt, response.usage, max_tokens)
 
             result_str = response.choices[0].message.content
             logger.info(f"Kết quả parse_weather_query (raw): {result_str}")
@@ -88,10 +94,14 @@ Trả lời DƯỚI DẠNG JSON HỢP LỆ với 3 trường: is_weather_query (
 
             except (json.JSONDecodeError, TypeError) as e:
                 logger.error(f"Lỗi giải mã JSON từ parse_weather_query: {e}. Raw: {result_str}")
+                if raise_errors:
+                    raise
                 return False, None, None
                 
         except Exception as e:
             logger.error(f"Lỗi khi gọi OpenAI trong parse_weather_query: {e}", exc_info=True)
+            if raise_errors:
+                raise
             return False, None, None
 
     @classmethod
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# config.settings đọc DATA_DIR lúc import: dùng thư mục tạm để test không đụng vào data/ thật
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="smartlife_tests_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
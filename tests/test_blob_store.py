@@ -0,0 +1,22 @@
+from database.blob_store import BlobStore
+
+
+def test_resolve_cache_is_bounded_by_bytes(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"), resolve_cache_max_bytes=3000)
+    refs = [store.put(bytes([i]) * 1000, "image/png") for i in range(4)]
+    data_urls = [store.resolve(ref) for ref in refs]
+    assert all(url.startswith("data:image/png;base64,") for url in data_urls)
+    metrics = store.get_metrics()
+    assert metrics["resolve_cache_bytes"] <= 3000
+    assert metrics["resolve_evictions"] >= 1
+    # Mục mới nhất vẫn còn trong cache
+    assert store.resolve(refs[-1]) == data_urls[-1]
+    assert store.get_metrics()["resolve_hits"] == 1
+
+
+def test_oversized_blob_is_not_cached(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"), resolve_cache_max_bytes=100)
+    ref = store.put(b"x" * 1000, "image/jpeg")
+    assert store.resolve(ref) is not None
+    assert store.get_metrics()["resolve_cache_entries"] == 0
+    assert store.resolve("blob://invalid") is None
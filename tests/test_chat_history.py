@@ -0,0 +1,50 @@
+import pytest
+
+from database.data_manager import chat_history
+from database.history_index import history_index
+from core.session_manager import session_manager
+from utils.helpers import save_chat_history, reconstruct_history_entry
+
+
+@pytest.fixture
+def empty_history(monkeypatch):
+    chat_history.clear()
+    history_index.rebuild(chat_history)
+    # Dựng lại lịch sử không được phải tải shard session
+    monkeypatch.setattr(session_manager, "find_session", lambda session_id: pytest.fail("find_session được gọi"))
+    yield
+    chat_history.clear()
+    history_index.rebuild(chat_history)
+
+
+def _turn(i):
+    return [{"role": "user", "content": f"câu hỏi {i}"}, {"role": "assistant", "content": f"trả lời {i}"}]
+
+
+def test_rotation_keeps_delta_chain_complete(empty_history):
+    transcript = []
+    for i in range(30):
+        transcript += _turn(i)
+        assert save_chat_history("m1", list(transcript), f"tóm tắt {i}", "s1")
+
+    entries = chat_history["m1"]
+    assert len(entries) == 20
+    assert entries[0]["offset"] > 0 # Entry mới vẫn chỉ lưu phần delta
+    for position, entry in enumerate(entries):
+        full = reconstruct_history_entry("m1", entry)
+        assert not full.get("transcript_incomplete")
+        assert full["messages"] == transcript[:len(transcript) - 2 * position]
+
+
+def test_rotation_rebases_other_members_chain(empty_history):
+    transcript = _turn(0)
+    save_chat_history("m1", list(transcript), "", "shared")
+    transcript += _turn(1)
+    save_chat_history("m2", list(transcript), "", "shared")
+    for i in range(20):
+        save_chat_history("m1", _turn(100 + i), "", f"other-{i}")
+
+    assert len(chat_history["m1"]) == 20
+    rebased = chat_history["m2"][0]
+    assert rebased["offset"] == 0
+    assert reconstruct_history_entry("m2", rebased)["messages"] == transcript
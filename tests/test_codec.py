@@ -0,0 +1,46 @@
+import pytest
+
+from database import codec
+from database.data_manager import StoreLoadError, load_data, save_data
+from database.records import EventRecord
+
+SAMPLE = {
+    "e1": {"id": "e1", "title": "Sinh nhật bà", "participants": ["m1", "m2"], "reminder": None},
+    "e2": EventRecord({"id": "e2", "title": "Họp", "date": "2024-05-01"}),
+}
+
+
+@pytest.mark.parametrize("name", [codec.CODEC_JSON, codec.CODEC_JSON_COMPACT, codec.CODEC_MSGPACK])
+def test_round_trip(name):
+    payload = codec.encode(SAMPLE, name)
+    assert codec.detect_codec(payload) == name
+    decoded = codec.decode(payload)
+    assert decoded["e1"] == SAMPLE["e1"]
+    assert decoded["e2"] == dict(SAMPLE["e2"])
+
+
+def test_load_data_reads_any_codec(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "events.json")
+    monkeypatch.setattr(codec, "ACTIVE_CODEC", codec.CODEC_MSGPACK)
+    assert save_data(file_path, SAMPLE)
+    assert load_data(file_path)["e2"]["title"] == "Họp"
+    assert load_data(str(tmp_path / "missing.json")) == {}
+
+
+def test_load_data_fails_loudly_without_msgpack(tmp_path, monkeypatch):
+    file_path = tmp_path / "events.json"
+    file_path.write_bytes(codec.encode(SAMPLE, codec.CODEC_MSGPACK))
+    monkeypatch.setattr(codec, "msgpack", None)
+    with pytest.raises(StoreLoadError):
+        load_data(str(file_path))
+    # File trên đĩa không bị đụng tới
+    monkeypatch.undo()
+    assert set(codec.decode(file_path.read_bytes())) == {"e1", "e2"}
+
+
+@pytest.mark.parametrize("content", [b"{not json", b"[1, 2, 3]"])
+def test_load_data_rejects_corrupt_or_non_dict(tmp_path, content):
+    file_path = tmp_path / "notes.json"
+    file_path.write_bytes(content)
+    with pytest.raises(StoreLoadError):
+        load_data(str(file_path))
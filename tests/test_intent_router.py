@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from services.intent.intent_cache import intent_cache
+from services.intent.intent_router import IntentRouter, normalize_intent
+
+QUERY = "giá vàng hôm nay bao nhiêu"
+
+
+def _router(monkeypatch, mode, outcomes):
+    """Router dùng các bộ phân loại giả: mỗi outcome là None (âm tính), intent hoặc Exception."""
+    def classifiers(self, query, api_key, weather_enabled, search_enabled):
+        def make(outcome):
+            async def classifier():
+                await asyncio.sleep(0)
+                if isinstance(outcome, Exception):
+                    raise outcome
+                return outcome
+            return classifier
+        return [make(outcome) for outcome in outcomes]
+
+    monkeypatch.setattr(IntentRouter, "_classifiers", classifiers)
+    intent_cache.clear()
+    return IntentRouter(mode=mode, local_enabled=False)
+
+
+def _cached(mode):
+    return intent_cache.get(intent_cache.make_key(QUERY, mode, True, True))
+
+
+@pytest.mark.parametrize("mode", ["sequential", "concurrent"])
+def test_failed_classifier_result_is_not_cached(monkeypatch, mode):
+    router = _router(monkeypatch, mode, [RuntimeError("timeout"), None, None])
+    intent = asyncio.run(router.classify(QUERY, "sk-test"))
+    assert intent["need_search"] is False
+    assert _cached(mode) is None
+    assert router.metrics["classifier_errors"] == 1
+
+
+@pytest.mark.parametrize("mode", ["sequential", "concurrent"])
+def test_positive_after_failed_higher_priority_is_not_cached(monkeypatch, mode):
+    search = normalize_intent({"need_search": True, "search_query": QUERY}, QUERY)
+    router = _router(monkeypatch, mode, [None, RuntimeError("timeout"), search])
+    assert asyncio.run(router.classify(QUERY, "sk-test"))["need_search"] is True
+    assert _cached(mode) is None
+
+
+@pytest.mark.parametrize("mode", ["sequential", "concurrent"])
+def test_clean_result_is_cached(monkeypatch, mode):
+    router = _router(monkeypatch, mode, [None, None, None])
+    asyncio.run(router.classify(QUERY, "sk-test"))
+    assert _cached(mode) is not None
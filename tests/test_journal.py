@@ -0,0 +1,66 @@
+import database.data_manager as data_manager
+from database.data_manager import load_data, load_store, persist_change
+from database.journal import JournalWriter, journal_path_for, replay_journal
+
+
+def test_replay_applies_sets_and_deletes_in_order(tmp_path):
+    file_path = str(tmp_path / "notes.json")
+    writer = JournalWriter(file_path, compact_threshold_bytes=0)
+    assert writer.append("set", "n1", {"title": "Đi chợ"})
+    assert writer.append("set", "n2", {"title": "Nộp học phí"})
+    assert writer.append("set", "n1", {"title": "Đi chợ sáng"})
+    assert writer.append("del", "n2")
+
+    data = {"n0": {"title": "Có sẵn trong snapshot"}}
+    assert replay_journal(file_path, data) == 4
+    assert data == {"n0": {"title": "Có sẵn trong snapshot"}, "n1": {"title": "Đi chợ sáng"}}
+    # Replay là idempotent
+    assert replay_journal(file_path, data) == 4
+    assert set(data) == {"n0", "n1"}
+
+
+def test_replay_skips_torn_last_line(tmp_path):
+    file_path = str(tmp_path / "events.json")
+    writer = JournalWriter(file_path, compact_threshold_bytes=0)
+    assert writer.append("set", "e1", {"title": "Họp"})
+    with open(journal_path_for(file_path), "a", encoding="utf-8") as f:
+        f.write('{"op":"set","k":"e2","v":{"tit') # Crash giữa lúc ghi
+    data = {}
+    assert replay_journal(file_path, data) == 1
+    assert data == {"e1": {"title": "Họp"}}
+
+    # Writer mới (sau khi khởi động lại) không được nối bản ghi vào dòng dở
+    writer = JournalWriter(file_path, compact_threshold_bytes=0)
+    assert writer.append("set", "e3", {"title": "Sinh nhật"})
+    data = {}
+    assert replay_journal(file_path, data) == 2
+    assert data == {"e1": {"title": "Họp"}, "e3": {"title": "Sinh nhật"}}
+
+
+def test_compact_folds_journal_into_snapshot(tmp_path):
+    file_path = str(tmp_path / "family.json")
+    writer = JournalWriter(file_path, compact_threshold_bytes=0)
+    data = {"m1": {"name": "Bố"}, "m2": {"name": "Mẹ"}}
+    for key, value in data.items():
+        assert writer.append("set", key, value)
+    assert writer.compact(data)
+    assert load_data(file_path) == data
+    assert replay_journal(file_path, {}) == 0
+
+
+def test_persist_change_in_journal_mode_survives_reload(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, "JOURNAL_ACTIVE", True)
+    monkeypatch.setattr(data_manager, "MULTIPROCESS_STORAGE_ENABLED", False)
+    monkeypatch.setattr(data_manager, "_journal_writers", {})
+    file_path = str(tmp_path / "custom_store.json")
+    data = {}
+    data["k1"] = {"v": 1}
+    assert persist_change(file_path, data, "k1")
+    data["k2"] = {"v": 2}
+    assert persist_change(file_path, data, "k2")
+    del data["k1"]
+    assert persist_change(file_path, data, "k1")
+
+    # Chưa compact: snapshot chưa có gì, trạng thái nằm trong journal
+    assert load_data(file_path) == {}
+    assert load_store(file_path) == {"k2": {"v": 2}}
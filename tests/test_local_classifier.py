@@ -0,0 +1,34 @@
+import json
+import os
+
+import pytest
+
+from config.settings import INTENT_LOCAL_CONFIDENCE
+from services.intent.local_classifier import local_intent_classifier, LABEL_NONE, LABEL_SEARCH
+
+EVAL_SET_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "benchmarks", "intent_eval_set.json")
+
+
+@pytest.mark.parametrize("query", [
+    "Tìm giúp tôi công thức nấu phở",
+    "tra cứu lịch thi THPT quốc gia năm nay",
+    "Kể về lịch sử Việt Nam",
+    "Một câu không khớp quy tắc nào cả",
+])
+def test_possible_search_is_never_settled_locally_as_none(query):
+    decision = local_intent_classifier.classify(query)
+    assert decision.label == LABEL_SEARCH or decision.confidence < INTENT_LOCAL_CONFIDENCE
+
+
+def test_local_decisions_match_eval_set():
+    with open(EVAL_SET_PATH, "r", encoding="utf-8") as f:
+        examples = json.load(f)
+    for example in examples:
+        decision = local_intent_classifier.classify(example["query"])
+        if decision.confidence >= INTENT_LOCAL_CONFIDENCE:
+            assert decision.label == example["label"], (example["query"], decision.rule)
+
+
+def test_event_lookup_is_not_web_search():
+    assert local_intent_classifier.classify("tìm sự kiện ngày mai").label == LABEL_NONE
@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import pytest
+from openai.types.chat import ChatCompletionMessageToolCall
+
+import database.data_manager as data_manager
+import services.tools.tool_scheduler as scheduler_module
+from config.settings import EVENTS_DATA_FILE, NOTES_DATA_FILE
+from database.data_manager import (
+    PersistBatch, run_batched, commit_persist_batches, encode_store, write_payload, load_data,
+)
+from database.event_index import event_index
+from database.repositories import event_repository, note_repository
+
+
+@pytest.fixture(autouse=True)
+def empty_stores():
+    for store in (data_manager.events_data, data_manager.notes_data):
+        store.clear()
+    event_index.rebuild(data_manager.events_data)
+    yield
+    for store in (data_manager.events_data, data_manager.notes_data):
+        store.clear()
+    event_index.rebuild(data_manager.events_data)
+
+
+def _failing_write(file_path, payload, seq):
+    return False
+
+
+def test_batched_changes_are_written_once_per_store(monkeypatch):
+    writes = []
+    monkeypatch.setattr(data_manager, "write_payload",
+                        lambda file_path, payload, seq: writes.append(file_path) or write_payload(file_path, payload, seq))
+    batches = [PersistBatch() for _ in range(3)]
+    event_a, _ = run_batched(batches[0], event_repository.create, {"title": "A", "category": "Health"})
+    event_b, _ = run_batched(batches[1], event_repository.create, {"title": "B"})
+    run_batched(batches[2], note_repository.create, {"title": "N"})
+
+    assert commit_persist_batches(batches) == {}
+    assert sorted(writes) == sorted([EVENTS_DATA_FILE, NOTES_DATA_FILE])
+    assert set(load_data(EVENTS_DATA_FILE)) == {event_a, event_b}
+
+
+def test_failed_commit_rolls_back_memory_and_index(monkeypatch):
+    existing, _ = event_repository.create({"title": "Cũ", "category": "Work"})
+    monkeypatch.setattr(data_manager, "write_payload", _failing_write)
+
+    batch = PersistBatch()
+    created, _ = run_batched(batch, event_repository.create, {"title": "Mới", "category": "Health"})
+    run_batched(batch, event_repository.update, existing, {"title": "Đổi", "category": "Health"})
+    second = PersistBatch()
+    run_batched(second, event_repository.update, existing, {"title": "Đổi lần hai"})
+    assert event_index.ids_by_category("Health") == {created, existing}
+
+    failed = commit_persist_batches([batch, second])
+    assert failed == {EVENTS_DATA_FILE: {created, existing}}
+    assert created not in data_manager.events_data
+    assert data_manager.events_data[existing]["title"] == "Cũ"
+    assert event_index.ids_by_category("Health") == set()
+    assert event_index.ids_by_category("Work") == {existing}
+
+
+def test_failed_commit_restores_deleted_record(monkeypatch):
+    existing, _ = event_repository.create({"title": "Giữ lại"})
+    monkeypatch.setattr(data_manager, "write_payload", _failing_write)
+    batch = PersistBatch()
+    assert run_batched(batch, event_repository.delete, existing) is not None
+    commit_persist_batches([batch])
+    assert data_manager.events_data[existing]["title"] == "Giữ lại"
+
+
+def test_older_snapshot_does_not_overwrite_newer(tmp_path):
+    file_path = str(tmp_path / "store.json")
+    old_payload, old_seq = encode_store(file_path, {"k": 1})
+    new_payload, new_seq = encode_store(file_path, {"k": 2})
+    assert write_payload(file_path, new_payload, new_seq)
+    assert write_payload(file_path, old_payload, old_seq)
+    assert load_data(file_path) == {"k": 2}
+
+
+def _tool_call(call_id, name, arguments):
+    return ChatCompletionMessageToolCall(id=call_id, type="function",
+                                         function={"name": name, "arguments": json.dumps(arguments)})
+
+
+def test_scheduler_reports_and_rolls_back_failed_turn(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "write_payload", _failing_write)
+    scheduler = scheduler_module.ToolScheduler(workers=0)
+    runs = asyncio.run(scheduler.run([
+        _tool_call("call_1", "add_note", {"title": "Mua sữa", "content": "2 hộp"}),
+        _tool_call("call_2", "add_note", {"title": "Gọi bà", "content": "Tối nay"}),
+    ], None))
+
+    assert [run.tool_call.id for run in runs] == ["call_1", "call_2"]
+    assert all("Thất bại khi lưu" in run.result for run in runs)
+    assert scheduler.metrics["commit_failures"] == 2
+    assert len(data_manager.notes_data) == 0
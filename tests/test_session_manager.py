@@ -0,0 +1,69 @@
+import asyncio
+import json
+import os
+
+from core.session_manager import SessionManager
+
+
+def _manager(tmp_path, **kwargs):
+    kwargs.setdefault("legacy_sessions_file", None)
+    kwargs.setdefault("shared", False)
+    return SessionManager(sessions_dir=str(tmp_path / "sessions"), **kwargs)
+
+
+def test_pinned_session_survives_lru_eviction(tmp_path):
+    manager = _manager(tmp_path, max_cached=2)
+    with manager.pinned("a"):
+        session = manager.get_session("a")
+        for other in ("b", "c", "d"):
+            manager.get_session(other)
+        assert manager.sessions.get("a") is session
+        # Thay đổi trực tiếp trên dict (như /chat) vẫn tới được bản được ghi
+        session["current_member"] = "m1"
+        manager.update_session("a", {"messages": [{"role": "user", "content": "xin chào"}]})
+    manager.get_session("e")
+    manager.get_session("f")
+    assert "a" not in manager.sessions
+    reloaded = manager.find_session("a")
+    assert reloaded["current_member"] == "m1"
+    assert len(reloaded["messages"]) == 1
+
+
+def test_sweep_skips_pinned_sessions(tmp_path):
+    manager = _manager(tmp_path, idle_ttl=-1, retention_days=0)
+    manager.get_session("a")
+    manager.get_session("b")
+    release = manager.pin("a")
+    assert manager.sweep()["expired"] == 1
+    assert "a" in manager.sessions and "b" not in manager.sessions
+    release()
+    release() # Gọi lại không nhả thêm lần nữa
+    assert not manager.is_pinned("a")
+    assert manager.sweep()["expired"] == 1
+
+
+def test_legacy_migration_waits_for_load_index(tmp_path):
+    legacy_file = tmp_path / "sessions_data.json"
+    legacy_file.write_text(json.dumps({"s1": {"messages": [], "current_member": "m1"}}), encoding="utf-8")
+    manager = _manager(tmp_path, legacy_sessions_file=str(legacy_file))
+    assert not os.path.exists(manager.index_file)
+    manager.load_index()
+    assert os.path.exists(manager.index_file)
+    assert manager.find_session("s1")["current_member"] == "m1"
+
+
+def test_dirty_session_is_evicted_by_flusher(tmp_path):
+    async def scenario():
+        manager = _manager(tmp_path, max_cached=1, flush_interval=3600)
+        await manager.start_flusher()
+        manager.get_session("a")
+        manager.update_session("a", {"current_member": "m1"})
+        manager.get_session("b")
+        # Không ghi đồng bộ khi đẩy khỏi cache: "a" chờ flusher
+        assert "a" in manager.sessions and not os.path.exists(manager._shard_path("a"))
+        await manager.flush()
+        assert "a" not in manager.sessions and "b" in manager.sessions
+        assert manager.find_session("a")["current_member"] == "m1"
+        await manager.stop_flusher()
+
+    asyncio.run(scenario())
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import database.data_manager as data_manager
+from database.data_manager import load_data, persist_change, refresh_if_changed, save_data
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _shared_mode(monkeypatch, file_path, data):
+    monkeypatch.setattr(data_manager, "MULTIPROCESS_STORAGE_ENABLED", True)
+    monkeypatch.setattr(data_manager, "JOURNAL_ACTIVE", False)
+    monkeypatch.setattr(data_manager, "_stores", lambda: {file_path: data})
+
+
+def test_persist_merges_changes_from_other_worker(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "notes.json")
+    data = {}
+    _shared_mode(monkeypatch, file_path, data)
+    data["a"] = {"v": 1}
+    assert persist_change(file_path, data, "a")
+
+    # Worker khác ghi thêm "b" và sửa "a" trên đĩa
+    save_data(file_path, {"a": {"v": 10}, "b": {"v": 2}})
+    data["c"] = {"v": 3}
+    assert persist_change(file_path, data, "c")
+    assert load_data(file_path) == {"a": {"v": 10}, "b": {"v": 2}, "c": {"v": 3}}
+    assert data == {"a": {"v": 10}, "b": {"v": 2}, "c": {"v": 3}}
+
+    # Key đang được lưu giữ giá trị trong bộ nhớ, các key khác lấy theo đĩa
+    save_data(file_path, {"a": {"v": 10}, "b": {"v": 20}, "c": {"v": 30}})
+    data["c"] = {"v": 300}
+    assert persist_change(file_path, data, "c")
+    assert load_data(file_path) == {"a": {"v": 10}, "b": {"v": 20}, "c": {"v": 300}}
+
+
+def test_refresh_picks_up_other_worker_writes(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "events.json")
+    data = {"a": {"v": 1}}
+    _shared_mode(monkeypatch, file_path, data)
+    assert persist_change(file_path, data, "a")
+    assert refresh_if_changed() == []
+
+    save_data(file_path, {"b": {"v": 2}})
+    assert refresh_if_changed() == [file_path]
+    assert data == {"b": {"v": 2}}
+
+
+def test_concurrent_processes_do_not_lose_writes(tmp_path):
+    file_path = str(tmp_path / "shared.json")
+    script = textwrap.dedent(f"""
+        import sys
+        import database.data_manager as data_manager
+        data_manager.MULTIPROCESS_STORAGE_ENABLED = True
+        data_manager.JOURNAL_ACTIVE = False
+        data = {{}}
+        for i in range(25):
+            key = f"{{sys.argv[1]}}-{{i}}"
+            data[key] = {{"i": i}}
+            assert data_manager.persist_change({file_path!r}, data, key)
+    """)
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT}
+    workers = [subprocess.Popen([sys.executable, "-c", script, name], env=env, cwd=REPO_ROOT)
+               for name in ("w1", "w2", "w3")]
+    assert [worker.wait(timeout=60) for worker in workers] == [0, 0, 0]
+    assert len(load_data(file_path)) == 75
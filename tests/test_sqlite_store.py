@@ -0,0 +1,133 @@
+import os
+
+import pytest
+
+from database.data_manager import PersistBatch, run_batched, commit_persist_batches
+from database.records import EventRecord
+from database.repositories import Repository
+from database.sqlite_store import SqliteDatabase
+
+
+def _events_table(db_path, cache_size=1024):
+    db = SqliteDatabase(str(db_path))
+    table = db.table("events", ["created_by", "date"], {"participants": lambda e: e.get("participants") or []},
+                     cache_size=cache_size, record_type=EventRecord)
+    return db, table
+
+
+def test_database_opens_lazily(tmp_path):
+    db_path = tmp_path / "lazy.db"
+    db, table = _events_table(db_path)
+    assert not db.is_open and not os.path.exists(db_path)
+    assert len(table) == 0
+    assert db.is_open and os.path.exists(db_path)
+    db.close()
+
+
+def test_persist_writes_record_evicted_from_cache(tmp_path):
+    db, table = _events_table(tmp_path / "evict.db", cache_size=2)
+    table["e1"] = EventRecord({"id": "e1", "title": "Họp", "date": "2024-01-01"})
+    record = table["e1"]
+    record["title"] = "Họp phụ huynh"
+    # Đọc các record khác đẩy e1 khỏi LRU trước khi caller gọi persist
+    for key in ("e2", "e3", "e4"):
+        table[key] = EventRecord({"id": key, "title": key})
+    assert "e1" not in table._live
+
+    assert table.persist("e1") is False
+    assert table.persist("e1", record) is True
+    table.invalidate_cache()
+    assert table["e1"]["title"] == "Họp phụ huynh"
+    db.close()
+
+
+def test_persist_deletes_missing_key_and_updates_indexes(tmp_path):
+    db, table = _events_table(tmp_path / "index.db")
+    table["e1"] = EventRecord({"id": "e1", "created_by": "m1", "participants": ["An", "Bình"]})
+    record = table["e1"]
+    record["participants"] = ["Chi"]
+    assert table.persist("e1", record)
+    assert list(table.select(participants="Chi")) == ["e1"]
+    assert table.select(participants="An") == {}
+
+    del table["e1"]
+    assert table.persist("e1")
+    assert table.select(created_by="m1") == {}
+    db.close()
+
+
+def test_changes_visible_to_second_connection(tmp_path):
+    db_a, table_a = _events_table(tmp_path / "shared.db")
+    db_b, table_b = _events_table(tmp_path / "shared.db")
+    table_a["e1"] = EventRecord({"id": "e1", "title": "A"})
+    assert table_b["e1"]["title"] == "A"
+
+    table_a["e1"] = EventRecord({"id": "e1", "title": "B"})
+    assert db_b.changed_tables() == ["events"]
+    assert table_b["e1"]["title"] == "B"
+    db_a.close()
+    db_b.close()
+
+
+def _count_transactions(monkeypatch, table):
+    commits = []
+    original = table._bump_version
+    monkeypatch.setattr(table, "_bump_version", lambda: commits.append(1) or original())
+    return commits
+
+
+def test_repository_writes_each_change_once(tmp_path, monkeypatch):
+    db, table = _events_table(tmp_path / "repo.db")
+    repository = Repository("events.json", table, EventRecord)
+    commits = _count_transactions(monkeypatch, table)
+    event_id, _ = repository.create({"title": "Họp", "created_by": "m1"})
+    assert repository.update(event_id, {"created_by": "m2"})["created_by"] == "m2"
+    assert list(table.select(created_by="m2")) == [event_id]
+    assert repository.delete(event_id)
+    assert commits == [1, 1, 1]
+    table.invalidate_cache()
+    assert event_id not in table
+    db.close()
+
+
+def test_batched_repository_changes_roll_back_together(tmp_path, monkeypatch):
+    db, table = _events_table(tmp_path / "batch.db")
+    repository = Repository("events.json", table, EventRecord)
+    kept_id, _ = repository.create({"title": "Có sẵn", "created_by": "m1"})
+    commits = _count_transactions(monkeypatch, table)
+
+    batch = PersistBatch()
+    new_id, _ = run_batched(batch, repository.create, {"title": "Mới", "created_by": "m1"})
+    run_batched(batch, repository.update, kept_id, {"title": "Đã sửa"})
+    # Chưa ghi row nào nhưng các lần đọc đã thấy thay đổi
+    assert commits == [] and set(table.select(created_by="m1")) == {kept_id, new_id}
+    monkeypatch.setattr(table, "_upsert", lambda key, value: (_ for _ in ()).throw(RuntimeError("disk full")))
+    assert commit_persist_batches([batch]) == {"events.json": {kept_id, new_id}}
+    monkeypatch.undo()
+
+    assert new_id not in table and table[kept_id]["title"] == "Có sẵn"
+    table.invalidate_cache()
+    assert list(table) == [kept_id] and table[kept_id]["title"] == "Có sẵn"
+
+    batch = PersistBatch()
+    run_batched(batch, repository.delete, kept_id)
+    run_batched(batch, repository.create, {"title": "Khác"})
+    assert commit_persist_batches([batch]) == {}
+    table.invalidate_cache()
+    assert len(table) == 1 and kept_id not in table
+    db.close()
+
+
+def test_clear_is_atomic(tmp_path, monkeypatch):
+    db, table = _events_table(tmp_path / "clear.db")
+    table["e1"] = EventRecord({"id": "e1", "participants": ["An"]})
+    monkeypatch.setattr(table, "_bump_version", lambda: (_ for _ in ()).throw(RuntimeError("disk full")))
+    with pytest.raises(RuntimeError):
+        table.clear()
+    monkeypatch.undo()
+    # Lỗi giữa chừng không để lại bảng chính đã xóa mà bảng index còn dữ liệu
+    table.invalidate_cache()
+    assert list(table) == ["e1"] and list(table.select(participants="An")) == ["e1"]
+    table.clear()
+    assert len(table) == 0 and table.select(participants="An") == {}
+    db.close()
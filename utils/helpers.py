@@ -8,11 +8,17 @@ import datetime
 import asyncio
 from typing import Dict, Any, List, Optional
 
-from openai import OpenAI
-
 from config.logging_config import logger
 from config.settings import openai_model, CHAT_HISTORY_FILE
-from database.data_manager import save_data, chat_history, family_data
+from database.data_manager import persist_change, chat_history, family_data
+from database.history_index import history_index
+from core.session_manager import session_manager
+from core.token_budget import token_counter, budget_manager
+from services.llm.client_pool import llm_clients
+
+# Tóm tắt trả về khi gọi LLM thất bại
+SUMMARY_ERROR = "[Lỗi tóm tắt]"
+
 
 async def generate_chat_summary(messages: List[Dict[str, Any]], api_key: str) -> str:
     """Tạo tóm tắt từ lịch sử trò chuyện (async wrapper)."""
@@ -37,49 +43,169 @@ async def generate_chat_summary(messages: List[Dict[str, Any]], api_key: str) ->
              conversation_text += f"{role.capitalize()}: {text_content.strip()}\n"
 
     if not conversation_text: return "Không có nội dung text để tóm tắt."
-
+    conversation_text = budget_manager.fit_input("chat_summary", conversation_text, keep_end=True)
 
     try:
-        client = OpenAI(api_key=api_key)
-        response = await asyncio.to_thread(
-             client.chat.completions.create,
+        client = llm_clients.get(api_key)
+        summary_messages = [
+            {"role": "system", "content": "Tóm tắt cuộc trò chuyện sau thành 1 câu ngắn gọn bằng tiếng Việt, nêu bật yêu cầu chính hoặc kết quả cuối cùng."},
+            {"role": "user", "content": conversation_text}
+        ]
+        estimated_prompt = token_counter.count_messages(summary_messages)
+        max_tokens = budget_manager.max_tokens("chat_summary", estimated_prompt)
+        response = await client.chat.completions.create(
              model=openai_model,
-             messages=[
-                 {"role": "system", "content": "Tóm tắt cuộc trò chuyện sau thành 1 câu ngắn gọn bằng tiếng Việt, nêu bật yêu cầu chính hoặc kết quả cuối cùng."},
-                 {"role": "user", "content": conversation_text}
-             ],
+             messages=summary_messages,
              temperature=0.2,
-             max_tokens=100
+             max_tokens=max_tokens
         )
+        budget_manager.record("chat_summary", estimated_prompt, response.usage, max_tokens)
         return response.choices[0].message.content.strip()
     except Exception as e:
         logger.error(f"Lỗi khi tạo tóm tắt chat: {e}", exc_info=True)
-        return "[Lỗi tóm tắt]"
+        return SUMMARY_ERROR
+
 
+def _history_end(entry: Dict[str, Any]) -> int:
+    """Vị trí cuối (trong transcript của session) mà entry lịch sử bao phủ."""
+    return int(entry.get("offset", 0)) + len(entry.get("messages") or [])
 
-def save_chat_history(member_id: str, messages: List[Dict[str, Any]], summary: Optional[str] = None, session_id: Optional[str] = None) -> None:
-    """Lưu lịch sử chat cho member_id."""
+
+def save_chat_history(member_id: str, messages: List[Dict[str, Any]], summary: Optional[str] = None, session_id: Optional[str] = None) -> bool:
+    """
+    Lưu lịch sử chat cho member_id. Mỗi entry chỉ chứa phần message mới kể từ lần lưu
+    trước của cùng session ("offset" là vị trí bắt đầu trong transcript của session);
+    transcript đầy đủ được dựng lại khi đọc bằng reconstruct_history_entry.
+    Returns False nếu entry đã thêm vào bộ nhớ nhưng ghi xuống đĩa thất bại
+    (gọi persist_chat_history để thử ghi lại).
+    """
     global chat_history
-    if not member_id: return
+    if not member_id: return True
 
     if member_id not in chat_history or not isinstance(chat_history[member_id], list):
         chat_history[member_id] = []
 
+    offset = 0
+    if session_id:
+        latest = history_index.session_entries(session_id, limit=1)
+        if latest:
+            previous_end = _history_end(latest[0][1])
+            # Session bị làm mới (ít message hơn lần lưu trước) thì lưu lại từ đầu
+            if previous_end <= len(messages):
+                offset = previous_end
+
     history_entry = {
         "timestamp": datetime.datetime.now().isoformat(),
-        "messages": messages,
+        "offset": offset,
+        "messages": messages[offset:],
         "summary": summary or "",
         "session_id": session_id
     }
 
-    chat_history[member_id].insert(0, history_entry)
+    entries = chat_history[member_id]
+    entries.insert(0, history_entry)
 
     max_history_per_member = 20
-    if len(chat_history[member_id]) > max_history_per_member:
-        chat_history[member_id] = chat_history[member_id][:max_history_per_member]
-
-    if not save_data(CHAT_HISTORY_FILE, chat_history):
+    rebased: Dict[str, List[Dict[str, Any]]] = {}
+    if len(entries) > max_history_per_member:
+        # Entry bị xoay vòng có thể là gốc của chuỗi delta: chuyển entry kế tiếp thành snapshot đầy đủ trước
+        rebased = _rebase_successors(entries[max_history_per_member:])
+        entries = chat_history[member_id] = entries[:max_history_per_member]
+    history_index.reindex_member(member_id, entries)
+
+    ok = persist_chat_history(member_id, entries)
+    for other_member_id, other_entries in rebased.items():
+        if other_member_id != member_id:
+            ok = persist_chat_history(other_member_id, other_entries) and ok
+    return ok
+
+
+def _rebase_successors(dropped: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    (Gọi trước khi bỏ `dropped` khỏi lịch sử) Với mỗi entry sắp bị bỏ, entry kế tiếp
+    trong chuỗi delta của session (của bất kỳ thành viên nào) nếu vẫn được giữ sẽ
+    được ghi lại thành snapshot đầy đủ (offset 0), để chuỗi không mất phần gốc.
+    Returns {member_id: entries} của các thành viên có entry đã được đổi.
+    """
+    dropped_ids = {id(entry) for entry in dropped}
+    changed: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in dropped:
+        session_id = entry.get("session_id")
+        if not session_id:
+            continue
+        items = history_index.session_entries(session_id) # Mới nhất trước
+        position = next((i for i, (_, candidate) in enumerate(items) if candidate is entry), None)
+        if position is None:
+            continue
+        end = _history_end(entry)
+        # Entry kế tiếp của chuỗi: entry cũ nhất trong các entry mới hơn bắt đầu đúng tại `end`
+        successor = next(((owner, candidate) for owner, candidate in reversed(items[:position])
+                          if int(candidate.get("offset", 0)) == end), None)
+        if successor is None or id(successor[1]) in dropped_ids:
+            continue # Không còn entry nào phụ thuộc, hoặc entry kế tiếp cũng bị bỏ (xử lý ở lượt của nó)
+        owner, candidate = successor
+        full = reconstruct_history_entry(owner, candidate)
+        if full.get("transcript_incomplete"):
+            continue
+        owner_entries = chat_history.get(owner)
+        if not isinstance(owner_entries, list):
+            continue
+        for stored in owner_entries:
+            if stored is candidate or (stored.get("timestamp") == candidate.get("timestamp")
+                                       and stored.get("session_id") == session_id):
+                stored["messages"] = full["messages"]
+                stored["offset"] = 0
+        candidate["messages"], candidate["offset"] = full["messages"], 0
+        changed[owner] = owner_entries
+    return changed
+
+
+def persist_chat_history(member_id: str, entries: Optional[List[Dict[str, Any]]] = None) -> bool:
+    """Ghi lịch sử chat (trong bộ nhớ, hoặc `entries` vừa sửa) của member_id xuống đĩa."""
+    if not persist_change(CHAT_HISTORY_FILE, chat_history, member_id, entries):
         logger.error(f"Lưu lịch sử chat cho member {member_id} thất bại.")
+        return False
+    return True
+
+
+def reconstruct_history_entry(member_id: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Trả về bản sao của entry với "messages" là transcript đầy đủ tới thời điểm đó.
+    Ghép các entry liền trước của cùng session (của mọi thành viên). Khi xoay vòng,
+    save_chat_history đã chuyển entry kế tiếp thành snapshot nên chuỗi luôn đủ gốc;
+    chỉ lịch sử ghi trước cơ chế đó mới phải lấy phần đầu từ log của session.
+    Entry định dạng cũ (snapshot đầy đủ, không có "offset") được trả nguyên.
+    """
+    result = dict(entry)
+    need = int(entry.get("offset", 0))
+    session_id = entry.get("session_id")
+    if need <= 0 or not session_id:
+        result["messages"] = list(entry.get("messages") or [])
+        return result
+
+    pieces = [entry.get("messages") or []]
+    after = (str(entry.get("timestamp", "")), member_id)
+    for _, older in history_index.session_entries(session_id, after=after):
+        if need <= 0:
+            break
+        if _history_end(older) != need:
+            continue # Entry trước lần session bị làm mới, không thuộc chuỗi này
+        pieces.append(older.get("messages") or [])
+        need = int(older.get("offset", 0))
+
+    transcript: List[Dict[str, Any]] = []
+    if need > 0:
+        session = session_manager.find_session(session_id)
+        session_messages = session.get("messages", []) if session else []
+        if len(session_messages) >= need:
+            transcript.extend(session_messages[:need])
+        else:
+            logger.warning(f"Không dựng lại được {need} message đầu của session {session_id} cho lịch sử.")
+            result["transcript_incomplete"] = True
+    for piece in reversed(pieces):
+        transcript.extend(piece)
+    result["messages"] = transcript
+    return result
 
 
 def generate_dynamic_suggested_questions(api_key: str, member_id: Optional[str] = None, max_questions: int = 5) -> List[str]:
@@ -151,18 +277,15 @@ def generate_dynamic_suggested_questions(api_key: str, member_id: Optional[str]
 
 
 def filter_events_by_member(member_id: Optional[str] = None) -> Dict[str, Any]:
-    """Lọc sự kiện theo thành viên (người tạo hoặc tham gia)."""
+    """Lọc sự kiện theo thành viên (người tạo hoặc tham gia), dùng event_index."""
     from database.data_manager import events_data
+    from database.event_index import event_index
     
     if not member_id: return events_data
 
-    filtered = {}
     member_name = family_data.get(member_id, {}).get("name") if member_id in family_data else None
 
-    for event_id, event in events_data.items():
-        is_creator = event.get("created_by") == member_id
-        is_participant = member_name and (member_name in event.get("participants", []))
-
-        if is_creator or is_participant:
-            filtered[event_id] = event
-    return filtered
\ No newline at end of file
+    event_ids = event_index.ids_by_creator(member_id)
+    if member_name:
+        event_ids |= event_index.ids_by_participant(member_name)
+    return {eid: events_data[eid] for eid in event_index.order_by_created(event_ids) if eid in events_data}